@@ -0,0 +1,110 @@
+"""
+Compare copy-based enrichment with the EnrichedOffer wrapper
+
+The previous pipeline rebuilt every offer twice through model_dump, once
+to attach nights_amount/google_maps_url and once to attach distance_m.
+Both paths are measured for one simulated 1000-offer request.
+
+Run with: python -m benchmarks.bench_enrichment
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.sample_payload import load_sample_payload, scale_payload
+from src.app.distance import haversine_distance
+from src.app.get_holiday_offers import add_calculated_fields, parse_offers_page
+from src.app.offers_distance_sorter import add_distance_to_offers
+from src.models.common import Coordinates
+from src.models.holiday_finder_api import Offer
+from src.models.holiday_finder_api_lean import LeanOffer
+from src.models.offer import generate_google_maps_url
+
+OFFER_COUNT = 1_000
+REPEATS = 5
+VIENNA = Coordinates(latitude=48.2082, longitude=16.3738)
+
+
+def make_copy_models(base):
+    class WithCalculatedFields(base):
+        nights_amount: int
+        google_maps_url: str
+
+    class WithDistance(WithCalculatedFields):
+        distance_m: float
+
+    return WithCalculatedFields, WithDistance
+
+
+COPY_MODELS = {Offer: make_copy_models(Offer), LeanOffer: make_copy_models(LeanOffer)}
+
+
+def copy_enrichment(offers):
+    # The previous implementation, kept here for comparison
+    with_calculated_fields, with_distance = COPY_MODELS[type(offers[0])]
+    enriched = [
+        with_calculated_fields(
+            **offer.model_dump(),
+            nights_amount=5,
+            google_maps_url=generate_google_maps_url(
+                offer.hotel.coordinates.latitude, offer.hotel.coordinates.longitude
+            ),
+        )
+        for offer in offers
+    ]
+    result = [
+        with_distance(
+            **offer.model_dump(),
+            distance_m=haversine_distance(
+                VIENNA.latitude,
+                VIENNA.longitude,
+                offer.hotel.coordinates.latitude,
+                offer.hotel.coordinates.longitude,
+            ),
+        )
+        for offer in enriched
+    ]
+    result.sort(key=lambda offer: offer.distance_m)
+    return result
+
+
+def wrapper_enrichment(offers):
+    enriched = [add_calculated_fields(offer) for offer in offers]
+    return add_distance_to_offers(enriched, VIENNA)
+
+
+def measure(function, offers) -> tuple[float, int, int]:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(offers)
+        timings.append(time.perf_counter() - start)
+
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = function(offers)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    retained_blocks = sys.getallocatedblocks() - blocks_before
+    del result
+    return min(timings), peak, retained_blocks
+
+
+def main():
+    raw = json.dumps(scale_payload(load_sample_payload(), OFFER_COUNT)).encode()
+    print(f"{'models':>6} {'path':>8} {'ms':>8} {'peak KiB':>9} {'blocks':>8}")
+    for lean in (False, True):
+        offers = parse_offers_page(raw, lean=lean).offers
+        for function in (copy_enrichment, wrapper_enrichment):
+            seconds, peak, blocks = measure(function, offers)
+            print(
+                f"{'lean' if lean else 'full':>6}"
+                f" {function.__name__.split('_')[0]:>8} {seconds * 1000:>8.2f}"
+                f" {peak // 1024:>9} {blocks:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
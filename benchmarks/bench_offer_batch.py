@@ -0,0 +1,95 @@
+"""
+Compare the per-offer distance loop with the vectorized OfferBatch path
+
+Run with: python -m benchmarks.bench_offer_batch
+"""
+
+import random
+import time
+from types import SimpleNamespace
+
+from src.app.distance import haversine_distance
+from src.app.offer_batch import OfferBatch
+from src.models.common import Coordinates
+
+SIZES = [1_000, 10_000, 100_000]
+LIMIT = 50
+REPEATS = 5
+ROME = Coordinates(latitude=41.8933, longitude=12.4829)
+
+
+def make_offers(count: int, seed: int = 0) -> list[SimpleNamespace]:
+    """
+    Lightweight stand-ins exposing the attributes OfferBatch reads from an offer
+    """
+    rng = random.Random(seed)
+    return [
+        SimpleNamespace(
+            hotel=SimpleNamespace(
+                coordinates=SimpleNamespace(
+                    latitude=ROME.latitude + rng.uniform(-0.1, 0.1),
+                    longitude=ROME.longitude + rng.uniform(-0.1, 0.1),
+                ),
+                rating=rng.randint(1, 5),
+            ),
+            offer=SimpleNamespace(price=rng.randint(200, 1500)),
+            nights_amount=rng.randint(2, 7),
+        )
+        for _ in range(count)
+    ]
+
+
+def scalar_path(offers: list[SimpleNamespace]) -> list[int]:
+    distances = [
+        haversine_distance(
+            ROME.latitude,
+            ROME.longitude,
+            offer.hotel.coordinates.latitude,
+            offer.hotel.coordinates.longitude,
+        )
+        for offer in offers
+    ]
+    return sorted(range(len(offers)), key=lambda i: distances[i])[:LIMIT]
+
+
+def batch_path(offers: list[SimpleNamespace]) -> list[int]:
+    batch = OfferBatch.from_offers(offers)
+    batch.compute_distances(ROME)
+    return batch.nearest(LIMIT).tolist()
+
+
+def batch_compute_path(batch: OfferBatch) -> list[int]:
+    batch.compute_distances(ROME)
+    return batch.nearest(LIMIT).tolist()
+
+
+def best_time(function, offers) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(offers)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    print(
+        f"{'offers':>8} {'scalar ms':>10} {'batch ms':>10} {'speedup':>8}"
+        f" {'compute ms':>11} {'speedup':>8}"
+    )
+    for size in SIZES:
+        offers = make_offers(size)
+        assert scalar_path(offers) == batch_path(offers)
+        scalar = best_time(scalar_path, offers)
+        batch = best_time(batch_path, offers)
+        # Distance and ordering alone, on a batch built once per response
+        compute = best_time(batch_compute_path, OfferBatch.from_offers(offers))
+        print(
+            f"{size:>8} {scalar * 1000:>10.2f} {batch * 1000:>10.2f}"
+            f" {scalar / batch:>7.1f}x {compute * 1000:>11.2f}"
+            f" {scalar / compute:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Compare parsing upstream pages inline with offloading them to worker processes
+
+A number of pages are parsed, filtered and enriched concurrently, the way
+concurrent requests would, while a ticker measures how long the event loop
+is blocked. Inline parsing blocks the loop for a whole page at a time.
+
+Run with:
+    python -m benchmarks.bench_offload
+    python -m benchmarks.bench_offload --workers 4 --pages 32 --size 1000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.sample_payload import scaled_payload_bytes
+from src.app.get_holiday_offers import (
+    add_calculated_fields,
+    destination_filter,
+    parse_offers_page,
+)
+from src.app.offload import OffloadPool
+from src.models.offer import OfferEngineOptions, OfferOptions
+
+OFFER_OPTIONS = OfferOptions(
+    engine=OfferEngineOptions(when={}, whereTxt=["Vienna"]),
+)
+TICK_SECONDS = 0.001
+
+
+async def inline_page(raw: bytes, keep):
+    page = parse_offers_page(raw, lean=True)
+    return [add_calculated_fields(offer) for offer in page.offers if keep(offer)]
+
+
+def offloaded(pool: OffloadPool):
+    async def offloaded_page(raw: bytes, keep):
+        page = await pool.parse_page(raw, keep)
+        return [add_calculated_fields(offer) for offer in page.offers]
+
+    return offloaded_page
+
+
+async def measure(parse, raw: bytes, pages: int, concurrency: int):
+    """
+    Parse pages with at most concurrency in flight
+    Returns pages per second and the longest event loop stall
+    """
+    keep = destination_filter(OFFER_OPTIONS)
+    semaphore = asyncio.Semaphore(concurrency)
+    longest_stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal longest_stall
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(TICK_SECONDS)
+            longest_stall = max(longest_stall, time.perf_counter() - start)
+
+    async def one_page():
+        async with semaphore:
+            return await parse(raw, keep)
+
+    ticking = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*[one_page() for _ in range(pages)])
+    seconds = time.perf_counter() - start
+    done = True
+    await ticking
+    return pages / seconds, longest_stall
+
+
+async def run(args):
+    raw = bytes(scaled_payload_bytes(args.size))
+    pool = OffloadPool(workers=args.workers)
+    pool.start()
+    try:
+        print(f"{'path':>10} {'pages/s':>9} {'max stall ms':>13}")
+        for name, parse in [("inline", inline_page), ("offload", offloaded(pool))]:
+            throughput, stall = await measure(parse, raw, args.pages, args.concurrency)
+            print(f"{name:>10} {throughput:>9.1f} {stall * 1000:>13.1f}")
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--size", type=int, default=1000, help="offers per page")
+    args = parser.parse_args()
+    print(f"{args.pages} pages of {args.size} offers, {args.workers} workers")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
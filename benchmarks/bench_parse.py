@@ -0,0 +1,70 @@
+"""
+Compare full and lean parsing of the upstream response
+
+Run with: python -m benchmarks.bench_parse
+"""
+
+import json
+import time
+import tracemalloc
+
+from benchmarks.sample_payload import (
+    load_sample_bytes,
+    load_sample_payload,
+    scale_payload,
+)
+from src.models.holiday_finder_api import ApiResponse
+from src.models.holiday_finder_api_lean import LeanApiResponse
+
+SIZES = [None, 1_000]
+REPEATS = 5
+
+
+def full_dict(raw: bytes):
+    # The previous path: decode, build a dict, then validate every model
+    return ApiResponse.model_validate(json.loads(raw.decode()))
+
+
+def full_json(raw: bytes):
+    return ApiResponse.model_validate_json(raw)
+
+
+def lean_json(raw: bytes):
+    return LeanApiResponse.model_validate_json(raw)
+
+
+def measure(function, raw: bytes) -> tuple[float, int]:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(raw)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = function(raw)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return min(timings), peak
+
+
+def main():
+    payload = load_sample_payload()
+    print(f"{'payload':>14} {'mode':>10} {'parse ms':>9} {'peak KiB':>9}")
+    for size in SIZES:
+        if size is None:
+            raw = load_sample_bytes()
+            label = f"sample {len(raw) // 1024}K"
+        else:
+            raw = json.dumps(scale_payload(payload, size)).encode()
+            label = f"{size} offers"
+        for function in (full_dict, full_json, lean_json):
+            seconds, peak = measure(function, raw)
+            print(
+                f"{label:>14} {function.__name__:>10} {seconds * 1000:>9.2f}"
+                f" {peak // 1024:>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure the per-request overhead of the rate limiter middleware
+
+The previous BaseHTTPMiddleware implementation is kept here for comparison.
+Requests are driven straight through the ASGI interface against an app that
+returns an empty response, so only middleware cost is measured.
+
+Run with: python -m benchmarks.bench_rate_limiter
+"""
+
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, Response
+
+from src.middleware.rate_limiter import (
+    MemoryRateLimitStore,
+    RateLimiterMiddleware,
+    RedisRateLimitStore,
+)
+
+REQUESTS = 20_000
+CLIENTS = 1_000
+
+
+class DequeRateLimiterMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, calls: int = 20, period: int = 60):
+        super().__init__(app)
+        self.calls = calls
+        self.period = period
+        self.clients = defaultdict(deque)
+
+    async def dispatch(self, request, call_next):
+        client_ip = request.client.host
+        now = time.time()
+        while (
+            self.clients[client_ip] and self.clients[client_ip][0] <= now - self.period
+        ):
+            self.clients[client_ip].popleft()
+        if len(self.clients[client_ip]) >= self.calls:
+            return JSONResponse(status_code=429, content={"detail": "Rate limit"})
+        self.clients[client_ip].append(now)
+        return await call_next(request)
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the Redis commands used by RedisRateLimitStore
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    async def expire(self, key, seconds):
+        return True
+
+
+async def empty_app(scope, receive, send):
+    await Response(b"")(scope, receive, send)
+
+
+async def drive(app) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/",
+            "raw_path": b"/",
+            "query_string": b"",
+            "headers": [],
+            "client": (f"10.0.{i % CLIENTS // 256}.{i % CLIENTS % 256}", 1234),
+            "server": ("test", 80),
+            "scheme": "http",
+            "http_version": "1.1",
+            "root_path": "",
+        }
+        await app(scope, receive, send)
+    return (time.perf_counter() - start) / REQUESTS
+
+
+def main():
+    apps = {
+        "no middleware": empty_app,
+        "deque + BaseHTTPMiddleware": DequeRateLimiterMiddleware(empty_app),
+        "ASGI + memory store": RateLimiterMiddleware(empty_app),
+        "ASGI + redis store": RateLimiterMiddleware(
+            empty_app, store=RedisRateLimitStore(LocalRedis())
+        ),
+    }
+    baseline = asyncio.run(drive(empty_app))
+    print(f"{'middleware':>28} {'us/request':>11} {'overhead us':>12}")
+    for name, app in apps.items():
+        seconds = asyncio.run(drive(app))
+        print(f"{name:>28} {seconds * 1e6:>11.1f} {(seconds - baseline) * 1e6:>12.1f}")
+
+    store = MemoryRateLimitStore()
+    asyncio.run(drive(RateLimiterMiddleware(empty_app, store=store)))
+    print(f"memory store keeps {len(store.clients)} clients as 3 integers each")
+
+
+if __name__ == "__main__":
+    main()
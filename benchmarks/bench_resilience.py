@@ -0,0 +1,148 @@
+"""
+Tail latency of upstream calls against a fake upstream injecting delays and errors
+
+The fake upstream answers most requests quickly, a few slowly and some with
+a 503. The same calls are made with no resilience, with retries, and with
+retries and hedging. A brownout, where the upstream stops answering, then
+shows the deadline and the circuit breaker turning hung calls into fast
+failures.
+
+Run with:
+    python -m benchmarks.bench_resilience
+    python -m benchmarks.bench_resilience --calls 2000 --slow 0.1 --errors 0.02
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from src.app.resilience import Resilience, UpstreamUnavailableError, request_deadline
+from src.app.upstream_client import UpstreamClient, is_retryable_error
+
+URL = "http://upstream.test/offers"
+FAST_SECONDS = 0.02
+SLOW_SECONDS = 0.5
+
+
+def fake_upstream(slow: float, errors: float, hang: bool = False, seed: int = 0):
+    """
+    Transport answering after a delay, slowly for a fraction slow of the
+    requests and with a 503 for a fraction errors of them
+    """
+    rand = random.Random(seed)
+    requests = [0]
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests[0] += 1
+        if hang:
+            await asyncio.sleep(3600)
+        draw = rand.random()
+        jitter = rand.uniform(0.8, 1.2)
+        await asyncio.sleep((SLOW_SECONDS if draw < slow else FAST_SECONDS) * jitter)
+        if rand.random() < errors:
+            return httpx.Response(503)
+        return httpx.Response(200, content=b"{}")
+
+    return httpx.MockTransport(handler), requests
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def measure(resilience: Resilience, args) -> dict:
+    transport, requests = fake_upstream(args.slow, args.errors)
+    client = UpstreamClient(resilience=resilience, transport=transport)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    failures = 0
+
+    async def one_call():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with request_deadline(args.deadline):
+                    await client.get_bytes(URL)
+            except (httpx.HTTPError, UpstreamUnavailableError):
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one_call() for _ in range(args.calls)])
+    await client.aclose()
+    return {
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "errors": failures / args.calls,
+        "requests": requests[0] / args.calls,
+    }
+
+
+async def brownout(args) -> None:
+    transport, requests = fake_upstream(0, 0, hang=True)
+    client = UpstreamClient(
+        resilience=Resilience("offers", is_retryable=is_retryable_error),
+        transport=transport,
+    )
+    print(f"\nbrownout, upstream never answers, {args.deadline:g}s deadline")
+    for i in range(8):
+        start = time.perf_counter()
+        try:
+            async with request_deadline(args.deadline):
+                await client.get_bytes(URL)
+        except UpstreamUnavailableError as e:
+            outcome = type(e).__name__
+        print(
+            f"call {i + 1}: {outcome:<22} after {(time.perf_counter() - start) * 1000:7.1f}ms"
+            f"  breaker {client.resilience.breaker.state}"
+        )
+    await client.aclose()
+
+
+async def run(args) -> None:
+    variants = {
+        "none": Resilience("offers", retries=0, hedge=False, failure_threshold=10**9),
+        "retries": Resilience(
+            "offers",
+            hedge=False,
+            failure_threshold=10**9,
+            is_retryable=is_retryable_error,
+        ),
+        "hedged": Resilience(
+            "offers", failure_threshold=10**9, is_retryable=is_retryable_error
+        ),
+    }
+    print(
+        f"{args.calls} calls, {args.slow:.0%} slow, {args.errors:.0%} errors,"
+        f" {args.concurrency} concurrent"
+    )
+    print(
+        f"{'variant':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'req/call':>9}"
+    )
+    for name, resilience in variants.items():
+        result = await measure(resilience, args)
+        print(
+            f"{name:>8} {result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f}"
+            f" {result['p99'] * 1000:>8.1f} {result['errors']:>7.1%}"
+            f" {result['requests']:>9.2f}"
+        )
+    await brownout(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow", type=float, default=0.05)
+    parser.add_argument("--errors", type=float, default=0.05)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
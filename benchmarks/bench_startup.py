@@ -0,0 +1,117 @@
+"""
+Measure cold start time, from spawning the interpreter to the first response
+
+Each run starts a fresh interpreter that imports the app, runs its lifespan
+startup and serves one /api/offers request in process. The upstream API
+answers with the sample response from curl-example.md and geocoding is
+stubbed, so runs are reproducible offline. Every run gets an empty geocode
+cache.
+
+Run with:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --warmup
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RUNS = 7
+
+CHILD = """
+import time
+interpreter_ready = time.time()
+
+import src.main
+imported = time.time()
+
+import asyncio
+import json
+import httpx
+from benchmarks.sample_payload import load_sample_bytes
+from src.app import geocode_cache, upstream_client
+from src.models.common import Coordinates
+
+body = load_sample_bytes()
+geocode_cache.geocode_address = lambda address, is_city=False: Coordinates(
+    latitude=48.2082, longitude=16.3738
+)
+client = upstream_client.get_upstream_client()
+client._client = httpx.AsyncClient(
+    transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+)
+
+
+async def serve_first_request():
+    global started
+    async with src.main.app.router.lifespan_context(src.main.app):
+        started = time.time()
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=src.main.app), base_url="http://bench"
+        ) as http:
+            response = await http.get("/api/offers?where-txt=Vienna")
+            assert response.status_code == 200, response.text
+            return time.time()
+
+
+first_response = asyncio.run(serve_first_request())
+print(json.dumps({
+    "interpreter_ready": interpreter_ready,
+    "imported": imported,
+    "started": started,
+    "first_response": first_response,
+}))
+"""
+
+
+def run_once(warmup: bool) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(REPO_ROOT),
+            "GEOCODE_CACHE_PATH": os.path.join(directory, "geocode.sqlite3"),
+            "WARMUP_ON_STARTUP": "1" if warmup else "0",
+        }
+        spawned = time.time()
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD],
+            cwd=REPO_ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    marks = json.loads(output.strip().splitlines()[-1])
+    return {
+        "interpreter": marks["interpreter_ready"] - spawned,
+        "import": marks["imported"] - marks["interpreter_ready"],
+        "startup": marks["started"] - marks["imported"],
+        "first_request": marks["first_response"] - marks["started"],
+        "total": marks["first_response"] - spawned,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument(
+        "--warmup", action="store_true", help="run with WARMUP_ON_STARTUP=1"
+    )
+    args = parser.parse_args()
+
+    runs = [run_once(args.warmup) for _ in range(args.runs)]
+    print(f"{'phase':>14} {'median ms':>10} {'min ms':>10}")
+    for phase in runs[0]:
+        values = [run[phase] * 1000 for run in runs]
+        print(f"{phase:>14} {statistics.median(values):>10.1f} {min(values):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare buffered and streaming ingestion of the upstream body
+
+The payload is read from a temporary file in 64KiB chunks, the way the
+upstream client hands over the response body, so the streaming path never
+holds the whole raw body.
+
+Run with: python -m benchmarks.bench_stream
+"""
+
+import asyncio
+import json
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from benchmarks.sample_payload import load_sample_payload, scale_payload
+from src.app.get_holiday_offers import parse_offers_page
+from src.app.offers_stream import parse_offers_stream
+
+SIZES = [1_000, 10_000]
+CHUNK_SIZE = 64 * 1024
+
+
+async def file_chunks(path: Path):
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def buffered(path: Path, keep):
+    chunks = [chunk async for chunk in file_chunks(path)]
+    page = parse_offers_page(b"".join(chunks), lean=True)
+    del chunks
+    page.offers = [offer for offer in page.offers if keep(offer)]
+    return page
+
+
+async def streaming(path: Path, keep):
+    return await parse_offers_stream(file_chunks(path), lean=True, keep=keep)
+
+
+def measure(function, path: Path, keep) -> tuple[float, int, int]:
+    start = time.perf_counter()
+    asyncio.run(function(path, keep))
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    page = asyncio.run(function(path, keep))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak, len(page.offers)
+
+
+def main():
+    payload = load_sample_payload()
+    print(f"{'offers':>7} {'kept':>5} {'path':>10} {'ms':>8} {'peak KiB':>9}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "offers.json"
+            path.write_text(json.dumps(scale_payload(payload, size)))
+            # Keep every offer, then about one in four as a destination filter would
+            for keep in (lambda offer: True, lambda offer: offer.offer.price < 1200):
+                for function in (buffered, streaming):
+                    seconds, peak, kept = measure(function, path, keep)
+                    print(
+                        f"{size:>7} {kept:>5} {function.__name__:>10}"
+                        f" {seconds * 1000:>8.1f} {peak // 1024:>9}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
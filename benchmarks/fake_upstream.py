@@ -0,0 +1,344 @@
+"""
+Local stand-in for the holidayfinder offers API and the Nominatim geocoder
+
+Offers are built from the sample response in curl-example.md, so they
+validate against ApiResponse, and are spread around the center of the
+requested destination over a configurable number of hotels. A destination
+asked for by an alias is answered under its English name, as upstream does.
+Pagination follows the limit and offset of the request. Every response is
+delayed by a log-normal latency and fails with a 503, or hangs, at
+configurable rates.
+
+Run with:
+    python -m benchmarks.fake_upstream --port 8100 --offers 400
+and point the API at it with:
+    UPSTREAM_BASE_URL=http://127.0.0.1:8100/api_no_auth/holiday_finder/offers
+    GEOCODER_DOMAIN=127.0.0.1:8100 GEOCODER_SCHEME=http
+"""
+
+import argparse
+import asyncio
+import copy
+import csv
+import json
+import math
+import random
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import orjson
+
+from benchmarks.sample_payload import load_sample_payload
+from src.app.gazetteer import GAZETTEER_SOURCE_PATH, get_gazetteer, normalize_name
+
+OFFERS_PATH = "/api_no_auth/holiday_finder/offers"
+GEOCODER_PATH = "/search"
+DEEPLINK_URL = "http://www.holidayfinder.co.il/holidayfinder/product/#/hfoffer---"
+# Generated offer lists kept, keyed by destination, start date and nights
+MAX_CACHED_DESTINATIONS = 64
+# Hotels are spread over about 5km around the destination center
+HOTEL_SPREAD_DEGREES = 0.045
+
+
+@dataclass
+class FakeUpstreamConfig:
+    # Offers available for every destination, across all pages
+    offers: int = 400
+    hotels: int = 120
+    latency_median_ms: float = 80
+    latency_p99_ms: float = 600
+    error_rate: float = 0.0
+    hang_rate: float = 0.0
+    hang_seconds: float = 60
+    geocode_latency_ms: float = 30
+    geocode_error_rate: float = 0.0
+    seed: int = 0
+
+
+def stable_hash(text: str) -> int:
+    return zlib.crc32(text.lower().encode())
+
+
+@lru_cache(maxsize=1)
+def canonical_names() -> Dict[str, str]:
+    """
+    English name of each destination in the gazetteer source, by its names
+    and aliases
+    """
+    names = {}
+    with open(GAZETTEER_SOURCE_PATH, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            for name in [row["name_en"], *filter(None, row["aliases"].split("|"))]:
+                names[normalize_name(name)] = row["name_en"]
+    return names
+
+
+def canonical_name(name: str) -> str:
+    """
+    The name the upstream gives a destination, whatever alias it was asked by
+    """
+    return canonical_names().get(normalize_name(name), name)
+
+
+def place_center(name: str) -> Tuple[int, float, float]:
+    """
+    Destination id and center of a place, from the gazetteer when it knows it
+    """
+    digest = stable_hash(name)
+    destination = get_gazetteer().lookup(name)
+    if destination is None:
+        return 100_000 + digest % 100_000, digest % 120 - 60.0, digest % 340 - 170.0
+    destination_id = destination.destination_id
+    if destination_id is None:
+        destination_id = 100_000 + digest % 100_000
+    return destination_id, destination.latitude, destination.longitude
+
+
+class FakeUpstream:
+    """
+    ASGI app serving the offers API and the geocoder
+    """
+
+    def __init__(self, config: FakeUpstreamConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        payload = load_sample_payload()
+        self.templates = payload["data"]["offers"]
+        rest = {
+            key: value
+            for key, value in payload["data"].items()
+            if key not in ("pagination", "offers")
+        }
+        self.data_tail = orjson.dumps(rest)[1:-1]
+        self.pagination_template = payload["data"]["pagination"]
+        self._offers: "OrderedDict[tuple, List[bytes]]" = OrderedDict()
+        self.requests = 0
+
+    def latency(self, median_ms: float, p99_ms: float) -> float:
+        # 2.326 is the 99th percentile of the standard normal distribution
+        sigma = math.log(max(p99_ms, median_ms) / median_ms) / 2.326 if median_ms else 0
+        return median_ms / 1000 * math.exp(sigma * self.random.gauss(0, 1))
+
+    def build_offers(
+        self, destination: str, start: str, nights: Tuple[int, ...], budget: dict
+    ) -> List[bytes]:
+        destination = canonical_name(destination)
+        key = (destination.lower(), start, nights, budget["min"], budget["max"])
+        offers = self._offers.get(key)
+        if offers is not None:
+            self._offers.move_to_end(key)
+            return offers
+
+        config = self.config
+        destination_id, latitude, longitude = place_center(destination)
+        rand = random.Random(stable_hash(destination) ^ config.seed)
+        hotels = [
+            (
+                latitude + rand.uniform(-1, 1) * HOTEL_SPREAD_DEGREES,
+                longitude
+                + rand.uniform(-1, 1)
+                * HOTEL_SPREAD_DEGREES
+                / max(math.cos(math.radians(latitude)), 0.1),
+            )
+            for _ in range(max(config.hotels, 1))
+        ]
+        try:
+            start_date = datetime.strptime(start, "%d/%m/%Y")
+        except ValueError:
+            start_date = datetime(2025, 10, 25)
+
+        offers = []
+        for i in range(config.offers):
+            offer = copy.deepcopy(self.templates[i % len(self.templates)])
+            hotel_index = i % len(hotels)
+            outbound = start_date + timedelta(days=i % 7)
+            inbound = outbound + timedelta(days=nights[i % len(nights)])
+            hf_offer_id = f"m4d{destination_id}h{hotel_index}o{i}"
+
+            destination_data = offer["destinationData"]
+            destination_data["destinationId"] = destination_id
+            destination_data["name_en"] = destination
+            destination_data["name"] = destination
+            destination_data["coordinates"] = {
+                "latitude": str(latitude),
+                "longitude": str(longitude),
+            }
+            offer["offer"]["hfOfferId"] = hf_offer_id
+            offer["offer"]["outboundDate"] = outbound.strftime("%d/%m/%Y")
+            offer["offer"]["inboundDate"] = inbound.strftime("%d/%m/%Y")
+            offer["offer"]["price"] = rand.randint(budget["min"], budget["max"])
+            offer["offer"]["packageDeeplinkUrl"] = f"{DEEPLINK_URL}{hf_offer_id}"
+            offer["hotel"]["name"] = f"{offer['hotel']['name']} {hotel_index}"
+            offer["hotel"]["provider_hotel_id"] = f"{destination_id}-{hotel_index}"
+            offer["hotel"]["coordinates"] = {
+                "latitude": hotels[hotel_index][0],
+                "longitude": hotels[hotel_index][1],
+            }
+            offers.append(orjson.dumps(offer))
+
+        self._offers[key] = offers
+        while len(self._offers) > MAX_CACHED_DESTINATIONS:
+            self._offers.popitem(last=False)
+        return offers
+
+    def offers_page(self, query: dict) -> bytes:
+        data = json.loads(query.get("data", ["{}"])[0])
+        engine = data.get("engine", {})
+        where_txt = engine.get("whereTxt") or ["Rome"]
+        flexible = engine.get("when", {}).get("flexible", {})
+        nights = tuple(flexible.get("nights") or [3])
+        budget = engine.get("budget") or {"min": 0, "max": 1000}
+        offers = self.build_offers(
+            where_txt[0], flexible.get("start", ""), nights, budget
+        )
+
+        limit = max(int(data.get("limit", 100)), 1)
+        offset = max(int(data.get("offset", 0)), 0)
+        pagination = dict(
+            self.pagination_template,
+            total_offers_count=len(offers),
+            total_offers_pages=max(math.ceil(len(offers) / limit), 1),
+            current_offers_page=offset // limit + 1,
+            limit=limit,
+            offset=offset,
+        )
+        return b"".join(
+            [
+                b'{"data":{"pagination":',
+                orjson.dumps(pagination),
+                b',"offers":[',
+                b",".join(offers[offset : offset + limit]),
+                b"],",
+                self.data_tail,
+                b'},"success":true}',
+            ]
+        )
+
+    def geocode(self, query: dict) -> bytes:
+        address = (query.get("city") or query.get("q") or [""])[0]
+        if not address or "nowhere" in address.lower():
+            return b"[]"
+        center = None
+        for word in [address, *address.replace(",", " ").split()]:
+            destination = get_gazetteer().lookup(word)
+            if destination is not None:
+                center = destination
+                break
+        latitude, longitude = (
+            (center.latitude, center.longitude)
+            if center is not None
+            else (48.2082, 16.3738)
+        )
+        if "city" not in query:
+            # Addresses land within a few km of their city center
+            digest = stable_hash(address)
+            latitude += (digest % 1000 / 1000 - 0.5) * 0.05
+            longitude += (digest // 1000 % 1000 / 1000 - 0.5) * 0.05
+        return orjson.dumps(
+            [
+                {
+                    "place_id": stable_hash(address),
+                    "lat": str(latitude),
+                    "lon": str(longitude),
+                    "display_name": address,
+                    "type": "city" if "city" in query else "house",
+                }
+            ]
+        )
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await receive()
+            await send({"type": "lifespan.startup.complete"})
+            await receive()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+        self.requests += 1
+        config = self.config
+        path = scope["path"].rstrip("/")
+        query = parse_qs(scope["query_string"].decode())
+        status, body = 404, b'{"detail":"Not Found"}'
+        if scope["method"] == "HEAD":
+            status, body = 200, b""
+        elif path == OFFERS_PATH:
+            await asyncio.sleep(
+                self.latency(config.latency_median_ms, config.latency_p99_ms)
+            )
+            if self.random.random() < config.hang_rate:
+                await asyncio.sleep(config.hang_seconds)
+            if self.random.random() < config.error_rate:
+                status, body = 503, b'{"detail":"Service Unavailable"}'
+            else:
+                status, body = 200, self.offers_page(query)
+        elif path == GEOCODER_PATH:
+            await asyncio.sleep(
+                self.latency(config.geocode_latency_ms, config.geocode_latency_ms * 3)
+            )
+            if self.random.random() < config.geocode_error_rate:
+                status, body = 503, b"[]"
+            else:
+                status, body = 200, self.geocode(query)
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add an option for every FakeUpstreamConfig field
+    """
+    for name, default in vars(FakeUpstreamConfig()).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(default), default=default
+        )
+
+
+def config_from_arguments(args: argparse.Namespace) -> FakeUpstreamConfig:
+    return FakeUpstreamConfig(
+        **{name: getattr(args, name) for name in vars(FakeUpstreamConfig())}
+    )
+
+
+def config_arguments(config: FakeUpstreamConfig) -> List[str]:
+    """
+    Command line options reproducing config
+    """
+    arguments = []
+    for name, value in vars(config).items():
+        arguments += [f"--{name.replace('_', '-')}", str(value)]
+    return arguments
+
+
+def main(argv: Optional[List[str]] = None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    uvicorn.run(
+        FakeUpstream(config_from_arguments(args)),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
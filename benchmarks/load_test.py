@@ -0,0 +1,266 @@
+"""
+End-to-end load test of the API against the local fake upstream
+
+Starts benchmarks/fake_upstream.py and the API under uvicorn, middlewares
+included, as separate processes, then drives GET /api/offers at each
+concurrency level for a fixed duration. Queries are drawn from a fixed set
+of distinct searches, so the offers and geocode caches see a realistic mix
+of hits and misses. Reports throughput, latency percentiles, error rate and
+the peak RSS of the API process.
+
+Run with:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --concurrency 1,8,32 --duration 20 --offers 1000
+    python -m benchmarks.load_test --error-rate 0.05 --json results.json
+
+The load generator, the fake upstream and the API share the machine, run it
+on a host with more CPUs than the API is given to size instances.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_upstream import (
+    OFFERS_PATH,
+    FakeUpstreamConfig,
+    add_config_arguments,
+    config_arguments,
+    config_from_arguments,
+)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DESTINATIONS = ["Vienna", "Prague", "Rome", "Paris", "Budapest", "Athens"]
+ADDRESSES = ["Stephansplatz", "Old Town Square", "Colosseum", "Louvre", None]
+RSS_SAMPLE_SECONDS = 0.1
+STARTUP_TIMEOUT_SECONDS = 30
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """
+    Resident set size of a process, None where /proc is not available
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def build_queries(count: int, seed: int) -> List[Dict[str, object]]:
+    """
+    Distinct searches, each for one destination, near a landmark or its center
+    """
+    rand = random.Random(seed)
+    queries = []
+    for i in range(count):
+        destination = DESTINATIONS[i % len(DESTINATIONS)]
+        address = rand.choice(ADDRESSES)
+        query: Dict[str, object] = {
+            "where-txt": destination,
+            "start-date": f"{1 + i // len(DESTINATIONS) % 28:02d}/11/2026",
+            "end-date": "30/11/2026",
+            "budget-max": rand.choice([800, 1000, 1500]),
+            "limit": 50,
+        }
+        if address is not None:
+            query["comparison-address"] = f"{address}, {destination}"
+        queries.append(query)
+    return queries
+
+
+async def wait_until_listening(port: int, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on port {port}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def drive(
+    url: str,
+    queries: List[Dict[str, object]],
+    concurrency: int,
+    duration: float,
+    pid: int,
+    seed: int,
+) -> dict:
+    """
+    Send requests from concurrency workers for duration seconds
+    """
+    rand = random.Random(seed)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    peak_rss = rss_bytes(pid) or 0
+    stop_at = time.monotonic() + duration
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while time.monotonic() < stop_at:
+            peak_rss = max(peak_rss, rss_bytes(pid) or 0)
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+    async def worker(http: httpx.AsyncClient):
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                response = await http.get(url, params=rand.choice(queries))
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        started = time.perf_counter()
+        await asyncio.gather(sample_rss(), *[worker(http) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "error_rate": 1 - statuses.get(200, 0) / len(latencies),
+        "statuses": statuses,
+        "peak_rss_mib": peak_rss / 2**20,
+    }
+
+
+async def run(args, config: FakeUpstreamConfig) -> List[dict]:
+    upstream_port, api_port = free_port(), free_port()
+    processes = []
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "PYTHONPATH": str(REPO_ROOT),
+            "UPSTREAM_BASE_URL": f"http://127.0.0.1:{upstream_port}{OFFERS_PATH}",
+            "GEOCODER_DOMAIN": f"127.0.0.1:{upstream_port}",
+            "GEOCODER_SCHEME": "http",
+            "GEOCODE_CACHE_PATH": os.path.join(directory, "geocode.sqlite3"),
+            "RATE_LIMIT_CALLS": str(10**9),
+            **dict(setting.split("=", 1) for setting in args.env),
+        }
+        try:
+            upstream = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.fake_upstream",
+                    "--port",
+                    str(upstream_port),
+                    *config_arguments(config),
+                ],
+                env=env,
+            )
+            processes.append(upstream)
+            api = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "uvicorn",
+                    "src.main:app",
+                    "--port",
+                    str(api_port),
+                    "--log-level",
+                    "warning",
+                ],
+                env=env,
+                # The API prints every request's parameters
+                stdout=subprocess.DEVNULL,
+            )
+            processes.append(api)
+            await wait_until_listening(upstream_port, upstream)
+            await wait_until_listening(api_port, api)
+            print(f"API started, RSS {(rss_bytes(api.pid) or 0) / 2**20:.0f}MiB")
+
+            url = f"http://127.0.0.1:{api_port}/api/offers"
+            queries = build_queries(args.queries, args.seed)
+            results = []
+            print(
+                f"{'conc':>5} {'reqs':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}"
+                f" {'p99 ms':>8} {'errors':>7} {'RSS MiB':>8}"
+            )
+            for concurrency in args.concurrency:
+                result = await drive(
+                    url, queries, concurrency, args.duration, api.pid, args.seed
+                )
+                results.append(result)
+                print(
+                    f"{concurrency:>5} {result['requests']:>6}"
+                    f" {result['throughput']:>7.1f} {result['p50_ms']:>8.1f}"
+                    f" {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}"
+                    f" {result['error_rate']:>7.1%} {result['peak_rss_mib']:>8.0f}"
+                )
+            return results
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 4, 16, 32],
+        help="comma separated concurrency levels",
+    )
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--queries", type=int, default=40, help="distinct searches")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="extra environment for the API, e.g. UPSTREAM_PAGE_SIZE=100",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    config = config_from_arguments(args)
+
+    results = asyncio.run(run(args, config))
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump({"upstream": vars(config), "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
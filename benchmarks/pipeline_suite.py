@@ -0,0 +1,204 @@
+"""
+Per-stage benchmark of the offers pipeline on synthetically scaled payloads
+
+The bundled sample response from curl-example.md is scaled to each size,
+then every stage of the pipeline is timed and its peak traced memory is
+measured separately. A JSON report can be written and compared with the
+report of another commit.
+
+Run with:
+    python -m benchmarks.pipeline_suite --output report.json
+    python -m benchmarks.pipeline_suite --compare baseline.json --fail-on-regression
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.sample_payload import scaled_payload_bytes
+from src.app.get_holiday_offers import (
+    add_calculated_fields,
+    destination_filter,
+    parse_offers_page,
+)
+from src.app.pareto import rank_offers_pareto
+from src.app.response_encoding import compress, encode_json
+from src.app.offer_batch import OfferBatch
+from src.models.common import Coordinates
+from src.models.holiday_finder_api import ApiResponse
+from src.models.offer import OfferEngineOptions, OfferOptions
+from src.routes.offers import serialize_offer
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# Building the full dict tree of larger payloads takes several GiB
+DEFAULT_FULL_PARSE_MAX = 10_000
+TOP_K = 50
+VIENNA = Coordinates(latitude=48.2082, longitude=16.3738)
+OFFER_OPTIONS = OfferOptions(
+    engine=OfferEngineOptions(when={}, whereTxt=["Vienna"]),
+)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(function: Callable[[], Any], repeats: int) -> Tuple[Dict[str, float], Any]:
+    """
+    Best wall time over repeats, and peak traced memory of one more run
+    Returns the measurement and the result of the last run
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": min(timings), "peak_bytes": peak}, result
+
+
+def run_size(size: int, full_parse_max: int) -> List[Dict[str, Any]]:
+    repeats = max(1, min(5, 10_000 // size))
+    raw = scaled_payload_bytes(size)
+    results = []
+
+    def record(stage: str, function: Callable[[], Any]) -> Any:
+        measurement, result = measure(function, repeats)
+        results.append({"stage": stage, "offers": size, **measurement})
+        print(
+            f"{size:>8} {stage:>22} {measurement['seconds'] * 1000:>10.2f}"
+            f" {measurement['peak_bytes'] // 1024:>10}",
+            flush=True,
+        )
+        return result
+
+    if size <= full_parse_max:
+        record(
+            "parse_full",
+            lambda: ApiResponse.model_validate(json.loads(bytes(raw).decode())),
+        )
+    offers = record("parse_lean", lambda: parse_offers_page(raw, lean=True)).offers
+    del raw
+
+    keep = destination_filter(OFFER_OPTIONS)
+    kept = record("destination_filter", lambda: [o for o in offers if keep(o)])
+    enriched = record(
+        "add_calculated_fields", lambda: [add_calculated_fields(o) for o in kept]
+    )
+
+    def distances() -> OfferBatch:
+        batch = OfferBatch.from_offers(enriched)
+        batch.compute_distances(VIENNA)
+        return batch
+
+    batch = record("distance", distances)
+    order = record("sort", lambda: batch.nearest())
+    record("sort_top_k", lambda: batch.nearest(TOP_K))
+
+    ordered = []
+    for i in order:
+        offer = enriched[i]
+        offer.distance_m = float(batch.distance_m[i])
+        ordered.append(offer)
+    # What the route does for every row it returns
+    body = record(
+        "serialize",
+        lambda: encode_json([serialize_offer(offer) for offer in ordered]),
+    )
+    # Sets pareto_front on the rows, so it runs after they are serialized
+    record("pareto_fronts", lambda: rank_offers_pareto(ordered, fronts=3))
+    compressed = record("compress_gzip", lambda: compress(body, "gzip"))
+    print(
+        f"{size:>8} {'body KiB':>22} {len(body) // 1024:>10} {len(compressed) // 1024:>10}"
+    )
+    return results
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float
+) -> int:
+    """
+    Print time and memory ratios against a baseline report
+    Returns the number of stages slower than threshold times the baseline
+    """
+    baseline_results = {
+        (result["stage"], result["offers"]): result for result in baseline["results"]
+    }
+    print(f"\nCompared with {baseline['meta'].get('revision') or 'baseline'}:")
+    print(f"{'offers':>8} {'stage':>22} {'time':>8} {'memory':>8}")
+    regressions = 0
+    for result in results:
+        previous = baseline_results.get((result["stage"], result["offers"]))
+        if previous is None:
+            continue
+        time_ratio = result["seconds"] / max(previous["seconds"], 1e-9)
+        memory_ratio = result["peak_bytes"] / max(previous["peak_bytes"], 1)
+        regressed = time_ratio > threshold or memory_ratio > threshold
+        regressions += regressed
+        print(
+            f"{result['offers']:>8} {result['stage']:>22} {time_ratio:>7.2f}x"
+            f" {memory_ratio:>7.2f}x{'  REGRESSION' if regressed else ''}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument(
+        "--full-parse-max",
+        type=int,
+        default=DEFAULT_FULL_PARSE_MAX,
+        help="largest size for which the full ApiResponse parse is measured",
+    )
+    parser.add_argument("--output", help="write a JSON report to this path")
+    parser.add_argument("--compare", help="JSON report to compare the results with")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'offers':>8} {'stage':>22} {'ms':>10} {'peak KiB':>10}")
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, args.full_parse_max))
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Helpers for the holidayfinder response bundled in curl-example.md
+"""
+
+import copy
+import json
+from pathlib import Path
+
+CURL_EXAMPLE_PATH = Path(__file__).resolve().parent.parent / "curl-example.md"
+
+
+def load_sample_bytes() -> bytes:
+    """
+    Extract the raw example response body from curl-example.md
+    """
+    text = CURL_EXAMPLE_PATH.read_text(encoding="utf-8")
+    return text[text.index('{"data"') :].strip().encode()
+
+
+def load_sample_payload() -> dict:
+    return json.loads(load_sample_bytes())
+
+
+def scale_payload(payload: dict, offer_count: int) -> dict:
+    """
+    Repeat the sample offers until the payload holds offer_count offers
+    Each copy gets a unique offer id so de-duplication does not collapse it
+    """
+    sample_offers = payload["data"]["offers"]
+    offers = []
+    for i in range(offer_count):
+        offer = copy.deepcopy(sample_offers[i % len(sample_offers)])
+        offer["offer"]["hfOfferId"] = f"{offer['offer']['hfOfferId']}-{i}"
+        offers.append(offer)
+
+    scaled = dict(payload)
+    scaled["data"] = dict(payload["data"])
+    scaled["data"]["offers"] = offers
+    scaled["data"]["pagination"] = dict(
+        payload["data"]["pagination"],
+        total_offers_count=offer_count,
+        total_offers_pages=1,
+        limit=offer_count,
+    )
+    return scaled
+
+
+def scaled_payload_bytes(
+    offer_count: int, other_destination_share: float = 0.5
+) -> bytearray:
+    """
+    Build a raw response body holding offer_count offers without building
+    them as Python objects, so very large payloads stay affordable
+    About other_destination_share of the offers are moved to another
+    destination, for the destination filter to drop
+    """
+    payload = load_sample_payload()
+    templates = []
+    for offer in payload["data"]["offers"]:
+        for other_destination in (False, True):
+            variant = copy.deepcopy(offer)
+            if other_destination:
+                variant["destinationData"]["name_en"] = "Salzburg"
+                variant["destinationData"]["destinationId"] = -1
+            # The offer id is the last key, so copies only differ in their tail
+            hf_offer_id = variant["offer"].pop("hfOfferId")
+            variant["offer"]["hfOfferId"] = hf_offer_id
+            body = json.dumps(variant, separators=(",", ":")).encode()
+            marker = f'"hfOfferId":"{hf_offer_id}'.encode()
+            head, tail = body.split(marker, 1)
+            templates.append((head + marker, tail))
+
+    other_every = round(1 / other_destination_share) if other_destination_share else 0
+    pagination = dict(
+        payload["data"]["pagination"],
+        total_offers_count=offer_count,
+        total_offers_pages=1,
+        limit=offer_count,
+    )
+    body = bytearray(b'{"data":{"pagination":')
+    body += json.dumps(pagination, separators=(",", ":")).encode()
+    body += b',"offers":['
+    for i in range(offer_count):
+        other_destination = other_every and i % other_every == other_every - 1
+        head, tail = templates[
+            (i % (len(templates) // 2)) * 2 + bool(other_destination)
+        ]
+        if i:
+            body += b","
+        body += head
+        body += f"-{i}".encode()
+        body += tail
+    body += b"]}}"
+    return body
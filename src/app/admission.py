@@ -0,0 +1,280 @@
+"""
+Admission control of offer searches by estimated cost
+
+Before a search runs, its memory and the number of offers it will parse and
+process are estimated from the offers cache: a cached search only costs its
+processing, while one that goes upstream also holds raw pages and freshly
+validated offers. Searches are admitted while the total estimated cost of
+those in flight fits the budgets. Others wait in a bounded first in, first
+out queue for a bounded time, and are otherwise rejected with a 503, so an
+overloaded instance slows down instead of running out of memory.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from src.app.get_holiday_offers import (
+    LEAN_PARSE,
+    MAX_PAGES,
+    MAX_PARALLEL_PAGES,
+    PAGE_SIZE,
+    holiday_offers_cache_key,
+)
+from src.app.metrics import (
+    ADMISSION_EVENTS,
+    ADMISSION_STATE,
+    increment,
+    set_gauge,
+    timed,
+)
+from src.app.offers_cache import (
+    LEAN_OFFER_SIZE_ESTIMATE,
+    OFFER_SIZE_ESTIMATE,
+    OffersCache,
+    get_offers_cache,
+)
+from src.app.resilience import time_remaining
+from src.models.offer import OfferOptions
+
+ADMISSION_ENABLED = os.environ.get("ADMISSION_ENABLED", "1") != "0"
+# Left for in-flight requests on a 512Mi instance, after the baseline and the caches
+ADMISSION_MEMORY_BUDGET_BYTES = int(
+    os.environ.get("ADMISSION_MEMORY_BUDGET_BYTES", 192 * 1024 * 1024)
+)
+# Offers parsed and processed at once, a proxy for CPU time on a single CPU
+ADMISSION_OFFERS_BUDGET = int(os.environ.get("ADMISSION_OFFERS_BUDGET", 20_000))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", 32))
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", 5))
+
+# Measured on the sample payload: raw JSON of an offer, and the enriched
+# offer with its response row
+RAW_OFFER_BYTES = 9_000
+PROCESSED_OFFER_BYTES = 1_000
+# Offers a search is assumed to return until cached searches tell otherwise
+INITIAL_EXPECTED_OFFERS = PAGE_SIZE
+EXPECTED_OFFERS_SMOOTHING = 0.1
+
+
+class Cost(NamedTuple):
+    memory_bytes: int
+    offers: int
+    # Cache keys of the upstream fetches the estimate assumed
+    fetches: Tuple[str, ...] = ()
+
+
+class OverloadedError(Exception):
+    """
+    A request was not admitted, retry_after suggests when to try again
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admits requests while the estimated cost of those in flight fits the
+    memory and offers budgets, queueing the others first in, first out
+    A request costing more than a budget is admitted alone
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = ADMISSION_MEMORY_BUDGET_BYTES,
+        offers_budget: int = ADMISSION_OFFERS_BUDGET,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT_SECONDS,
+        enabled: bool = ADMISSION_ENABLED,
+        cache: Optional[OffersCache] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.memory_budget = memory_budget
+        self.offers_budget = offers_budget
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._cache = cache
+        self.clock = clock
+        self.memory_in_flight = 0
+        self.offers_in_flight = 0
+        self.expected_offers = float(INITIAL_EXPECTED_OFFERS)
+        # Smoothed time requests stay admitted, to suggest a retry delay
+        self.average_hold = 1.0
+        self._waiters: Deque[Tuple[Cost, asyncio.Future]] = deque()
+
+    @property
+    def cache(self) -> OffersCache:
+        return self._cache if self._cache is not None else get_offers_cache()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def estimate(
+        self, offer_options: Iterable[OfferOptions], lean: bool = LEAN_PARSE
+    ) -> Cost:
+        """
+        Estimate the cost of searching the given destinations
+        Destinations sharing an upstream query share its fetch, but are each
+        processed
+        Uncached destinations are sized by expected_offers, which the fetches
+        update once they complete
+        """
+        parsed_offer_bytes = LEAN_OFFER_SIZE_ESTIMATE if lean else OFFER_SIZE_ESTIMATE
+        memory_bytes = offers = 0
+        counts: Dict[str, int] = {}
+        fetches = []
+        for destination_options in offer_options:
+            key = holiday_offers_cache_key(destination_options, lean)
+            count = counts.get(key)
+            if count is None:
+                cached = self.cache.peek(key)
+                if cached is not None:
+                    count = len(cached)
+                else:
+                    fetches.append(key)
+                    count = min(round(self.expected_offers), PAGE_SIZE * MAX_PAGES)
+                    # Raw pages are released once parsed, only parallel ones add up
+                    raw_count = min(count, PAGE_SIZE * (MAX_PARALLEL_PAGES + 1))
+                    memory_bytes += (
+                        count * parsed_offer_bytes + raw_count * RAW_OFFER_BYTES
+                    )
+                counts[key] = count
+            memory_bytes += count * PROCESSED_OFFER_BYTES
+            offers += count
+        return Cost(memory_bytes, offers, tuple(fetches))
+
+    def observe_fetches(self, keys: Iterable[str]) -> None:
+        """
+        Learn the offer count of searches from the fetches of the given keys,
+        those that failed are not in the cache and are left out
+        """
+        for key in keys:
+            fetched = self.cache.peek(key)
+            if fetched is not None:
+                self.expected_offers += EXPECTED_OFFERS_SMOOTHING * (
+                    len(fetched) - self.expected_offers
+                )
+
+    def _fits(self, cost: Cost) -> bool:
+        return (
+            self.memory_in_flight + cost.memory_bytes <= self.memory_budget
+            and self.offers_in_flight + cost.offers <= self.offers_budget
+        )
+
+    def _take(self, cost: Cost) -> None:
+        self.memory_in_flight += cost.memory_bytes
+        self.offers_in_flight += cost.offers
+        self._update_gauges()
+
+    def _release(self, cost: Cost) -> None:
+        self.memory_in_flight -= cost.memory_bytes
+        self.offers_in_flight -= cost.offers
+        self._wake()
+        self._update_gauges()
+
+    def _wake(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][0]):
+            cost, future = self._waiters.popleft()
+            if not future.done():
+                self._take(cost)
+                future.set_result(None)
+
+    def _update_gauges(self) -> None:
+        set_gauge(ADMISSION_STATE, "memory_bytes", self.memory_in_flight)
+        set_gauge(ADMISSION_STATE, "offers", self.offers_in_flight)
+        set_gauge(ADMISSION_STATE, "queued", len(self._waiters))
+
+    def retry_after(self) -> float:
+        return max(self.average_hold * (len(self._waiters) + 1), 1.0)
+
+    def _reject(self, reason: str) -> OverloadedError:
+        increment(ADMISSION_EVENTS, f"rejected_{reason}")
+        return OverloadedError(
+            f"Server overloaded ({reason.replace('_', ' ')})", self.retry_after()
+        )
+
+    async def _wait(self, cost: Cost) -> None:
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+        waiter = (cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._update_gauges()
+        # Not wait_for, which on 3.11 swallows a cancellation that lands as the
+        # waiter is admitted
+        try:
+            with timed("admission_wait"):
+                async with asyncio.timeout(
+                    min(self.max_wait, time_remaining(self.max_wait))
+                ):
+                    await waiter[1]
+        except TimeoutError:
+            if not waiter[1].done() or waiter[1].cancelled():
+                raise self._reject("timeout")
+            # Admitted just as the wait ran out
+        except asyncio.CancelledError:
+            if waiter[1].done() and not waiter[1].cancelled():
+                self._release(cost)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                # A large request leaving the head may let smaller ones through
+                self._wake()
+            self._update_gauges()
+
+    @asynccontextmanager
+    async def admit(self, cost: Cost) -> AsyncIterator[None]:
+        """
+        Hold cost from the budgets for the duration of the block
+        Raises OverloadedError when the queue is full or the wait too long
+        """
+        if not self.enabled:
+            yield
+            return
+        cost = Cost(
+            min(cost.memory_bytes, self.memory_budget),
+            min(cost.offers, self.offers_budget),
+            cost.fetches,
+        )
+        if not self._waiters and self._fits(cost):
+            self._take(cost)
+            increment(ADMISSION_EVENTS, "admitted")
+        else:
+            await self._wait(cost)
+            increment(ADMISSION_EVENTS, "admitted_after_queueing")
+
+        admitted_at = self.clock()
+        try:
+            yield
+        finally:
+            self.average_hold += 0.1 * (self.clock() - admitted_at - self.average_hold)
+            self._release(cost)
+            self.observe_fetches(cost.fetches)
+
+
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Return the process wide admission controller, creating it on first use
+    """
+    global _admission_controller
+    if _admission_controller is None:
+        _admission_controller = AdmissionController()
+    return _admission_controller
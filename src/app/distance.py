@@ -1,9 +1,18 @@
+import os
 from math import radians, cos, sin, asin, sqrt
-from geopy.geocoders import Nominatim
-from geopy.location import Location
+from typing import TYPE_CHECKING, Optional
+import numpy as np
 
 from src.models.common import Coordinates
 
+if TYPE_CHECKING:
+    from geopy.geocoders import Nominatim
+    from geopy.location import Location
+
+# Nominatim host and scheme, override to use a local stand-in for load tests
+GEOCODER_DOMAIN = os.environ.get("GEOCODER_DOMAIN", "nominatim.openstreetmap.org")
+GEOCODER_SCHEME = os.environ.get("GEOCODER_SCHEME", "https")
+
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -25,7 +34,50 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return c * r
 
 
-geolocator = Nominatim(user_agent="holiday-finder/1.0 (geocoding application)")
+def haversine_distances(
+    lat1: float, lon1: float, lat2: np.ndarray, lon2: np.ndarray
+) -> np.ndarray:
+    """
+    Vectorized haversine_distance from one point to arrays of points
+    Returns distances in meters
+    """
+    lat1, lon1 = radians(lat1), radians(lon1)
+    lat2 = np.radians(lat2)
+    lon2 = np.radians(lon2)
+
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    c = 2 * np.arcsin(np.sqrt(a))
+
+    # Earth radius in meters
+    r = 6371000
+    return c * r
+
+
+class AddressNotFoundError(Exception):
+    pass
+
+
+_geolocator: Optional["Nominatim"] = None
+
+
+def get_geolocator() -> "Nominatim":
+    """
+    Return the process wide geolocator, importing geopy on first use
+    so that it stays out of the startup path
+    """
+    global _geolocator
+    if _geolocator is None:
+        from geopy.geocoders import Nominatim
+
+        _geolocator = Nominatim(
+            user_agent="holiday-finder/1.0 (geocoding application)",
+            domain=GEOCODER_DOMAIN,
+            scheme=GEOCODER_SCHEME,
+        )
+    return _geolocator
 
 
 def geocode_address(address: str, is_city: bool = False) -> Coordinates:
@@ -34,16 +86,20 @@ def geocode_address(address: str, is_city: bool = False) -> Coordinates:
     Returns (latitude, longitude)
     """
     try:
-        location: Location | None = geolocator.geocode(
+        location: Optional["Location"] = get_geolocator().geocode(
             {"city": address} if is_city else address
         )
 
         if not location:
-            raise ValueError(f"Address not found: {address}")
+            raise AddressNotFoundError(
+                f"Failed to geocode address '{address}': Address not found: {address}"
+            )
 
         return Coordinates(
             latitude=float(location.latitude), longitude=float(location.longitude)
         )
 
+    except AddressNotFoundError:
+        raise
     except Exception as e:
         raise Exception(f"Failed to geocode address '{address}': {e}")
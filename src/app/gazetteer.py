@@ -0,0 +1,166 @@
+"""
+Offline gazetteer of upstream destinations
+
+Maps destination names and their aliases to the upstream destinationId and
+the city center coordinates. The bundled table is a sorted record array
+memory-mapped on first use, and destinations seen in upstream responses are
+learned on top of it.
+
+Rebuild the bundled table after editing src/data/gazetteer.csv with:
+    python -m src.app.gazetteer
+"""
+
+import csv
+import os
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from src.models.common import Coordinates
+from src.models.offer import AnyOffer
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+GAZETTEER_SOURCE_PATH = DATA_DIR / "gazetteer.csv"
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH", str(DATA_DIR / "gazetteer.npy"))
+
+# Marks bundled destinations whose upstream id is not known yet
+NO_DESTINATION_ID = -1
+RECORD_DTYPE = np.dtype(
+    [
+        ("name", "S64"),
+        ("destination_id", "<i4"),
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+    ]
+)
+
+
+class Destination(NamedTuple):
+    destination_id: Optional[int]
+    latitude: float
+    longitude: float
+
+    @property
+    def coordinates(self) -> Coordinates:
+        return Coordinates(latitude=self.latitude, longitude=self.longitude)
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def encode_name(name: str) -> bytes:
+    return normalize_name(name).encode()[: RECORD_DTYPE["name"].itemsize]
+
+
+class Gazetteer:
+    """
+    Destination lookup by name, backed by the bundled table and extended
+    with the destinationData of upstream responses
+    """
+
+    def __init__(self, path: Optional[str] = GAZETTEER_PATH):
+        self.path = path
+        self._records: Optional[np.ndarray] = None
+        self.learned: Dict[str, Destination] = {}
+        self._learned_ids = set()
+
+    @property
+    def records(self) -> np.ndarray:
+        if self._records is None:
+            self._records = np.empty(0, dtype=RECORD_DTYPE)
+            if self.path is not None:
+                try:
+                    self._records = np.load(self.path, mmap_mode="r")
+                except (OSError, ValueError) as e:
+                    print(f"Failed to load gazetteer '{self.path}': {e}")
+        return self._records
+
+    def lookup(self, name: str) -> Optional[Destination]:
+        learned = self.learned.get(normalize_name(name))
+        if learned is not None:
+            return learned
+
+        key = encode_name(name)
+        names = self.records["name"]
+        index = int(np.searchsorted(names, key))
+        if index == len(names) or names[index] != key:
+            return None
+        record = self.records[index]
+        destination_id = int(record["destination_id"])
+        return Destination(
+            destination_id if destination_id != NO_DESTINATION_ID else None,
+            float(record["latitude"]),
+            float(record["longitude"]),
+        )
+
+    def destination_id(self, name: str) -> Optional[int]:
+        destination = self.lookup(name)
+        return destination.destination_id if destination is not None else None
+
+    def coordinates(self, name: str) -> Optional[Coordinates]:
+        destination = self.lookup(name)
+        return destination.coordinates if destination is not None else None
+
+    def add_offers(self, offers: Iterable[AnyOffer]) -> None:
+        """
+        Learn the destinations of upstream offers, once per destinationId
+        """
+        for offer in offers:
+            destination_data = offer.destinationData
+            if destination_data.destinationId in self._learned_ids:
+                continue
+            self._learned_ids.add(destination_data.destinationId)
+            destination = Destination(
+                destination_data.destinationId,
+                destination_data.coordinates.latitude,
+                destination_data.coordinates.longitude,
+            )
+            for name in (destination_data.name_en, destination_data.name):
+                if name:
+                    self.learned[normalize_name(name)] = destination
+
+
+def build_gazetteer(
+    source_path: Path = GAZETTEER_SOURCE_PATH, path: str = GAZETTEER_PATH
+) -> int:
+    """
+    Write the sorted record array of every name and alias in the source CSV
+    Returns the number of records
+    """
+    records = {}
+    with open(source_path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            destination_id = (
+                int(row["destination_id"])
+                if row["destination_id"]
+                else NO_DESTINATION_ID
+            )
+            latitude, longitude = float(row["latitude"]), float(row["longitude"])
+            names = [row["name_en"], *filter(None, row["aliases"].split("|"))]
+            for name in names:
+                records[encode_name(name)] = (destination_id, latitude, longitude)
+
+    table = np.array(
+        [(name, *records[name]) for name in sorted(records)], dtype=RECORD_DTYPE
+    )
+    np.save(path, table)
+    return len(table)
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Return the process wide gazetteer, creating it on first use
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+if __name__ == "__main__":
+    print(f"Wrote {build_gazetteer()} gazetteer records to {GAZETTEER_PATH}")
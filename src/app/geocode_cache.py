@@ -0,0 +1,216 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from src.app.distance import AddressNotFoundError, geocode_address
+from src.app.gazetteer import get_gazetteer
+from src.app.resilience import Resilience
+from src.models.common import Coordinates
+
+GEOCODE_CACHE_PATH = os.environ.get(
+    "GEOCODE_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "holiday-finder-geocode.sqlite3"),
+)
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", 4096))
+# Coordinates of a place practically never change, misses are retried sooner
+GEOCODE_TTL_SECONDS = int(os.environ.get("GEOCODE_TTL_SECONDS", 30 * 24 * 3600))
+GEOCODE_NEGATIVE_TTL_SECONDS = int(
+    os.environ.get("GEOCODE_NEGATIVE_TTL_SECONDS", 24 * 3600)
+)
+# Nominatim allows one request a second, so geocoder calls are not hedged
+GEOCODE_RETRIES = int(os.environ.get("GEOCODE_RETRIES", 1))
+
+CacheKey = Tuple[str, bool]
+# Coordinates of None marks a cached "Address not found"
+CacheEntry = Tuple[Optional[Coordinates], float]
+
+
+def normalize_address(address: str) -> str:
+    """
+    Normalize an address for use as a cache key
+    """
+    return " ".join(address.split()).casefold()
+
+
+class GeocodeCache:
+    """
+    Two tier geocoding cache: an in-process LRU in front of a SQLite store
+    Concurrent lookups of the same key share a single geocoder call, which
+    goes through resilience
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = GEOCODE_CACHE_PATH,
+        max_size: int = GEOCODE_CACHE_SIZE,
+        ttl: float = GEOCODE_TTL_SECONDS,
+        negative_ttl: float = GEOCODE_NEGATIVE_TTL_SECONDS,
+        resilience: Optional[Resilience] = None,
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.resilience = resilience or Resilience(
+            "geocoder",
+            retries=GEOCODE_RETRIES,
+            hedge=False,
+            is_retryable=lambda error: not isinstance(error, AddressNotFoundError),
+        )
+        self._memory: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._in_flight: Dict[CacheKey, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._db is None:
+            try:
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode ("
+                    " address TEXT NOT NULL,"
+                    " is_city INTEGER NOT NULL,"
+                    " latitude REAL,"
+                    " longitude REAL,"
+                    " expires_at REAL NOT NULL,"
+                    " PRIMARY KEY (address, is_city))"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                # The cache keeps working in memory only
+                print(f"Geocode cache disabled persistent store '{self.path}': {e}")
+                self.path = None
+                self._db = None
+        return self._db
+
+    def _remember(self, key: CacheKey, entry: CacheEntry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, key: CacheKey) -> Optional[CacheEntry]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry
+
+    def _get_disk(self, key: CacheKey) -> Optional[CacheEntry]:
+        with self._db_lock:
+            db = self._connect()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT latitude, longitude, expires_at FROM geocode"
+                " WHERE address = ? AND is_city = ?",
+                (key[0], int(key[1])),
+            ).fetchone()
+        if row is None or row[2] <= time.time():
+            return None
+        latitude, longitude, expires_at = row
+        if latitude is None:
+            return None, expires_at
+        return Coordinates(latitude=latitude, longitude=longitude), expires_at
+
+    def _put_disk(self, key: CacheKey, entry: CacheEntry) -> None:
+        coordinates, expires_at = entry
+        with self._db_lock:
+            db = self._connect()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+                (
+                    key[0],
+                    int(key[1]),
+                    coordinates.latitude if coordinates else None,
+                    coordinates.longitude if coordinates else None,
+                    expires_at,
+                ),
+            )
+            db.commit()
+
+    async def _resolve(self, address: str, key: CacheKey) -> CacheEntry:
+        """
+        Look the key up on disk, falling back to the geocoder
+        The store and the geocoder are called in worker threads
+        """
+        entry = await asyncio.to_thread(self._get_disk, key)
+        if entry is not None:
+            return entry
+        try:
+            coordinates = await self.resilience.call(
+                lambda: asyncio.to_thread(geocode_address, address, key[1])
+            )
+            entry = (coordinates, time.time() + self.ttl)
+        except AddressNotFoundError:
+            entry = (None, time.time() + self.negative_ttl)
+        await asyncio.to_thread(self._put_disk, key, entry)
+        return entry
+
+    async def geocode(self, address: str, is_city: bool = False) -> Coordinates:
+        """
+        Convert an address to latitude/longitude, using the cache where possible
+        Raises AddressNotFoundError for (possibly cached) unknown addresses
+        """
+        key = (normalize_address(address), is_city)
+        entry = self._get_memory(key)
+        if entry is None:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = asyncio.ensure_future(self._resolve(address, key))
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            entry = await asyncio.shield(future)
+            self._remember(key, entry)
+
+        coordinates = entry[0]
+        if coordinates is None:
+            raise AddressNotFoundError(
+                f"Failed to geocode address '{address}': Address not found: {address}"
+            )
+        return coordinates
+
+    def clear(self) -> None:
+        self._memory.clear()
+        with self._db_lock:
+            db = self._connect()
+            if db is not None:
+                db.execute("DELETE FROM geocode")
+                db.commit()
+
+
+_geocode_cache: Optional[GeocodeCache] = None
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """
+    Return the process wide geocode cache, creating it on first use
+    """
+    global _geocode_cache
+    if _geocode_cache is None:
+        _geocode_cache = GeocodeCache()
+    return _geocode_cache
+
+
+async def geocode_address_cached(address: str, is_city: bool = False) -> Coordinates:
+    """
+    Geocode an address through the geocode cache
+    City centers of destinations known to the gazetteer need no lookup at all
+    """
+    if is_city:
+        coordinates = get_gazetteer().coordinates(address)
+        if coordinates is not None:
+            return coordinates
+    return await get_geocode_cache().geocode(address, is_city=is_city)
@@ -1,46 +1,339 @@
+import asyncio
 import json
+import os
 from urllib.parse import quote
-import urllib.request
-from typing import List, Optional
+from typing import Callable, List, Optional, Sequence, Union
 from datetime import datetime
-from src.models.holiday_finder_api import ApiResponse, Offer
-from src.models.offer import OfferOptions, OfferWithCalculatedFields
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from src.app.gazetteer import get_gazetteer
+from src.app.hotel_catalog import HotelCatalog, get_hotel_catalog, hotel_key
+from src.app.metrics import (
+    OFFER_COUNTS,
+    UPSTREAM_EVENTS,
+    UPSTREAM_PAYLOAD_BYTES,
+    increment,
+    observe,
+    timed,
+)
+from src.app.offers_cache import (
+    LEAN_OFFER_SIZE_ESTIMATE,
+    OFFER_SIZE_ESTIMATE,
+    canonical_hash,
+    get_offers_cache,
+)
+from src.app.offers_stream import parse_offers_stream
+from src.app.offload import OFFLOAD_MIN_BYTES, OffloadedPage, get_offload_pool
+from src.app.resilience import UpstreamUnavailableError
+from src.app.upstream_client import UpstreamClient, get_upstream_client
+from src.models.holiday_finder_api import ApiData, ApiResponse
+from src.models.holiday_finder_api_lean import LeanApiData, LeanApiResponse
+from src.models.common import Coordinates
+from src.models.offer import AnyOffer, EnrichedOffer, OfferOptions
+from src.models.offer_record import OfferRecord
 
-base_url = "https://www.holidayfinder.co.il/api_no_auth/holiday_finder/offers"
-CITY_NUMBERS = {"Prague": 28, "Rome": 19}
+# Point at a local stand-in, such as benchmarks/fake_upstream.py, for load tests
+base_url = os.environ.get(
+    "UPSTREAM_BASE_URL",
+    "https://www.holidayfinder.co.il/api_no_auth/holiday_finder/offers",
+)
 
+# Paging mode settings
+PAGE_SIZE = int(os.environ.get("UPSTREAM_PAGE_SIZE", 200))
+MAX_PAGES = int(os.environ.get("UPSTREAM_MAX_PAGES", 25))
+MAX_PARALLEL_PAGES = int(os.environ.get("UPSTREAM_MAX_PARALLEL_PAGES", 4))
+# Page size used when paging mode is off
+UNPAGED_LIMIT = 1000
+# Validate only the fields we use, set UPSTREAM_LEAN_PARSE=0 to debug with the full models
+LEAN_PARSE = os.environ.get("UPSTREAM_LEAN_PARSE", "1") != "0"
+# Validate and filter offers while the body is downloaded instead of buffering it,
+# trading CPU time for a peak memory bounded by one offer plus the kept results
+STREAM_PARSE = os.environ.get("UPSTREAM_STREAM_PARSE", "0") == "1"
 
-def fetch_offers_data(offer_options: OfferOptions) -> List[Offer]:
+PageData = Union[ApiData, LeanApiData, OffloadedPage]
+OfferFilter = Callable[[AnyOffer], bool]
+
+
+def build_offers_request_data(
+    offer_options: OfferOptions, limit: int, offset: int
+) -> dict:
     """
-    Fetch hotel data from the given URL
-    Returns list of typed hotel offers
+    Build the upstream request payload for a single page of offers
+    """
+    data = {
+        **offer_options.model_dump(),
+        "sort": {"best": -1},
+        "limit": limit,
+        "offset": offset,
+    }
+    if data["engine"]["where"] is None and data["engine"]["whereTxt"]:
+        # Narrow the query to the destination ids, unless one of them is unknown
+        destination_ids = [
+            get_gazetteer().destination_id(where_txt)
+            for where_txt in data["engine"]["whereTxt"]
+        ]
+        if None not in destination_ids:
+            data["engine"]["where"] = destination_ids
+    return data
+
+
+def parse_offers_page(raw_data: bytes, lean: bool = LEAN_PARSE) -> PageData:
+    """
+    Validate a raw upstream response body
+    In lean mode only the fields of the slim projection models are validated
+    """
+    if lean:
+        return LeanApiResponse.model_validate_json(raw_data).data
+    return ApiResponse.model_validate_json(raw_data).data
+
+
+class DestinationFilter:
     """
+    Predicate keeping only offers for the given destination names or ids
+    A class rather than a closure so it can be sent to worker processes
+    """
+
+    __slots__ = ("destination_names", "destination_ids")
+
+    def __init__(self, destination_names: List[str], destination_ids: List[int]):
+        self.destination_names = destination_names
+        self.destination_ids = destination_ids
+
+    def __call__(self, offer: AnyOffer) -> bool:
+        return (
+            offer.destinationData.name_en.lower() in self.destination_names
+            or offer.destinationData.destinationId in self.destination_ids
+        )
+
+
+def destination_filter(offer_options: OfferOptions) -> OfferFilter:
+    """
+    Build a predicate keeping only offers for the requested destinations
+    Names the gazetteer knows, such as aliases, also match by their id, since
+    upstream answers with the destination's own name
+    """
+    where_txt = offer_options.engine.whereTxt or []
+    destination_names = [name.lower() for name in where_txt]
+    destination_ids = list(offer_options.engine.where or [])
+    for name in where_txt:
+        destination_id = get_gazetteer().destination_id(name)
+        if destination_id is not None and destination_id not in destination_ids:
+            destination_ids.append(destination_id)
+    return DestinationFilter(destination_names, destination_ids)
+
+
+async def fetch_offers_page(
+    offer_options: OfferOptions,
+    limit: int,
+    offset: int,
+    client: UpstreamClient,
+    lean: bool = LEAN_PARSE,
+    stream: bool = STREAM_PARSE,
+    keep: Optional[OfferFilter] = None,
+) -> PageData:
+    """
+    Fetch a single page of offers, keeping only those accepted by keep
+    Returns the validated page data including its pagination block
+    """
+    data = build_offers_request_data(offer_options, limit, offset)
+    url = f"{base_url}/?data={quote(json.dumps(data))}"
     try:
-        data = {
-            **offer_options.model_dump(),
-            "sort": {"best": -1},
-            "limit": 1000,
-            "offset": 0,
-        }
-        if data["engine"]["where"] is None and data["engine"]["whereTxt"] is not None:
-            maybe_city_number = CITY_NUMBERS.get(data["engine"]["whereTxt"][0])
-            if maybe_city_number is not None:
-                data["engine"]["where"] = [maybe_city_number]
+        if stream:
+            # Download, parse and filter are interleaved, so they are timed together
+            with timed("upstream_stream"):
+                async with client.stream_bytes(url) as chunks:
+                    page = await parse_offers_stream(chunks, lean, keep)
+            observe(OFFER_COUNTS, "upstream_page", len(page.offers))
+            return page
 
-        url = f"{base_url}/?data={quote(json.dumps(data))}"
-        request = urllib.request.Request(url)
+        with timed("upstream_fetch"):
+            raw_data = await client.get_bytes(url)
+        observe(UPSTREAM_PAYLOAD_BYTES, "offers", len(raw_data))
 
-        with urllib.request.urlopen(request) as response:
-            raw_data = json.loads(response.read().decode())
+        offload_pool = get_offload_pool()
+        if offload_pool is not None and lean and len(raw_data) >= OFFLOAD_MIN_BYTES:
+            # Parse, filter and nights are computed in a worker process
+            try:
+                with timed("offload"):
+                    page = await offload_pool.parse_page(raw_data, keep)
+                observe(OFFER_COUNTS, "upstream_page", len(page.offers))
+                return page
+            except BrokenProcessPool:
+                # The pool is replaced, this page is parsed in process
+                increment(UPSTREAM_EVENTS, "offload_broken")
 
         # Parse and validate the response using Pydantic
-        api_response = ApiResponse.model_validate(raw_data)
-        return api_response.data.offers
+        with timed("parse"):
+            page = parse_offers_page(raw_data, lean)
+        observe(OFFER_COUNTS, "upstream_page", len(page.offers))
+        if keep is not None:
+            with timed("filter"):
+                page.offers = [offer for offer in page.offers if keep(offer)]
+        return page
 
+    except UpstreamUnavailableError:
+        raise
     except Exception as e:
         raise Exception(f"Failed to fetch data from URL '{url}': {e}")
 
 
+async def fetch_offers_data_uncached(
+    offer_options: OfferOptions,
+    client: UpstreamClient,
+    paginate: bool = True,
+    page_size: int = PAGE_SIZE,
+    max_pages: int = MAX_PAGES,
+    max_parallel_pages: int = MAX_PARALLEL_PAGES,
+    lean: bool = LEAN_PARSE,
+    stream: bool = STREAM_PARSE,
+    keep: Optional[OfferFilter] = None,
+) -> List[AnyOffer]:
+    """
+    Fetch hotel data from the given URL
+    In paging mode the first page is fetched alone, and the remaining pages
+    reported by its pagination block are fetched concurrently
+    Returns list of typed hotel offers accepted by keep
+    """
+    if not paginate:
+        first_page = await fetch_offers_page(
+            offer_options, UNPAGED_LIMIT, 0, client, lean, stream, keep
+        )
+        return first_page.offers
+
+    first_page = await fetch_offers_page(
+        offer_options, page_size, 0, client, lean, stream, keep
+    )
+    pagination = first_page.pagination
+    if pagination.total_offers_pages > max_pages:
+        print(
+            f"Warning: upstream reports {pagination.total_offers_pages} pages"
+            f" ({pagination.total_offers_count} offers) for"
+            f" {offer_options.engine.whereTxt}, only the first {max_pages} are fetched"
+        )
+        increment(UPSTREAM_EVENTS, "offers_truncated")
+    total_pages = min(pagination.total_offers_pages, max_pages)
+    if total_pages <= 1:
+        return first_page.offers
+
+    semaphore = asyncio.Semaphore(max_parallel_pages)
+
+    async def fetch_page(page_index: int) -> tuple[int, List[AnyOffer]]:
+        async with semaphore:
+            page = await fetch_offers_page(
+                offer_options,
+                page_size,
+                page_index * page_size,
+                client,
+                lean,
+                stream,
+                keep,
+            )
+            return page_index, page.offers
+
+    # Pages are merged as they complete but kept in upstream order
+    pages: List[List[AnyOffer]] = [[] for _ in range(total_pages)]
+    pages[0] = first_page.offers
+    tasks = [asyncio.ensure_future(fetch_page(i)) for i in range(1, total_pages)]
+    try:
+        for next_page in asyncio.as_completed(tasks):
+            page_index, offers = await next_page
+            pages[page_index] = offers
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    # The upstream ranking can shift between page requests, so drop repeats
+    seen_offer_ids = set()
+    merged_offers = []
+    for offers in pages:
+        for offer in offers:
+            if offer.offer.hfOfferId in seen_offer_ids:
+                continue
+            seen_offer_ids.add(offer.offer.hfOfferId)
+            merged_offers.append(offer)
+    return merged_offers
+
+
+def offers_cache_key(
+    offer_options: OfferOptions,
+    paginate: bool,
+    page_size: int,
+    max_pages: int,
+    lean: bool,
+    filter_destination: bool,
+) -> str:
+    """
+    Canonical hash of the upstream query, independent of the requested page
+    """
+    data = build_offers_request_data(
+        offer_options, page_size if paginate else UNPAGED_LIMIT, 0
+    )
+    return canonical_hash(
+        {
+            **data,
+            "paginate": paginate,
+            "max_pages": max_pages,
+            "lean": lean,
+            "filter_destination": filter_destination,
+        }
+    )
+
+
+async def fetch_offers_data(
+    offer_options: OfferOptions,
+    client: Optional[UpstreamClient] = None,
+    paginate: bool = True,
+    page_size: int = PAGE_SIZE,
+    max_pages: int = MAX_PAGES,
+    max_parallel_pages: int = MAX_PARALLEL_PAGES,
+    use_cache: bool = True,
+    lean: bool = LEAN_PARSE,
+    stream: bool = STREAM_PARSE,
+    filter_destination: bool = False,
+    refresh: bool = False,
+) -> List[AnyOffer]:
+    """
+    Fetch hotel offers, served from the offers cache when possible
+    With filter_destination only offers for the requested destinations are kept
+    With refresh the cached offers are fetched again even if they are fresh
+    Returns list of typed hotel offers, which must not be mutated
+    """
+    client = client or get_upstream_client()
+    keep = destination_filter(offer_options) if filter_destination else None
+
+    async def fetch() -> List[AnyOffer]:
+        offers = await fetch_offers_data_uncached(
+            offer_options,
+            client,
+            paginate,
+            page_size,
+            max_pages,
+            max_parallel_pages,
+            lean,
+            stream,
+            keep,
+        )
+        get_hotel_catalog().add_offers(offers)
+        get_gazetteer().add_offers(offers)
+        return offers
+
+    if not use_cache:
+        return await fetch()
+
+    cache = get_offers_cache()
+    return await (cache.refresh if refresh else cache.get_or_fetch)(
+        offers_cache_key(
+            offer_options, paginate, page_size, max_pages, lean, filter_destination
+        ),
+        fetch,
+        lambda offers: len(offers)
+        * (LEAN_OFFER_SIZE_ESTIMATE if lean else OFFER_SIZE_ESTIMATE),
+    )
+
+
+# Offers in a response share a small set of date pairs
+@lru_cache(maxsize=4096)
 def calculate_nights(outbound_date: str, inbound_date: str) -> int:
     """
     Calculate number of nights between outbound and inbound dates
@@ -54,54 +347,96 @@ def calculate_nights(outbound_date: str, inbound_date: str) -> int:
         return 0
 
 
-def generate_google_maps_url(latitude: float, longitude: float) -> str:
+def add_calculated_fields(offer: AnyOffer) -> Optional[EnrichedOffer]:
     """
-    Generate Google Maps link for hotel using coordinates
-    """
-    return f"https://www.google.com/maps/place/{latitude},{longitude}"
-
-
-def add_calculated_fields(offer: Offer) -> Optional[OfferWithCalculatedFields]:
-    """
-    Extract relevant hotel information from an offer
-    Returns ProcessedOffer with name, coordinates, dates, URL, price, airline, nights_amount, and google_maps_url
+    Attach the calculated fields to an offer without copying it
+    Returns EnrichedOffer with nights_amount, google_maps_url is built on access
     """
     try:
-        latitude = offer.hotel.coordinates.latitude
-        longitude = offer.hotel.coordinates.longitude
-        outbound_date = offer.offer.outboundDate
-        inbound_date = offer.offer.inboundDate
-
-        return OfferWithCalculatedFields(
-            **offer.model_dump(),
-            nights_amount=calculate_nights(outbound_date, inbound_date),
-            google_maps_url=generate_google_maps_url(latitude, longitude),
+        if isinstance(offer, OfferRecord):
+            return EnrichedOffer(offer, nights_amount=offer.nights_amount)
+        return EnrichedOffer(
+            offer,
+            nights_amount=calculate_nights(
+                offer.offer.outboundDate, offer.offer.inboundDate
+            ),
         )
     except Exception:
         return None
 
 
-def get_holiday_offers(
+def select_offers_near(
+    offers: List[AnyOffer],
+    near: Sequence[Coordinates],
+    max_distance_m: Optional[float] = None,
+    nearest_hotels: Optional[int] = None,
+) -> List[AnyOffer]:
+    """
+    Keep the offers whose hotel is within max_distance_m of one of the near
+    points and/or among the nearest_hotels hotels closest to one of them,
+    using the hotel catalog index
+    """
+    catalog = get_hotel_catalog()
+    offer_hotel_keys = [hotel_key(offer) for offer in offers]
+    candidates = set(offer_hotel_keys)
+    if len(candidates) > catalog.max_size:
+        # More hotels than the catalog holds, index these offers on their own
+        catalog = HotelCatalog(max_size=len(candidates))
+    catalog.index_offers(offers, offer_hotel_keys)
+    selected = set()
+    for point in near:
+        if nearest_hotels is not None:
+            selected.update(
+                catalog.nearest(point, nearest_hotels, candidates, max_distance_m)
+            )
+        else:
+            selected.update(catalog.within(point, max_distance_m, candidates))
+    return [offer for offer, key in zip(offers, offer_hotel_keys) if key in selected]
+
+
+def holiday_offers_cache_key(
+    offer_options: OfferOptions, lean: bool = LEAN_PARSE
+) -> str:
+    """
+    Key of the offers cache entry get_holiday_offers is served from
+    """
+    return offers_cache_key(offer_options, True, PAGE_SIZE, MAX_PAGES, lean, True)
+
+
+def process_offers(
+    city_offers: List[AnyOffer],
+    near: Sequence[Coordinates] = (),
+    max_distance_m: Optional[float] = None,
+    nearest_hotels: Optional[int] = None,
+) -> List[Optional[EnrichedOffer]]:
+    """
+    Select the offers near the given points, if asked to, and enrich them
+    Returns list of processed offers (some may be None if processing failed)
+    """
+    if near and (max_distance_m is not None or nearest_hotels is not None):
+        with timed("filter"):
+            city_offers = select_offers_near(
+                city_offers, near, max_distance_m, nearest_hotels
+            )
+    with timed("enrich"):
+        return [add_calculated_fields(offer) for offer in city_offers]
+
+
+async def get_holiday_offers(
     offer_options: OfferOptions,
-) -> List[Optional[OfferWithCalculatedFields]]:
+    client: Optional[UpstreamClient] = None,
+    lean: bool = LEAN_PARSE,
+    near: Sequence[Coordinates] = (),
+    max_distance_m: Optional[float] = None,
+    nearest_hotels: Optional[int] = None,
+) -> List[Optional[EnrichedOffer]]:
     """
     Fetch and process holiday offers
+    When near points are given with max_distance_m and/or nearest_hotels, only
+    offers for the matching hotels of the hotel catalog are processed
     Returns list of processed offers (some may be None if processing failed)
     """
-    offers = fetch_offers_data(offer_options)
-
-    destination_names = (
-        [where_txt.lower() for where_txt in offer_options.engine.whereTxt]
-        if offer_options.engine.whereTxt is not None
-        else []
-    )
-    destination_ids = (
-        offer_options.engine.where if offer_options.engine.where is not None else []
+    city_offers = await fetch_offers_data(
+        offer_options, client, lean=lean, filter_destination=True
     )
-    city_offers = [
-        offer
-        for offer in offers
-        if offer.destinationData.name_en.lower() in destination_names
-        or offer.destinationData.destinationId in destination_ids
-    ]
-    return [add_calculated_fields(offer) for offer in city_offers]
+    return process_offers(city_offers, near, max_distance_m, nearest_hotels)
@@ -0,0 +1,227 @@
+import math
+import os
+from collections import OrderedDict, defaultdict
+from typing import (
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+
+from src.app.distance import haversine_distances
+from src.models.common import Coordinates
+from src.models.offer import AnyOffer
+
+# Grid cells of about 2.2km of latitude, small enough that a city radius
+# query only looks at a handful of cells
+CELL_SIZE_DEGREES = 0.02
+METERS_PER_DEGREE = 111_320
+EARTH_RADIUS_M = 6_371_000
+HOTEL_CATALOG_MAX_SIZE = int(os.environ.get("HOTEL_CATALOG_MAX_SIZE", 200_000))
+
+Cell = Tuple[int, int]
+
+
+class CatalogHotel(NamedTuple):
+    key: str
+    name: str
+    latitude: float
+    longitude: float
+
+
+def hotel_key(offer: AnyOffer) -> str:
+    """
+    Identify an offer's hotel by its provider id, falling back to its coordinates
+    """
+    hotel = offer.hotel
+    if hotel.provider_hotel_id:
+        return hotel.provider_hotel_id
+    return f"{hotel.coordinates.latitude:.6f},{hotel.coordinates.longitude:.6f}"
+
+
+class HotelCatalog:
+    """
+    Process wide catalog of the hotels seen in upstream responses
+    Hotels are indexed on a latitude/longitude grid for radius and nearest queries
+    Past max_size hotels, the least recently seen are evicted
+    """
+
+    def __init__(
+        self,
+        cell_size: float = CELL_SIZE_DEGREES,
+        max_size: int = HOTEL_CATALOG_MAX_SIZE,
+    ):
+        self.cell_size = cell_size
+        self.max_size = max_size
+        self.hotels: "OrderedDict[str, CatalogHotel]" = OrderedDict()
+        self.cells: Dict[Cell, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.hotels)
+
+    def _cell(self, latitude: float, longitude: float) -> Cell:
+        return (
+            math.floor(latitude / self.cell_size),
+            math.floor(longitude / self.cell_size),
+        )
+
+    def _unindex(self, hotel: CatalogHotel) -> None:
+        cell = self._cell(hotel.latitude, hotel.longitude)
+        keys = self.cells[cell]
+        keys.discard(hotel.key)
+        if not keys:
+            del self.cells[cell]
+
+    def add(self, hotel: CatalogHotel) -> None:
+        existing = self.hotels.get(hotel.key)
+        if existing is not None:
+            self.hotels.move_to_end(hotel.key)
+            if existing == hotel:
+                return
+            self._unindex(existing)
+        self.hotels[hotel.key] = hotel
+        self.cells[self._cell(hotel.latitude, hotel.longitude)].add(hotel.key)
+        while len(self.hotels) > self.max_size:
+            _, evicted = self.hotels.popitem(last=False)
+            self._unindex(evicted)
+
+    def add_offers(self, offers: Iterable[AnyOffer]) -> None:
+        for offer in offers:
+            coordinates = offer.hotel.coordinates
+            self.add(
+                CatalogHotel(
+                    key=hotel_key(offer),
+                    name=offer.hotel.name,
+                    latitude=coordinates.latitude,
+                    longitude=coordinates.longitude,
+                )
+            )
+
+    def index_offers(self, offers: Sequence[AnyOffer], keys: Sequence[str]) -> None:
+        """
+        Make sure the hotels of offers, with their keys, are indexed and marked
+        as recently seen, so that none of them is evicted while they are queried
+        At most max_size distinct hotels can be indexed at once
+        """
+        for key in set(keys):
+            if key in self.hotels:
+                self.hotels.move_to_end(key)
+        # Hotels evicted since the offers were fetched are added back
+        self.add_offers(
+            offer for offer, key in zip(offers, keys) if key not in self.hotels
+        )
+
+    def _cells_within(self, center: Coordinates, radius_m: float) -> Iterable[Cell]:
+        lat_span = radius_m / METERS_PER_DEGREE
+        lon_scale = max(math.cos(math.radians(center.latitude)), 1e-6)
+        lon_span = min(lat_span / lon_scale, 180)
+        min_lat, min_lon = self._cell(
+            center.latitude - lat_span, center.longitude - lon_span
+        )
+        max_lat, max_lon = self._cell(
+            center.latitude + lat_span, center.longitude + lon_span
+        )
+        cell_count = (max_lat - min_lat + 1) * (max_lon - min_lon + 1)
+        if cell_count > len(self.cells):
+            # Wide queries are cheaper to answer from the occupied cells
+            for cell_lat, cell_lon in list(self.cells):
+                if min_lat <= cell_lat <= max_lat and min_lon <= cell_lon <= max_lon:
+                    yield cell_lat, cell_lon
+            return
+        for cell_lat in range(min_lat, max_lat + 1):
+            for cell_lon in range(min_lon, max_lon + 1):
+                if (cell_lat, cell_lon) in self.cells:
+                    yield cell_lat, cell_lon
+
+    def _distances(
+        self, center: Coordinates, keys: List[str]
+    ) -> Tuple[List[str], np.ndarray]:
+        hotels = [self.hotels[key] for key in keys]
+        distances = haversine_distances(
+            center.latitude,
+            center.longitude,
+            np.array([hotel.latitude for hotel in hotels], dtype=np.float64),
+            np.array([hotel.longitude for hotel in hotels], dtype=np.float64),
+        )
+        return keys, distances
+
+    def within(
+        self,
+        center: Coordinates,
+        radius_m: float,
+        candidates: Optional[Collection[str]] = None,
+    ) -> Dict[str, float]:
+        """
+        Return the hotels within radius_m of center, mapped to their distance
+        Only hotels in candidates are considered when it is given
+        """
+        keys = [
+            key
+            for cell in self._cells_within(center, radius_m)
+            for key in self.cells[cell]
+            if candidates is None or key in candidates
+        ]
+        if not keys:
+            return {}
+        keys, distances = self._distances(center, keys)
+        return {
+            key: float(distance)
+            for key, distance in zip(keys, distances)
+            if distance <= radius_m
+        }
+
+    def nearest(
+        self,
+        center: Coordinates,
+        k: int,
+        candidates: Optional[Collection[str]] = None,
+        max_distance_m: Optional[float] = None,
+    ) -> Dict[str, float]:
+        """
+        Return the k hotels closest to center, mapped to their distance
+        Searches rings of grid cells outwards until k hotels are certainly found
+        """
+        if k <= 0:
+            return {}
+        total = len(candidates) if candidates is not None else len(self.hotels)
+        if total == 0:
+            return {}
+
+        radius_m = self.cell_size * METERS_PER_DEGREE
+        while True:
+            found = self.within(center, radius_m, candidates)
+            # Every hotel closer than radius_m was looked at, so the k
+            # closest found are final once there are enough of them
+            if len(found) >= min(k, total) or (
+                max_distance_m is not None and radius_m >= max_distance_m
+            ):
+                break
+            # Past half the planet's circumference every hotel was looked at
+            if radius_m > math.pi * EARTH_RADIUS_M:
+                break
+            radius_m *= 2
+
+        closest = sorted(found.items(), key=lambda item: item[1])[:k]
+        if max_distance_m is not None:
+            closest = [item for item in closest if item[1] <= max_distance_m]
+        return dict(closest)
+
+
+_hotel_catalog: Optional[HotelCatalog] = None
+
+
+def get_hotel_catalog() -> HotelCatalog:
+    """
+    Return the process wide hotel catalog, creating it on first use
+    """
+    global _hotel_catalog
+    if _hotel_catalog is None:
+        _hotel_catalog = HotelCatalog()
+    return _hotel_catalog
@@ -0,0 +1,256 @@
+"""
+Lightweight hot path instrumentation
+
+Stage durations are recorded into Prometheus style histograms and, while a
+request is being served, into that request's timings so they can be sent
+back as a Server-Timing header. Set METRICS_ENABLED=0 to turn every timer
+into a shared no-op.
+"""
+
+import bisect
+import math
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+SECONDS_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+BYTES_BUCKETS = tuple(1024 * 4**i for i in range(10))
+COUNT_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# (stage, seconds) pairs of the request being served
+request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+class Histogram:
+    """
+    Cumulative histogram with one series per label value
+    """
+
+    def __init__(
+        self, name: str, documentation: str, buckets: Sequence[float], label: str
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label = label
+        # label value -> [count per bucket (and +Inf), sum]
+        self.series: Dict[str, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_value, (counts, total) in sorted(self.series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {total[0]}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "holiday_finder_stage_seconds",
+    "Time spent in each stage of serving offers",
+    SECONDS_BUCKETS,
+    "stage",
+)
+REQUEST_SECONDS = Histogram(
+    "holiday_finder_request_seconds",
+    "Total time spent serving a request",
+    SECONDS_BUCKETS,
+    "endpoint",
+)
+UPSTREAM_PAYLOAD_BYTES = Histogram(
+    "holiday_finder_upstream_payload_bytes",
+    "Size of upstream response bodies",
+    BYTES_BUCKETS,
+    "upstream",
+)
+OFFER_COUNTS = Histogram(
+    "holiday_finder_offers",
+    "Number of offers per upstream page and per response",
+    COUNT_BUCKETS,
+    "source",
+)
+HISTOGRAMS = [STAGE_SECONDS, REQUEST_SECONDS, UPSTREAM_PAYLOAD_BYTES, OFFER_COUNTS]
+
+
+class Counter:
+    """
+    Monotonic counter with one series per label value
+    """
+
+    def __init__(self, name: str, documentation: str, label: str):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.series: Dict[str, float] = {}
+
+    def inc(self, label_value: str, amount: float = 1) -> None:
+        self.series[label_value] = self.series.get(label_value, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for label_value, total in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {total}')
+        return lines
+
+
+UPSTREAM_EVENTS = Counter(
+    "holiday_finder_upstream_events_total",
+    "Retries, hedges, timeouts and circuit breaker events of upstream calls",
+    "event",
+)
+ADMISSION_EVENTS = Counter(
+    "holiday_finder_admission_events_total",
+    "Requests admitted at once, admitted after queueing, or rejected",
+    "outcome",
+)
+COUNTERS = [UPSTREAM_EVENTS, ADMISSION_EVENTS]
+
+
+class Gauge:
+    """
+    Current value with one series per label value
+    """
+
+    def __init__(self, name: str, documentation: str, label: str):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.series: Dict[str, float] = {}
+
+    def set(self, label_value: str, value: float) -> None:
+        self.series[label_value] = value
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for label_value, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+ADMISSION_STATE = Gauge(
+    "holiday_finder_admission",
+    "Estimated memory and offers of the admitted requests, and requests queued",
+    "resource",
+)
+GAUGES = [ADMISSION_STATE]
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def observe(histogram: Histogram, label_value: str, value: float) -> None:
+    if METRICS_ENABLED:
+        histogram.observe(label_value, value)
+
+
+def increment(counter: Counter, label_value: str, amount: float = 1) -> None:
+    if METRICS_ENABLED:
+        counter.inc(label_value, amount)
+
+
+def set_gauge(gauge: Gauge, label_value: str, value: float) -> None:
+    if METRICS_ENABLED:
+        gauge.set(label_value, value)
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        record_stage(self.stage, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage: str):
+    """
+    Context manager recording the duration of a stage
+    """
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    """
+    Format request timings as a Server-Timing header, summing repeated stages
+    """
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()
+    )
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for counter in COUNTERS:
+        lines.extend(counter.render())
+    for gauge in GAUGES:
+        lines.extend(gauge.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,113 @@
+from typing import Optional, Sequence
+
+import numpy as np
+
+from src.app.distance import haversine_distances
+from src.models.common import Coordinates
+from src.models.offer import EnrichedOffer
+
+
+class OfferBatch:
+    """
+    Struct of arrays view over a list of offers
+    Holds the numeric fields used for distance, filtering and ordering as
+    NumPy arrays, aligned with the offers list
+    """
+
+    def __init__(
+        self,
+        offers: Sequence[EnrichedOffer],
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        price: np.ndarray,
+        rating: np.ndarray,
+        nights: np.ndarray,
+        distance_m: Optional[np.ndarray] = None,
+    ):
+        self.offers = offers
+        self.latitude = latitude
+        self.longitude = longitude
+        self.price = price
+        self.rating = rating
+        self.nights = nights
+        self.distance_m = distance_m
+
+    @classmethod
+    def from_offers(cls, offers: Sequence[EnrichedOffer]) -> "OfferBatch":
+        coordinates = [offer.hotel.coordinates for offer in offers]
+        latitude = np.array([c.latitude for c in coordinates], dtype=np.float64)
+        longitude = np.array([c.longitude for c in coordinates], dtype=np.float64)
+        price = np.array([offer.offer.price for offer in offers], dtype=np.int64)
+        rating = np.array([offer.hotel.rating for offer in offers], dtype=np.int64)
+        nights = np.array([offer.nights_amount for offer in offers], dtype=np.int64)
+        return cls(offers, latitude, longitude, price, rating, nights)
+
+    def __len__(self) -> int:
+        return len(self.offers)
+
+    def compute_distances(self, comp_coordinates: Coordinates) -> np.ndarray:
+        """
+        Compute the distance of every offer from the given coordinates in one call
+        """
+        self.distance_m = haversine_distances(
+            comp_coordinates.latitude,
+            comp_coordinates.longitude,
+            self.latitude,
+            self.longitude,
+        )
+        return self.distance_m
+
+    def compute_distance_matrix(self, points: Sequence[Coordinates]) -> np.ndarray:
+        """
+        Compute the distance of every offer from every point
+        Returns an array of shape (offers, points)
+        """
+        matrix = np.empty((len(self.offers), len(points)), dtype=np.float64)
+        for column, point in enumerate(points):
+            matrix[:, column] = haversine_distances(
+                point.latitude, point.longitude, self.latitude, self.longitude
+            )
+        return matrix
+
+    def filter(self, mask: np.ndarray) -> "OfferBatch":
+        """
+        Return a new batch holding only the rows where mask is True
+        """
+        indices = np.flatnonzero(mask)
+        return self.take(indices)
+
+    def take(self, indices: np.ndarray) -> "OfferBatch":
+        return OfferBatch(
+            [self.offers[i] for i in indices],
+            self.latitude[indices],
+            self.longitude[indices],
+            self.price[indices],
+            self.rating[indices],
+            self.nights[indices],
+            self.distance_m[indices] if self.distance_m is not None else None,
+        )
+
+    def top_k(self, key: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+        """
+        Return the indices of the k rows with the smallest key, in ascending order
+        Only the selected rows are sorted, ties keep their original order
+        """
+        count = len(key)
+        if k is None or k >= count:
+            return np.argsort(key, kind="stable")
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        # argpartition does not keep ties stable, so take every row tied with
+        # the k-th smallest key before the final stable sort
+        kth_value = key[np.argpartition(key, k - 1)[k - 1]]
+        candidates = np.flatnonzero(key <= kth_value)
+        order = np.argsort(key[candidates], kind="stable")
+        return candidates[order][:k]
+
+    def nearest(self, k: Optional[int] = None) -> np.ndarray:
+        """
+        Return the indices of the k offers closest to the compared coordinates
+        """
+        if self.distance_m is None:
+            raise ValueError("Distances must be computed before ordering by them")
+        return self.top_k(self.distance_m, k)
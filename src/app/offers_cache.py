@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+OFFERS_CACHE_TTL_SECONDS = float(os.environ.get("OFFERS_CACHE_TTL_SECONDS", 300))
+# How long past its TTL an entry may still be served while it is refreshed
+OFFERS_CACHE_STALE_SECONDS = float(os.environ.get("OFFERS_CACHE_STALE_SECONDS", 900))
+# How long past its stale period an entry is kept, to be served if fetching it fails
+OFFERS_CACHE_ERROR_SECONDS = float(os.environ.get("OFFERS_CACHE_ERROR_SECONDS", 3600))
+# Sized to leave most of a 512Mi instance for in-flight requests
+OFFERS_CACHE_MAX_BYTES = int(os.environ.get("OFFERS_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Measured footprint of one validated Offer from the sample payload, rounded up
+OFFER_SIZE_ESTIMATE = 20_000
+LEAN_OFFER_SIZE_ESTIMATE = 6_000
+
+
+def canonical_hash(payload: Any) -> str:
+    """
+    Hash a JSON serializable payload independently of its key order
+    """
+    canonical = json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    size: int
+    fetched_at: float
+
+
+class OffersCache:
+    """
+    In-memory LRU cache of upstream results bounded by estimated size
+    Serves stale entries while revalidating them in the background, and
+    collapses concurrent fetches of the same key onto one upstream call
+    Expired entries are served when fetching them again fails
+    """
+
+    def __init__(
+        self,
+        ttl: float = OFFERS_CACHE_TTL_SECONDS,
+        stale_ttl: float = OFFERS_CACHE_STALE_SECONDS,
+        error_ttl: float = OFFERS_CACHE_ERROR_SECONDS,
+        max_bytes: int = OFFERS_CACHE_MAX_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._background: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: str, value: Any, size: int) -> None:
+        self._evict(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = CacheEntry(value=value, size=size, fetched_at=self.clock())
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._evict(oldest_key)
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry.size
+
+    def _fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        size_of: Callable[[Any], int],
+    ) -> asyncio.Future:
+        future = self._in_flight.get(key)
+        if future is not None:
+            return future
+
+        async def fetch_and_store():
+            value = await fetch()
+            self._store(key, value, size_of(value))
+            return value
+
+        future = asyncio.ensure_future(fetch_and_store())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return future
+
+    def _revalidate(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        size_of: Callable[[Any], int],
+    ) -> None:
+        if key in self._in_flight:
+            return
+        future = self._fetch(key, fetch, size_of)
+        self._background.add(future)
+
+        def on_done(done: asyncio.Future) -> None:
+            self._background.discard(done)
+            if not done.cancelled() and done.exception() is not None:
+                print(f"Offers cache background refresh failed: {done.exception()}")
+
+        future.add_done_callback(on_done)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        size_of: Callable[[Any], int] = lambda value: 0,
+    ) -> Any:
+        """
+        Return the cached value for key, fetching it on a miss
+        Fresh entries are returned as is, stale ones are returned while a
+        background refresh runs, and expired ones are fetched again
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = self.clock() - entry.fetched_at
+            if age < self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                if age >= self.ttl:
+                    self._revalidate(key, fetch, size_of)
+                return entry.value
+            if age >= self.ttl + self.stale_ttl + self.error_ttl:
+                self._evict(key)
+                entry = None
+
+        try:
+            return await asyncio.shield(self._fetch(key, fetch, size_of))
+        except Exception as e:
+            if entry is None:
+                raise
+            print(f"Serving expired offers after a failed fetch: {e}")
+            return entry.value
+
+    async def refresh(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        size_of: Callable[[Any], int] = lambda value: 0,
+    ) -> Any:
+        """
+        Fetch and store the value for key whatever the age of its entry
+        Joins the fetch already in flight for key if there is one
+        """
+        return await asyncio.shield(self._fetch(key, fetch, size_of))
+
+    def peek(self, key: str) -> Any:
+        """
+        Return the value get_or_fetch would serve for key without fetching,
+        or None, leaving the LRU order untouched
+        """
+        entry = self._entries.get(key)
+        if (
+            entry is None
+            or self.clock() - entry.fetched_at >= self.ttl + self.stale_ttl
+        ):
+            return None
+        return entry.value
+
+    def entry_age(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return self.clock() - entry.fetched_at if entry is not None else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.current_bytes = 0
+
+
+_offers_cache: Optional[OffersCache] = None
+
+
+def get_offers_cache() -> OffersCache:
+    """
+    Return the process wide offers cache, creating it on first use
+    """
+    global _offers_cache
+    if _offers_cache is None:
+        _offers_cache = OffersCache()
+    return _offers_cache
@@ -1,110 +1,118 @@
-import sys
-import json
-from .get_holiday_offers import get_holiday_offers
-from .distance import haversine_distance, geocode_address
+from typing import Dict, Hashable, Optional, Sequence
+import numpy as np
+from .hotel_catalog import hotel_key
+from .metrics import timed
+from .offer_batch import OfferBatch
 from src.models.common import Coordinates
-from src.models.offer import (
-    Budget,
-    OfferOptions,
-    OfferEngineOptions,
-    OfferWithDistance,
-    OfferWithCalculatedFields,
-)
+from src.models.offer import EnrichedOffer
 
 
 def add_distance_to_offers(
-    offers: list[OfferWithCalculatedFields], comp_coordinates: Coordinates
-) -> list[OfferWithDistance]:
+    offers: list[EnrichedOffer],
+    comp_coordinates: Coordinates,
+    limit: Optional[int] = None,
+) -> list[EnrichedOffer]:
+    """
+    Compute distances for all offers in one vectorized call
+    Returns the limit closest offers (all of them if limit is None), sorted by
+    distance, with distance_m set on each returned offer
+    """
+    with timed("distance"):
+        batch = OfferBatch.from_offers(offers)
+        distances = batch.compute_distances(comp_coordinates)
+    with timed("sort"):
+        order = batch.nearest(limit)
     offers_with_distance = []
-    for offer in offers:
-        distance = haversine_distance(
-            comp_coordinates.latitude,
-            comp_coordinates.longitude,
-            offer.hotel.coordinates.latitude,
-            offer.hotel.coordinates.longitude,
-        )
-        offers_with_distance.append(
-            OfferWithDistance(
-                **offer.model_dump(),
-                distance_m=distance,
-            )
-        )
-    offers_with_distance.sort(key=lambda x: x.distance_m)
+    for i in order:
+        offer = offers[i]
+        offer.distance_m = float(distances[i])
+        offers_with_distance.append(offer)
     return offers_with_distance
 
 
-def main():
-    min_nights = 5
-    max_nights = 6
-    min_budget = 0
-    max_budget = 550
-    city = "Rome"
-
-    offer_options = OfferOptions(
-        engine=OfferEngineOptions(
-            market=4,
-            when={
-                "months": {
-                    "periods": [
-                        {"start": "01/10/2025", "end": "31/10/2025"},
-                        {"start": "01/11/2025", "end": "30/11/2025"},
-                    ],
-                    "min": min_nights,
-                    "max": max_nights,
-                    "nights": [min_nights, max_nights],
-                }
-            },
-            whereTxt=[city],
-            budget=Budget(min=min_budget, max=max_budget),
-            flex=False,
-        ),
-        sort={"best": -1},
-        limit=1000,
-        offset=0,
-    )
-    comparison_address = city
-
-    try:
-        comp_coordinates = geocode_address(comparison_address)
-        offers = get_holiday_offers(offer_options)
+def add_distance_matrix_to_offers(
+    offers: list[EnrichedOffer],
+    points: Sequence[Coordinates],
+    aggregate: str = "min",
+    limit: Optional[int] = None,
+    point_index: Optional[Sequence[int]] = None,
+) -> list[EnrichedOffer]:
+    """
+    Compute the distances of all offers from all points as one matrix
+    Offers are ranked by their min or mean distance over the points, or, when
+    point_index is given, by their distance from the point it selects per offer
+    Returns the limit closest offers with distances_m and distance_m set
+    """
+    if aggregate not in ("min", "mean"):
+        raise ValueError(f"Unknown distance aggregate: {aggregate}")
 
-        # Process and calculate distances
-        offers_with_distance: list[OfferWithDistance] = add_distance_to_offers(
-            offers, comp_coordinates
-        )
-        if not offers_with_distance:
-            return
+    with timed("distance"):
+        batch = OfferBatch.from_offers(offers)
+        matrix = batch.compute_distance_matrix(points)
+        if point_index is not None:
+            batch.distance_m = matrix[
+                np.arange(len(offers)), np.asarray(point_index, dtype=np.intp)
+            ]
+        elif aggregate == "mean":
+            batch.distance_m = matrix.mean(axis=1)
+        else:
+            batch.distance_m = matrix.min(axis=1)
+    with timed("sort"):
+        order = batch.nearest(limit)
 
-        offers_with_distance.sort(key=lambda x: x.distance_m)
+    offers_with_distance = []
+    for i in order:
+        offer = offers[i]
+        offer.distances_m = matrix[i].tolist()
+        offer.distance_m = float(batch.distance_m[i])
+        offers_with_distance.append(offer)
+    return offers_with_distance
 
-        output_data = []
-        for offer in offers_with_distance:
-            output_data.append(
-                {
-                    "name": offer.hotel_name,
-                    "url": offer.url,
-                    "google_maps_url": offer.google_maps_url,
-                    "nights_amount": offer.nights_amount,
-                    "start_date": offer.outbound_date,
-                    "end_date": offer.inbound_date,
-                    "distance_meters": int(offer.distance_m),
-                    "price": offer.price,
-                    "airline": offer.airline,
-                }
-            )
 
-        print(f"got {len(output_data)} offers")
-        print(
-            f"Closest offer: {json.dumps(output_data[0], indent=2, ensure_ascii=False)}"
+def group_offers_by_hotel(
+    offers: list[EnrichedOffer],
+    points: Sequence[Coordinates],
+    aggregate: str = "min",
+    limit: Optional[int] = None,
+    point_index: Optional[Sequence[int]] = None,
+) -> list[list[EnrichedOffer]]:
+    """
+    Group offers by hotel and compute the distances of each hotel once
+    Hotels are ranked like add_distance_matrix_to_offers ranks offers, ties
+    broken by their cheapest price, and each hotel's offers are sorted by price
+    Returns the offers of the limit closest hotels, the first of each, its
+    cheapest, with distances_m and distance_m set
+    """
+    with timed("group"):
+        groups: Dict[Hashable, list[int]] = {}
+        for i, offer in enumerate(offers):
+            key = hotel_key(offer)
+            # Compared with its own city center, a hotel is only grouped with
+            # the offers of the same destination
+            groups.setdefault(
+                key if point_index is None else (key, point_index[i]), []
+            ).append(i)
+        hotels = [
+            sorted((offers[i] for i in indices), key=lambda offer: offer.offer.price)
+            for indices in groups.values()
+        ]
+        hotel_point_index = (
+            [point_index[indices[0]] for indices in groups.values()]
+            if point_index is not None
+            else None
         )
-        # Write results to JSON file
-        with open("output/hotels_output.json", "w", encoding="utf-8") as f:
-            json.dump(output_data, f, indent=2, ensure_ascii=False)
-
-    except Exception as e:
-        print(f"Error: {e}", file=sys.stderr)
-        sys.exit(1)
+        # Hotels at the same distance keep this order through the stable ranking
+        order = sorted(range(len(hotels)), key=lambda h: hotels[h][0].offer.price)
+        hotels = [hotels[h] for h in order]
+        if hotel_point_index is not None:
+            hotel_point_index = [hotel_point_index[h] for h in order]
 
-
-if __name__ == "__main__":
-    main()
+    nearest = add_distance_matrix_to_offers(
+        [hotel[0] for hotel in hotels],
+        points,
+        aggregate=aggregate,
+        limit=limit,
+        point_index=hotel_point_index,
+    )
+    hotels_by_cheapest = {id(hotel[0]): hotel for hotel in hotels}
+    return [hotels_by_cheapest[id(offer)] for offer in nearest]
@@ -0,0 +1,156 @@
+"""
+Incremental parsing of the upstream offers response
+
+The response is read chunk by chunk and every element of data.offers is
+validated (and optionally filtered) as soon as it is complete, so only one
+offer's worth of raw JSON is held in memory at a time, next to the kept
+results.
+"""
+
+import codecs
+import json
+import re
+from typing import AsyncIterator, Callable, Optional, Type
+
+from pydantic import BaseModel
+
+from src.models.holiday_finder_api import ApiData, Offer, Pagination
+from src.models.holiday_finder_api_lean import LeanApiData, LeanOffer, LeanPagination
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+NUMBER_CONTINUATION = ".eE"
+# Consumed text is dropped from the buffer once it grows past this size
+COMPACT_THRESHOLD = 64 * 1024
+
+
+class OffersStreamError(ValueError):
+    pass
+
+
+class _TextStream:
+    """
+    Decoded text buffer over an async iterator of byte chunks
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self.chunks = chunks
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    async def read_more(self) -> bool:
+        if self.eof:
+            return False
+        if self.pos > COMPACT_THRESHOLD:
+            self.text = self.text[self.pos :]
+            self.pos = 0
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            self.text += self.decoder.decode(b"", final=True)
+            return False
+        self.text += self.decoder.decode(chunk)
+        return True
+
+    async def peek(self) -> str:
+        """
+        Skip whitespace and return the next character without consuming it
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not await self.read_more():
+                raise OffersStreamError("Unexpected end of offers response")
+
+    async def expect(self, token: str) -> None:
+        if await self.peek() != token:
+            raise OffersStreamError(
+                f"Expected '{token}' in offers response, got '{self.text[self.pos]}'"
+            )
+        self.pos += 1
+
+    async def read_value(self, decoder: json.JSONDecoder):
+        """
+        Decode the next complete JSON value, reading more chunks until it is complete
+        """
+        await self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.pos)
+                # A number at the end of the buffer, or cut before its
+                # fraction or exponent, may continue in the next chunk
+                if self.eof or (
+                    end < len(self.text)
+                    and not (
+                        isinstance(value, (int, float))
+                        and self.text[end] in NUMBER_CONTINUATION
+                    )
+                ):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            await self.read_more()
+
+
+async def parse_offers_stream(
+    chunks: AsyncIterator[bytes],
+    lean: bool = True,
+    keep: Optional[Callable[[BaseModel], bool]] = None,
+):
+    """
+    Parse an upstream response from an async iterator of byte chunks
+    Each offer is validated, and dropped unless keep returns True for it,
+    before the next one is read
+    Returns LeanApiData or ApiData holding the pagination and the kept offers
+    """
+    offer_model: Type[BaseModel] = LeanOffer if lean else Offer
+    pagination_model: Type[BaseModel] = LeanPagination if lean else Pagination
+    data_model: Type[BaseModel] = LeanApiData if lean else ApiData
+
+    decoder = json.JSONDecoder()
+    stream = _TextStream(chunks)
+    pagination = None
+    offers = []
+
+    await stream.expect("{")
+    while await stream.peek() != "}":
+        key = await stream.read_value(decoder)
+        await stream.expect(":")
+        if key != "data":
+            await stream.read_value(decoder)
+        else:
+            await stream.expect("{")
+            while await stream.peek() != "}":
+                data_key = await stream.read_value(decoder)
+                await stream.expect(":")
+                if data_key == "pagination":
+                    pagination = pagination_model.model_validate(
+                        await stream.read_value(decoder)
+                    )
+                elif data_key == "offers":
+                    await stream.expect("[")
+                    while await stream.peek() != "]":
+                        offer = offer_model.model_validate(
+                            await stream.read_value(decoder)
+                        )
+                        if keep is None or keep(offer):
+                            offers.append(offer)
+                        if await stream.peek() == ",":
+                            stream.pos += 1
+                    stream.pos += 1
+                else:
+                    await stream.read_value(decoder)
+                if await stream.peek() == ",":
+                    stream.pos += 1
+            stream.pos += 1
+        if await stream.peek() == ",":
+            stream.pos += 1
+
+    if pagination is None:
+        raise OffersStreamError("Offers response has no pagination block")
+    return data_model.model_construct(pagination=pagination, offers=offers)
@@ -0,0 +1,333 @@
+"""
+Parse, filter and enrich upstream pages in a pool of worker processes
+
+Workers validate the raw body with the lean models, keep the offers
+accepted by the filter, compute their nights, and write the fields used
+downstream as columns into a shared memory block: one record array for the
+numbers and one NUL separated UTF-8 string per text field. The event loop
+only rebuilds the offers as plain tuples from those columns.
+
+Set OFFLOAD_WORKERS to the number of worker processes to enable it.
+Distances stay on the event loop: they depend on the points of each
+request, while parsed pages are cached and shared between requests, and
+the vectorized computation is already cheap.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.models.holiday_finder_api_lean import LeanApiResponse, LeanPagination
+from src.models.offer_record import (
+    CoordinatesRecord,
+    DestinationRecord,
+    FlightRecord,
+    HotelRecord,
+    OfferDataRecord,
+    OfferRecord,
+)
+
+OFFLOAD_WORKERS = int(os.environ.get("OFFLOAD_WORKERS", 0))
+# Smaller bodies are parsed inline, the round trip to a worker costs more
+OFFLOAD_MIN_BYTES = int(os.environ.get("OFFLOAD_MIN_BYTES", 256 * 1024))
+# Workers are replaced after this many pages to bound their memory growth
+OFFLOAD_MAX_TASKS_PER_CHILD = int(os.environ.get("OFFLOAD_MAX_TASKS_PER_CHILD", 500))
+
+NUMERIC_DTYPE = np.dtype(
+    [
+        ("destination_id", "<i8"),
+        ("destination_latitude", "<f8"),
+        ("destination_longitude", "<f8"),
+        ("price", "<i8"),
+        ("rating", "<i8"),
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+        ("nights", "<i8"),
+    ]
+)
+TEXT_FIELDS = (
+    "destination_name",
+    "destination_name_en",
+    "offer_id",
+    "outbound_date",
+    "inbound_date",
+    "deeplink_url",
+    "hotel_name",
+    "photo",
+    "provider_hotel_id",
+    "company_name",
+)
+SEPARATOR = "\0"
+
+
+class OffloadedPage:
+    """
+    Page data rebuilt from a worker's columns, shaped like LeanApiData
+    """
+
+    __slots__ = ("pagination", "offers")
+
+    def __init__(self, pagination: LeanPagination, offers: List[OfferRecord]):
+        self.pagination = pagination
+        self.offers = offers
+
+
+def encode_page(
+    raw_data: bytes, keep: Optional[Callable[[Any], bool]]
+) -> Tuple[str, int, int, List[int], Dict[str, int]]:
+    """
+    Worker side: parse, filter and enrich a page into a shared memory block
+    Returns the block name, the row count, the numeric size, the text
+    column boundaries and the pagination
+    """
+    from src.app.get_holiday_offers import calculate_nights
+
+    page = LeanApiResponse.model_validate_json(raw_data).data
+    offers = [offer for offer in page.offers if keep is None or keep(offer)]
+
+    numeric = np.array(
+        [
+            (
+                offer.destinationData.destinationId,
+                offer.destinationData.coordinates.latitude,
+                offer.destinationData.coordinates.longitude,
+                offer.offer.price,
+                offer.hotel.rating,
+                offer.hotel.coordinates.latitude,
+                offer.hotel.coordinates.longitude,
+                calculate_nights(offer.offer.outboundDate, offer.offer.inboundDate),
+            )
+            for offer in offers
+        ],
+        dtype=NUMERIC_DTYPE,
+    )
+    columns = [
+        [offer.destinationData.name for offer in offers],
+        [offer.destinationData.name_en for offer in offers],
+        [offer.offer.hfOfferId for offer in offers],
+        [offer.offer.outboundDate for offer in offers],
+        [offer.offer.inboundDate for offer in offers],
+        [offer.offer.packageDeeplinkUrl for offer in offers],
+        [offer.hotel.name for offer in offers],
+        [offer.hotel.photos[0] if offer.hotel.photos else "" for offer in offers],
+        [offer.hotel.provider_hotel_id or "" for offer in offers],
+        [offer.flight.company_name for offer in offers],
+    ]
+    text = []
+    for column in columns:
+        joined = SEPARATOR.join(column)
+        if joined.count(SEPARATOR) != max(len(column) - 1, 0):
+            raise ValueError("Offer text contains the column separator")
+        text.append(joined.encode())
+
+    boundaries = [numeric.nbytes]
+    for encoded in text:
+        boundaries.append(boundaries[-1] + len(encoded))
+    shared = SharedMemory(create=True, size=max(boundaries[-1], 1))
+    try:
+        shared.buf[: numeric.nbytes] = numeric.tobytes()
+        for start, encoded in zip(boundaries, text):
+            shared.buf[start : start + len(encoded)] = encoded
+    finally:
+        shared.close()
+    # The parent unlinks the block once it has read it
+    resource_tracker.unregister(shared._name, "shared_memory")
+    return (
+        shared.name,
+        len(offers),
+        numeric.nbytes,
+        boundaries,
+        page.pagination.model_dump(),
+    )
+
+
+def decode_page(
+    name: str,
+    count: int,
+    numeric_size: int,
+    boundaries: List[int],
+    pagination: Dict[str, int],
+) -> OffloadedPage:
+    """
+    Read a worker's shared memory block back into offers, and release it
+    """
+    shared = SharedMemory(name=name)
+    try:
+        numeric = np.frombuffer(
+            shared.buf[:numeric_size], dtype=NUMERIC_DTYPE, count=count
+        ).copy()
+        text = [
+            bytes(shared.buf[start:end]).decode().split(SEPARATOR) if count else []
+            for start, end in zip(boundaries, boundaries[1:])
+        ]
+    finally:
+        shared.close()
+        shared.unlink()
+
+    columns = dict(zip(TEXT_FIELDS, text))
+    offers = [
+        OfferRecord(
+            destinationData=DestinationRecord(
+                destination_id,
+                CoordinatesRecord(destination_latitude, destination_longitude),
+                destination_name,
+                destination_name_en,
+            ),
+            offer=OfferDataRecord(
+                offer_id, outbound_date, inbound_date, price, deeplink_url
+            ),
+            hotel=HotelRecord(
+                hotel_name,
+                rating,
+                [photo] if photo else [],
+                CoordinatesRecord(latitude, longitude),
+                provider_hotel_id or None,
+            ),
+            flight=FlightRecord(company_name),
+            nights_amount=nights,
+        )
+        for (
+            destination_id,
+            destination_latitude,
+            destination_longitude,
+            price,
+            rating,
+            latitude,
+            longitude,
+            nights,
+            destination_name,
+            destination_name_en,
+            offer_id,
+            outbound_date,
+            inbound_date,
+            deeplink_url,
+            hotel_name,
+            photo,
+            provider_hotel_id,
+            company_name,
+        ) in zip(
+            *(numeric[field].tolist() for field in NUMERIC_DTYPE.names),
+            *(columns[field] for field in TEXT_FIELDS),
+        )
+    ]
+    return OffloadedPage(LeanPagination.model_construct(**pagination), offers)
+
+
+def release_page(future: Future) -> None:
+    """
+    Free the shared memory block of a page whose result is not read, once
+    its worker is done with it
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        shared = SharedMemory(name=future.result()[0])
+    except FileNotFoundError:
+        return
+    shared.close()
+    shared.unlink()
+
+
+def warm_worker() -> None:
+    """
+    Worker side: import what encode_page needs ahead of the first page
+    """
+    from src.app.get_holiday_offers import calculate_nights  # noqa: F401
+
+
+class OffloadPool:
+    """
+    Lazily started pool of worker processes
+    """
+
+    def __init__(
+        self,
+        workers: int = OFFLOAD_WORKERS,
+        max_tasks_per_child: int = OFFLOAD_MAX_TASKS_PER_CHILD,
+    ):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking a process running an event loop and threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+        return self._executor
+
+    async def parse_page(
+        self, raw_data: bytes, keep: Optional[Callable[[Any], bool]] = None
+    ) -> OffloadedPage:
+        """
+        Parse, filter and enrich a raw page in a worker
+        keep must be picklable
+        Raises BrokenProcessPool when a worker died, e.g. killed for its memory,
+        after replacing the pool so that the next pages are offloaded again
+        """
+        executor = self.executor
+        try:
+            future = executor.submit(encode_page, raw_data, keep)
+            try:
+                result = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # A worker already running the page still writes its block
+                future.add_done_callback(release_page)
+                raise
+        except BrokenProcessPool:
+            self._replace(executor)
+            raise
+        return decode_page(*result)
+
+    def _replace(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Drop a broken executor, once, the next page starts a new one
+        """
+        if self._executor is executor:
+            print("Offload worker died, replacing the worker pool")
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self) -> None:
+        """
+        Spawn the workers ahead of the first page
+        """
+        for future in [self.executor.submit(warm_worker) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        self._executor = None
+
+
+_offload_pool: Optional[OffloadPool] = None
+
+
+def get_offload_pool() -> Optional[OffloadPool]:
+    """
+    Return the process wide worker pool, or None when offloading is disabled
+    """
+    global _offload_pool
+    if OFFLOAD_WORKERS <= 0:
+        return None
+    if _offload_pool is None:
+        _offload_pool = OffloadPool()
+    return _offload_pool
+
+
+def close_offload_pool() -> None:
+    global _offload_pool
+    if _offload_pool is not None:
+        _offload_pool.shutdown()
+    _offload_pool = None
@@ -0,0 +1,86 @@
+import bisect
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from src.models.offer import EnrichedOffer
+
+
+def pareto_layers(
+    price: np.ndarray,
+    distance: np.ndarray,
+    rating: Optional[np.ndarray] = None,
+    max_layers: int = 1,
+) -> List[List[int]]:
+    """
+    Split points into successive fronts of non-dominated points, minimizing
+    price and distance and, when given, maximizing rating
+    Points are sorted once, then each front is found by a single sweep in
+    price order that keeps the staircase of the best (distance, rating)
+    pairs seen so far. The staircase holds at most one step per distinct
+    rating, which an insert may shift, so max_layers fronts take
+    O(n log n + max_layers * n * r) for r distinct ratings: linear per front
+    for hotel star ratings or without ratings, O(n^2) for arbitrary values
+    Returns the indices of each front, ordered by price
+    """
+    # Ratings are negated so that every dimension is minimized
+    third = -rating if rating is not None else np.zeros(len(price))
+    remaining = np.lexsort((third, distance, price)).tolist()
+    price, distance, third = price.tolist(), distance.tolist(), third.tolist()
+
+    layers = []
+    while remaining and len(layers) < max_layers:
+        front, dominated = [], []
+        # Distances in increasing order, with strictly decreasing third values
+        stair_distance: List[float] = []
+        stair_third: List[float] = []
+        previous, previous_kept = None, False
+        for i in remaining:
+            point = (price[i], distance[i], third[i])
+            # Equal points do not dominate each other and share their front
+            if point != previous:
+                previous = point
+                # Best third value among the swept points no farther than this one
+                position = bisect.bisect_right(stair_distance, point[1])
+                previous_kept = position == 0 or stair_third[position - 1] > point[2]
+                if previous_kept:
+                    # Drop the steps this point now dominates
+                    end = position
+                    while end < len(stair_third) and stair_third[end] >= point[2]:
+                        end += 1
+                    stair_distance[position:end] = [point[1]]
+                    stair_third[position:end] = [point[2]]
+            (front if previous_kept else dominated).append(i)
+        layers.append(front)
+        remaining = dominated
+    return layers
+
+
+def rank_offers_pareto(
+    offers: Sequence[EnrichedOffer],
+    use_rating: bool = False,
+    fronts: int = 1,
+    limit: Optional[int] = None,
+) -> List[EnrichedOffer]:
+    """
+    Rank offers with distance_m set by Pareto front over price and distance,
+    and optionally hotel rating
+    Returns the offers of the first fronts, frontier first, with pareto_front set
+    """
+    if not offers:
+        return []
+    price = np.array([offer.offer.price for offer in offers], dtype=np.float64)
+    distance = np.array([offer.distance_m for offer in offers], dtype=np.float64)
+    rating = (
+        np.array([offer.hotel.rating for offer in offers], dtype=np.float64)
+        if use_rating
+        else None
+    )
+
+    ranked = []
+    for front_index, front in enumerate(pareto_layers(price, distance, rating, fronts)):
+        for i in front:
+            offer = offers[i]
+            offer.pareto_front = front_index
+            ranked.append(offer)
+    return ranked[:limit] if limit is not None else ranked
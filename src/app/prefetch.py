@@ -0,0 +1,256 @@
+"""
+Background refresh of the most popular offer searches
+
+Searches are counted by their normalized upstream query. Every interval,
+plus or minus some jitter, the most popular ones whose cached offers are
+getting old are fetched again, so the offers cache and the hotel catalog
+stay warm for the next user. Upstream requests made by the scheduler are
+capped by a per minute budget.
+
+Enable with PREFETCH_ENABLED=1. On Cloud Run the refresh only runs between
+requests when CPU is always allocated (--no-cpu-throttling).
+"""
+
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.app.get_holiday_offers import (
+    MAX_PAGES,
+    fetch_offers_data,
+    holiday_offers_cache_key,
+)
+from src.app.metrics import timed
+from src.app.offers_cache import OffersCache, get_offers_cache
+from src.app.upstream_client import UpstreamClient, get_upstream_client
+from src.models.offer import OfferOptions
+
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "0") == "1"
+PREFETCH_INTERVAL_SECONDS = float(os.environ.get("PREFETCH_INTERVAL_SECONDS", 120))
+# Fraction of the interval the delay between runs varies by
+PREFETCH_JITTER = float(os.environ.get("PREFETCH_JITTER", 0.2))
+PREFETCH_TOP_N = int(os.environ.get("PREFETCH_TOP_N", 10))
+PREFETCH_BUDGET_PER_MINUTE = int(os.environ.get("PREFETCH_BUDGET_PER_MINUTE", 30))
+# Cached offers younger than this are left alone
+PREFETCH_REFRESH_AFTER_SECONDS = float(
+    os.environ.get("PREFETCH_REFRESH_AFTER_SECONDS", 180)
+)
+# Searches seen fewer times than this, after decay, are not refreshed
+PREFETCH_MIN_HITS = 2
+PREFETCH_MAX_TRACKED = 1000
+# Hit counts are multiplied by this after every run, so popularity fades
+PREFETCH_DECAY = 0.5
+
+
+class RequestBudget:
+    """
+    Token bucket allowing per_minute requests a minute, with bursts of as many
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.per_minute = per_minute
+        self.clock = clock
+        self.tokens = float(per_minute)
+        self.updated_at = clock()
+
+    def available(self) -> float:
+        now = self.clock()
+        self.tokens = min(
+            self.per_minute,
+            self.tokens + (now - self.updated_at) * self.per_minute / 60,
+        )
+        self.updated_at = now
+        return self.tokens
+
+    def spend(self, requests: int = 1) -> None:
+        self.available()
+        self.tokens -= requests
+
+
+class BudgetedClient:
+    """
+    Upstream client charging every request it makes to a budget, retries and
+    hedged requests included
+    """
+
+    def __init__(self, client: UpstreamClient, budget: RequestBudget):
+        self.client = client
+        self.budget = budget
+        self.requests = 0
+
+    def _charge(self) -> None:
+        self.requests += 1
+        self.budget.spend()
+
+    async def get_bytes(self, url: str, params: Optional[dict] = None) -> bytes:
+        return await self.client.get_bytes(url, params, on_attempt=self._charge)
+
+    @asynccontextmanager
+    async def stream_bytes(self, url: str, **kwargs) -> AsyncIterator:
+        async with self.client.stream_bytes(
+            url, on_attempt=self._charge, **kwargs
+        ) as chunks:
+            yield chunks
+
+
+class PrefetchScheduler:
+    """
+    Tracks the most frequent searches and periodically refreshes their offers
+    The clock, sleep and rand functions can be replaced to drive it in tests
+    """
+
+    def __init__(
+        self,
+        interval: float = PREFETCH_INTERVAL_SECONDS,
+        jitter: float = PREFETCH_JITTER,
+        top_n: int = PREFETCH_TOP_N,
+        budget_per_minute: int = PREFETCH_BUDGET_PER_MINUTE,
+        refresh_after: float = PREFETCH_REFRESH_AFTER_SECONDS,
+        min_hits: float = PREFETCH_MIN_HITS,
+        max_tracked: int = PREFETCH_MAX_TRACKED,
+        cache: Optional[OffersCache] = None,
+        client: Optional[UpstreamClient] = None,
+        fetch: Callable[..., Awaitable] = fetch_offers_data,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+        rand: Callable[[], float] = random.random,
+    ):
+        self.interval = interval
+        self.jitter = jitter
+        self.top_n = top_n
+        self.refresh_after = refresh_after
+        self.min_hits = min_hits
+        self.max_tracked = max_tracked
+        self.budget = RequestBudget(budget_per_minute, clock)
+        self._cache = cache
+        self._client = client
+        self.fetch = fetch
+        self.sleep = sleep
+        self.rand = rand
+        # cache key -> [hit count, last seen options]
+        self.searches: Dict[str, list] = {}
+        # cache key -> upstream requests its last refresh took
+        self.request_costs: Dict[str, int] = {}
+        # Assumed for a search never refreshed, which may take every page,
+        # though never more than a full budget so it can run at all
+        self.first_request_cost = min(MAX_PAGES, budget_per_minute)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def cache(self) -> OffersCache:
+        return self._cache if self._cache is not None else get_offers_cache()
+
+    @property
+    def client(self) -> UpstreamClient:
+        return self._client if self._client is not None else get_upstream_client()
+
+    def record(self, offer_options: OfferOptions) -> None:
+        """
+        Count a search, keyed like the offers cache entry serving it
+        """
+        key = holiday_offers_cache_key(offer_options)
+        search = self.searches.get(key)
+        if search is None:
+            if len(self.searches) >= self.max_tracked:
+                self._forget_least_popular()
+            self.searches[key] = [1.0, offer_options]
+        else:
+            search[0] += 1
+            search[1] = offer_options
+
+    def _forget_least_popular(self) -> None:
+        by_hits = sorted(self.searches, key=lambda key: self.searches[key][0])
+        for key in by_hits[: max(len(by_hits) // 10, 1)]:
+            del self.searches[key]
+            self.request_costs.pop(key, None)
+
+    def popular(self) -> List[Tuple[str, OfferOptions]]:
+        ranked = sorted(
+            self.searches.items(), key=lambda item: item[1][0], reverse=True
+        )
+        return [
+            (key, options)
+            for key, (hits, options) in ranked[: self.top_n]
+            if hits >= self.min_hits
+        ]
+
+    async def run_once(self) -> int:
+        """
+        Refresh the popular searches whose cached offers are getting old,
+        most popular first, while the budget covers the requests their last
+        refresh took
+        Returns the number of searches refreshed
+        """
+        refreshed = 0
+        for key, offer_options in self.popular():
+            age = self.cache.entry_age(key)
+            if age is not None and age < self.refresh_after:
+                continue
+            cost = self.request_costs.get(key, self.first_request_cost)
+            if self.budget.available() < cost:
+                break
+            client = BudgetedClient(self.client, self.budget)
+            try:
+                with timed("prefetch"):
+                    await self.fetch(
+                        offer_options,
+                        client,
+                        filter_destination=True,
+                        refresh=True,
+                    )
+                refreshed += 1
+            except Exception as e:
+                print(f"Prefetch of a popular search failed: {e}")
+            self.request_costs[key] = max(client.requests, 1)
+
+        for key in list(self.searches):
+            self.searches[key][0] *= PREFETCH_DECAY
+            if self.searches[key][0] < 0.1:
+                del self.searches[key]
+                self.request_costs.pop(key, None)
+        return refreshed
+
+    def next_delay(self) -> float:
+        return self.interval * (1 + self.jitter * (2 * self.rand() - 1))
+
+    async def run(self) -> None:
+        while True:
+            await self.sleep(self.next_delay())
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Prefetch run failed: {e}")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+_prefetch_scheduler: Optional[PrefetchScheduler] = None
+
+
+def get_prefetch_scheduler() -> PrefetchScheduler:
+    """
+    Return the process wide prefetch scheduler, creating it on first use
+    """
+    global _prefetch_scheduler
+    if _prefetch_scheduler is None:
+        _prefetch_scheduler = PrefetchScheduler()
+    return _prefetch_scheduler
+
+
+def record_search(offer_options: OfferOptions) -> None:
+    if PREFETCH_ENABLED:
+        get_prefetch_scheduler().record(offer_options)
@@ -0,0 +1,356 @@
+"""
+Deadlines, retries, hedging and circuit breaking for upstream calls
+
+Calls made while serving a request share that request's deadline. Failed
+attempts of idempotent calls are retried with jittered exponential backoff
+while the deadline allows. Once enough latencies are known, an attempt
+still running past the p95 latency is hedged with a second one and the
+first to succeed wins. After consecutive failures the circuit breaker opens
+and calls fail fast, so callers can serve cached data, until a probe call
+succeeds again.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Deque, Optional, TypeVar
+
+from src.app.metrics import UPSTREAM_EVENTS, increment
+
+# Budget of a whole request, shared by all the upstream calls it makes
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", 20))
+# Budget of a call made outside of a request, by the prefetcher or the CLI
+UPSTREAM_DEADLINE_SECONDS = float(os.environ.get("UPSTREAM_DEADLINE_SECONDS", 15))
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", 2))
+RETRY_BASE_DELAY_SECONDS = 0.1
+RETRY_MAX_DELAY_SECONDS = 2.0
+UPSTREAM_HEDGE = os.environ.get("UPSTREAM_HEDGE", "1") != "0"
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+# At most this fraction of calls is hedged, so a slow upstream is not doubled
+HEDGE_MAX_RATIO = 0.1
+LATENCY_WINDOW = 200
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", 30))
+
+T = TypeVar("T")
+
+# Monotonic time the calls of the current request must finish by
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class UpstreamUnavailableError(Exception):
+    """
+    An upstream call gave up, retry_after suggests when to try again
+    """
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    pass
+
+
+class DeadlineExceededError(UpstreamUnavailableError):
+    status_code = 504
+
+
+@asynccontextmanager
+async def request_deadline(
+    seconds: float = REQUEST_DEADLINE_SECONDS,
+) -> AsyncIterator[None]:
+    """
+    Bound the block, and every upstream call made inside it, by seconds
+    A deadline set by an enclosing block is only ever shortened
+    Raises DeadlineExceededError when the block runs out of time
+    """
+    expires_at = time.monotonic() + seconds
+    enclosing = _deadline.get()
+    if enclosing is not None:
+        expires_at = min(expires_at, enclosing)
+    token = _deadline.set(expires_at)
+    try:
+        async with asyncio.timeout(expires_at - time.monotonic()) as timeout:
+            yield
+    except TimeoutError as e:
+        if timeout.expired():
+            increment(UPSTREAM_EVENTS, "request_deadline_exceeded")
+            raise DeadlineExceededError(
+                f"Request deadline of {seconds:g}s exceeded"
+            ) from e
+        raise
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining(default: float = UPSTREAM_DEADLINE_SECONDS) -> float:
+    """
+    Seconds left before the current request's deadline, or default outside one
+    """
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return default
+    return expires_at - time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Latencies of the most recent successful calls
+    """
+
+    def __init__(
+        self, window: int = LATENCY_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES
+    ):
+        self.min_samples = min_samples
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Returns None until min_samples latencies are known
+        """
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, then lets one probe
+    call through every reset_timeout seconds until one succeeds
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # A probe that never reports back, e.g. cancelled, expires like the open state
+        self.probe_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 1.0)
+
+    def allow(self) -> bool:
+        if self.state != "half_open":
+            return self.opened_at is None
+        now = self.clock()
+        if (
+            self.probe_started_at is not None
+            and now - self.probe_started_at < self.reset_timeout
+        ):
+            return False
+        self.probe_started_at = now
+        return True
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            print(f"Circuit breaker for {self.name} closed")
+            increment(UPSTREAM_EVENTS, f"{self.name}_breaker_closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probe_started_at is not None or (
+            self.opened_at is None and self.failures >= self.failure_threshold
+        ):
+            if self.probe_started_at is None:
+                print(f"Circuit breaker for {self.name} opened")
+                increment(UPSTREAM_EVENTS, f"{self.name}_breaker_opened")
+            self.opened_at = self.clock()
+            self.probe_started_at = None
+
+
+class Resilience:
+    """
+    Runs the calls to one upstream service under the current deadline, with
+    retries, hedging and a circuit breaker
+    is_retryable tells transient errors, which are retried and count against
+    the breaker, from answers such as "not found"
+    The clock, sleep and rand functions can be replaced to drive it in tests
+    """
+
+    def __init__(
+        self,
+        name: str,
+        retries: int = UPSTREAM_RETRIES,
+        base_delay: float = RETRY_BASE_DELAY_SECONDS,
+        max_delay: float = RETRY_MAX_DELAY_SECONDS,
+        hedge: bool = UPSTREAM_HEDGE,
+        hedge_quantile: float = HEDGE_QUANTILE,
+        hedge_max_ratio: float = HEDGE_MAX_RATIO,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_SECONDS,
+        default_deadline: float = UPSTREAM_DEADLINE_SECONDS,
+        is_retryable: Callable[[Exception], bool] = lambda error: True,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+        rand: Callable[[], float] = random.random,
+    ):
+        self.name = name
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_max_ratio = hedge_max_ratio
+        self.default_deadline = default_deadline
+        self.is_retryable = is_retryable
+        self.clock = clock
+        self.sleep = sleep
+        self.rand = rand
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout, clock)
+        self.latencies = LatencyTracker()
+        self.calls = 0
+        self.hedges = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        How long to wait for an attempt before hedging it, None to not hedge
+        """
+        if not self.hedge or self.hedges >= self.hedge_max_ratio * self.calls:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    def backoff(self, retry: int) -> float:
+        """
+        Full jitter: uniform between 0 and the exponential delay of the retry
+        """
+        return self.rand() * min(self.max_delay, self.base_delay * 2**retry)
+
+    async def call(
+        self,
+        attempt: Callable[[], Awaitable[T]],
+        idempotent: bool = True,
+        hedge: bool = True,
+    ) -> T:
+        """
+        Await attempt(), retried when idempotent and hedged when hedge is also
+        set, until it succeeds, fails with an error that is not retryable or
+        the deadline passes
+        Raises CircuitOpenError, without calling attempt, while the breaker is
+        open, DeadlineExceededError once the deadline has passed and
+        UpstreamUnavailableError, chained to the last error, once the retries
+        of a retryable error run out
+        """
+        self.calls += 1
+        retries = self.retries if idempotent else 0
+        error: Optional[Exception] = None
+        for retry in range(retries + 1):
+            if retry > 0:
+                delay = self.backoff(retry - 1)
+                if delay >= time_remaining(self.default_deadline):
+                    break
+                increment(UPSTREAM_EVENTS, f"{self.name}_retry")
+                await self.sleep(delay)
+
+            remaining = time_remaining(self.default_deadline)
+            if remaining <= 0:
+                break
+            if not self.breaker.allow():
+                increment(UPSTREAM_EVENTS, f"{self.name}_rejected")
+                raise CircuitOpenError(
+                    f"Circuit breaker for {self.name} is open",
+                    self.breaker.retry_after(),
+                )
+            try:
+                return await asyncio.wait_for(
+                    self._attempt(attempt, idempotent and hedge), remaining
+                )
+            except TimeoutError:
+                increment(UPSTREAM_EVENTS, f"{self.name}_timeout")
+                self.breaker.record_failure()
+                error = None
+            except asyncio.CancelledError:
+                if time_remaining(self.default_deadline) <= 0:
+                    # The request's deadline passed while the upstream was silent
+                    increment(UPSTREAM_EVENTS, f"{self.name}_timeout")
+                    self.breaker.record_failure()
+                raise
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                error = e
+
+        if error is not None:
+            increment(UPSTREAM_EVENTS, f"{self.name}_exhausted")
+            raise UpstreamUnavailableError(
+                f"{self.name} unavailable: {type(error).__name__}",
+                max(self.breaker.retry_after(), 1.0),
+            ) from error
+        raise DeadlineExceededError(f"Deadline for {self.name} exceeded")
+
+    async def _attempt(self, attempt: Callable[[], Awaitable[T]], hedge: bool) -> T:
+        """
+        Run attempt, and a second one if the first is slower than usual
+        Returns the first result, or raises the last error if both fail
+        """
+        hedge_after = self.hedge_delay() if hedge else None
+        started = {}
+
+        def start() -> asyncio.Future:
+            task = asyncio.ensure_future(attempt())
+            started[task] = self.clock()
+            return task
+
+        pending = {start()}
+        try:
+            if hedge_after is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_after)
+                if not done:
+                    self.hedges += 1
+                    increment(UPSTREAM_EVENTS, f"{self.name}_hedge")
+                    pending.add(start())
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self.latencies.add(self.clock() - started[task])
+                        self.breaker.record_success()
+                        return task.result()
+                    error = task.exception()
+
+            if isinstance(error, Exception) and self.is_retryable(error):
+                self.breaker.record_failure()
+            else:
+                # The service answered, even if with an error
+                self.breaker.record_success()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+from typing import Any, List, Optional
+
+import orjson
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.app.metrics import timed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as is, compressing them is not worth it
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode_json(content: Any) -> bytes:
+    """
+    Serialize plain response content straight to UTF-8 JSON bytes
+    """
+    return orjson.dumps(content)
+
+
+def body_etag(body: bytes) -> str:
+    """
+    Strong ETag of an uncompressed body
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etags: List[str]) -> bool:
+    """
+    Check an If-None-Match header against the ETags of a response
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in etags:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick br or gzip from an Accept-Encoding header, preferring br when available
+    Returns None when the body should be sent uncompressed
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    def quality_of(coding: str) -> float:
+        return accepted.get(coding, accepted.get("*", 0.0))
+
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(candidates, key=quality_of)
+    return best if quality_of(best) > 0 else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def json_response(request: Request, content: Any) -> Response:
+    """
+    Build a compressed JSON response with a strong ETag
+    Answers 304 Not Modified when the client already has the same content
+    """
+    with timed("serialize"):
+        body = encode_json(content)
+    etag = body_etag(body)
+
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    # Each content coding is a different representation with its own strong ETag
+    representation_etag = f'{etag[:-1]}-{encoding}"' if encoding else etag
+    headers = {"ETag": representation_etag, "Vary": "Accept-Encoding"}
+
+    if etag_matches(request.headers.get("if-none-match"), [etag, representation_etag]):
+        return Response(status_code=304, headers=headers)
+
+    if encoding is not None:
+        with timed("compress"):
+            body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,173 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+from src.app.resilience import Resilience
+
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5.0))
+DEFAULT_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", 20.0))
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", 20))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", 16))
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Network errors, timeouts, throttling and server errors are worth retrying
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class UpstreamClient:
+    """
+    Async HTTP client for the holidayfinder API
+    Keeps a shared keep-alive connection pool and caps the number of requests in flight
+    Requests go through resilience, and transport can point it at a fake upstream
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        resilience: Optional[Resilience] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=connect_timeout,
+            pool=read_timeout,
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.max_concurrency = max_concurrency
+        self.resilience = resilience or Resilience(
+            "offers", is_retryable=is_retryable_error
+        )
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, limits=self.limits, transport=self.transport
+            )
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def get_bytes(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        on_attempt: Optional[Callable[[], None]] = None,
+    ) -> bytes:
+        """
+        GET the given URL and return the raw response body
+        Transient failures are retried and slow attempts hedged, on_attempt is
+        called for every request sent
+        Raises httpx.HTTPError on errors that are not retried, such as a 404,
+        and UpstreamUnavailableError when the upstream is given up on
+        """
+
+        async def attempt() -> bytes:
+            if on_attempt is not None:
+                on_attempt()
+            async with self.semaphore:
+                response = await self.client.get(url, params=params)
+                response.raise_for_status()
+                return response.content
+
+        return await self.resilience.call(attempt)
+
+    @asynccontextmanager
+    async def stream_bytes(
+        self,
+        url: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        on_attempt: Optional[Callable[[], None]] = None,
+    ) -> AsyncIterator[AsyncIterator[bytes]]:
+        """
+        GET the given URL and yield an async iterator over its body chunks
+        Opening the response is retried, but not hedged, and errors while
+        reading the body are not retried, on_attempt is called for every
+        request sent
+        Raises httpx.HTTPError on errors that are not retried, such as a 404,
+        and UpstreamUnavailableError when the upstream is given up on
+        """
+
+        async def open_response() -> httpx.Response:
+            if on_attempt is not None:
+                on_attempt()
+            # Held until the body is read, but not across the retry backoff
+            await self.semaphore.acquire()
+            try:
+                response = await self.client.send(
+                    self.client.build_request("GET", url), stream=True
+                )
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError:
+                    await response.aclose()
+                    raise
+            except BaseException:
+                self.semaphore.release()
+                raise
+            return response
+
+        response = await self.resilience.call(open_response, hedge=False)
+        try:
+            yield response.aiter_bytes(chunk_size)
+        finally:
+            await response.aclose()
+            self.semaphore.release()
+
+    async def warm_up(self, url: str) -> None:
+        """
+        Open a keep-alive connection to the host of url ahead of the first request
+        The response status is ignored, only network errors are raised
+        """
+        async with self.semaphore:
+            await self.client.head(url)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+
+
+_upstream_client: Optional[UpstreamClient] = None
+
+
+def get_upstream_client() -> UpstreamClient:
+    """
+    Return the process wide upstream client, creating it on first use
+    """
+    global _upstream_client
+    if _upstream_client is None:
+        _upstream_client = UpstreamClient()
+    return _upstream_client
+
+
+async def close_upstream_client() -> None:
+    global _upstream_client
+    if _upstream_client is not None:
+        await _upstream_client.aclose()
+    _upstream_client = None
@@ -0,0 +1,64 @@
+"""
+Optional work done at startup so the first request after a cold start
+does not pay for it
+
+Set WARMUP_ON_STARTUP=1 to run it before the app starts serving, bounded
+by WARMUP_TIMEOUT_SECONDS. Failed steps are logged and skipped.
+"""
+
+import asyncio
+import os
+import time
+
+from src.app.distance import get_geolocator
+from src.app.gazetteer import get_gazetteer
+from src.app.get_holiday_offers import LEAN_PARSE, base_url
+from src.app.offload import get_offload_pool
+from src.app.upstream_client import get_upstream_client
+from src.models.holiday_finder_api import ApiResponse
+
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "0") == "1"
+WARMUP_TIMEOUT_SECONDS = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", 10))
+
+
+def build_validators() -> None:
+    """
+    Build the deferred validators of the full upstream models when they are used
+    """
+    if not LEAN_PARSE:
+        ApiResponse.model_rebuild(force=True)
+
+
+async def load_geocoding() -> None:
+    """
+    Map the gazetteer and import the geocoder used for comparison addresses
+    """
+    get_gazetteer().records
+    await asyncio.to_thread(get_geolocator)
+
+
+async def warm_up(timeout: float = WARMUP_TIMEOUT_SECONDS) -> None:
+    """
+    Build validators, load geocoding, prime the upstream connection pool
+    and start the worker processes
+    """
+    start = time.perf_counter()
+    build_validators()
+    steps = {
+        "geocoding": load_geocoding(),
+        "upstream connection": get_upstream_client().warm_up(base_url),
+    }
+    offload_pool = get_offload_pool()
+    if offload_pool is not None:
+        steps["worker processes"] = asyncio.to_thread(offload_pool.start)
+    try:
+        results = await asyncio.wait_for(
+            asyncio.gather(*steps.values(), return_exceptions=True), timeout
+        )
+    except asyncio.TimeoutError:
+        print(f"Warm-up timed out after {timeout} seconds")
+        return
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            print(f"Warm-up of {name} failed: {result}")
+    print(f"Warm-up done in {time.perf_counter() - start:.2f} seconds")
@@ -0,0 +1,280 @@
+"""
+Run offer searches in bulk from the command line
+
+Searches are read from a JSON file holding a list of "queries" and/or a
+"matrix" of parameter values whose every combination is searched, both
+merged onto "defaults". Parameters are named like those of GET /api/offers,
+and a matrix axis whose values are objects sets several parameters at once:
+
+    {
+      "defaults": {"nights": [5, 6], "budget-max": 550, "limit": 20},
+      "matrix": {
+        "where-txt": ["Rome", "Prague", "Vienna"],
+        "window": [
+          {"start-date": "01/10/2025", "end-date": "31/10/2025"},
+          {"start-date": "01/11/2025", "end-date": "30/11/2025"}
+        ]
+      }
+    }
+
+Searches run concurrently, sharing the geocode and offers caches, and each
+result is appended to the output as a JSON line as soon as it is ready. With
+--resume, searches already answered in the output are skipped, and the lines
+of the failed ones are dropped from it before they are retried.
+
+Run with:
+    hotel-distance-sorter sweep.json -o results.jsonl --workers 8
+    hotel-distance-sorter sweep.json -o results.jsonl --resume
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import sys
+import typing
+from typing import BinaryIO, Iterator, Optional, Set, Tuple
+
+import orjson
+from fastapi import HTTPException
+
+from src.app.offers_cache import canonical_hash
+from src.app.offload import close_offload_pool
+from src.app.resilience import REQUEST_DEADLINE_SECONDS, request_deadline
+from src.app.response_encoding import encode_json
+from src.app.upstream_client import close_upstream_client
+from src.models.offer import OfferQuery
+from src.routes.offers import QueryPlan
+
+CLI_WORKERS = int(os.environ.get("CLI_WORKERS", 4))
+SWEEP_KEYS = {"defaults", "queries", "matrix"}
+
+
+def is_list_annotation(annotation) -> bool:
+    origins = [annotation, *typing.get_args(annotation)]
+    return any(typing.get_origin(origin) is list for origin in origins)
+
+
+# Parameters taking a list, which a single string value is wrapped into
+LIST_PARAMS = {
+    key
+    for name, field in OfferQuery.model_fields.items()
+    if is_list_annotation(field.annotation)
+    for key in (name, field.alias)
+    if key is not None
+}
+
+
+def load_sweep(path: str) -> dict:
+    """
+    Read and check the layout of a sweep file
+    """
+    with open(path, encoding="utf-8") as sweep_file:
+        sweep = json.load(sweep_file)
+    if not isinstance(sweep, dict) or not set(sweep) <= SWEEP_KEYS:
+        raise ValueError(f"A sweep holds only {', '.join(sorted(SWEEP_KEYS))}")
+    for name, values in sweep.get("matrix", {}).items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Matrix axis '{name}' must be a non empty list")
+    return sweep
+
+
+def count_sweep(sweep: dict) -> int:
+    matrix = sweep.get("matrix", {})
+    combinations = math.prod(len(values) for values in matrix.values())
+    return len(sweep.get("queries", [])) + (combinations if matrix else 0)
+
+
+def expand_sweep(sweep: dict) -> Iterator[Tuple[dict, OfferQuery]]:
+    """
+    Lazily yield the parameters of each search of a sweep, as given, and the
+    validated search
+    Raises pydantic.ValidationError on invalid parameters
+    """
+    defaults = sweep.get("defaults", {})
+
+    def build_query(params: dict) -> Tuple[dict, OfferQuery]:
+        params = {
+            name: [value] if name in LIST_PARAMS and isinstance(value, str) else value
+            for name, value in params.items()
+        }
+        return params, OfferQuery.model_validate(params)
+
+    for params in sweep.get("queries", []):
+        yield build_query({**defaults, **params})
+
+    matrix = sweep.get("matrix", {})
+    if not matrix:
+        return
+    for combination in itertools.product(*matrix.values()):
+        params = dict(defaults)
+        for name, value in zip(matrix, combination):
+            if isinstance(value, dict):
+                params.update(value)
+            else:
+                params[name] = value
+        yield build_query(params)
+
+
+def query_params(query: OfferQuery) -> dict:
+    return query.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+
+def query_id(params: dict) -> str:
+    """
+    Hash of the parameters given to a search, before the defaults filled in
+    on validation, such as today's dates, so that it stays the same on resume
+    """
+    return canonical_hash(params)[:16]
+
+
+def answered_ids(path: str) -> Set[str]:
+    """
+    Ids of the searches answered in an existing output
+    The lines of failed searches, which are retried, and a last line cut
+    short by an interruption are dropped from the file
+    """
+    ids: Set[str] = set()
+    if not os.path.exists(path):
+        return ids
+    kept_path = f"{path}.resume"
+    with open(path, "rb") as output, open(kept_path, "wb") as kept:
+        for line in output:
+            try:
+                record = orjson.loads(line) if line.endswith(b"\n") else None
+            except orjson.JSONDecodeError:
+                record = None
+            if record is None:
+                break
+            if "offers" in record:
+                ids.add(record["id"])
+                kept.write(line)
+    os.replace(kept_path, path)
+    return ids
+
+
+async def search(query: OfferQuery, deadline: float) -> list:
+    async with request_deadline(deadline):
+        return await QueryPlan(query).search()
+
+
+async def run_sweep(
+    queries: Iterator[Tuple[dict, OfferQuery]],
+    output: BinaryIO,
+    workers: int = CLI_WORKERS,
+    skip: Optional[Set[str]] = None,
+    total: Optional[int] = None,
+    deadline: float = REQUEST_DEADLINE_SECONDS,
+) -> dict:
+    """
+    Run the searches with at most workers in flight, writing one JSON line
+    per search as it completes
+    Searches whose id is in skip, and repeated ones, are not run
+    Returns the number of searches answered, failed and skipped
+    """
+    counts = {"answered": 0, "failed": 0, "skipped": 0}
+    seen = set(skip or ())
+    # Bounded, so the searches are expanded only as fast as they are run
+    pending: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+
+    async def produce():
+        for params, query in queries:
+            search_id = query_id(params)
+            if search_id in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(search_id)
+            await pending.put((search_id, query))
+        for _ in range(workers):
+            await pending.put(None)
+
+    async def work():
+        while (item := await pending.get()) is not None:
+            search_id, query = item
+            record = {"id": search_id, "query": query_params(query)}
+            try:
+                record["offers"] = await search(query, deadline)
+                counts["answered"] += 1
+            except HTTPException as e:
+                record["error"] = e.detail
+            except Exception as e:
+                record["error"] = str(e)
+            if "error" in record:
+                counts["failed"] += 1
+            output.write(encode_json(record) + b"\n")
+            output.flush()
+
+            done = sum(counts.values())
+            outcome = record.get("error") or f"{len(record['offers'])} offers"
+            print(
+                f"[{done}/{total if total is not None else '?'}]"
+                f" {', '.join(query.whereTxt)} {query.start_date}-{query.end_date}:"
+                f" {outcome}",
+                file=sys.stderr,
+            )
+
+    await asyncio.gather(produce(), *[work() for _ in range(workers)])
+    return counts
+
+
+async def run(args: argparse.Namespace) -> int:
+    sweep = load_sweep(args.sweep)
+    # Validate every search before running any
+    for _ in expand_sweep(sweep):
+        pass
+
+    skip = answered_ids(args.output) if args.resume else set()
+    try:
+        with open(args.output, "ab" if args.resume else "wb") as output:
+            counts = await run_sweep(
+                expand_sweep(sweep),
+                output,
+                args.workers,
+                skip,
+                count_sweep(sweep),
+                args.deadline,
+            )
+    finally:
+        await close_upstream_client()
+        close_offload_pool()
+
+    print(
+        f"{counts['answered']} answered, {counts['failed']} failed,"
+        f" {counts['skipped']} skipped, results in {args.output}",
+        file=sys.stderr,
+    )
+    return 1 if counts["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        epilog=__doc__.split("\n\n", 1)[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("sweep", help="JSON file of the searches to run")
+    parser.add_argument("-o", "--output", default="offers.jsonl", help="JSONL output")
+    parser.add_argument("-w", "--workers", type=int, default=CLI_WORKERS)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="append to the output, skipping the searches it already answers",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=REQUEST_DEADLINE_SECONDS,
+        help="seconds allowed for each search",
+    )
+    args = parser.parse_args()
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Empty file to make data a package
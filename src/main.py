@@ -1,10 +1,33 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
-from src.routes import offers
-from src.middleware.rate_limiter import RateLimiterMiddleware
+from src.routes import metrics, offers
+from src.middleware.rate_limiter import (
+    MemoryRateLimitStore,
+    RateLimiterMiddleware,
+    RedisRateLimitStore,
+)
+from src.middleware.server_timing import ServerTimingMiddleware
+from src.app.upstream_client import close_upstream_client
+from src.app.offload import close_offload_pool
+from src.app.prefetch import PREFETCH_ENABLED, get_prefetch_scheduler
+from src.app.warmup import WARMUP_ON_STARTUP, warm_up
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        await warm_up()
+    if PREFETCH_ENABLED:
+        get_prefetch_scheduler().start()
+    yield
+    await get_prefetch_scheduler().stop()
+    await close_upstream_client()
+    close_offload_pool()
+
 
-app = FastAPI(title="Holiday Finder API", version="0.1.0")
+app = FastAPI(title="Holiday Finder API", version="0.1.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -15,10 +38,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add rate limiting middleware (20 requests per minute per IP)
-app.add_middleware(RateLimiterMiddleware, calls=20, period=60)
+# Add rate limiting middleware (20 requests per minute per IP by default)
+# Set RATE_LIMIT_REDIS_URL to share the limit between instances
+rate_limit_redis_url = os.environ.get("RATE_LIMIT_REDIS_URL")
+app.add_middleware(
+    RateLimiterMiddleware,
+    calls=int(os.environ.get("RATE_LIMIT_CALLS", 20)),
+    period=int(os.environ.get("RATE_LIMIT_PERIOD_SECONDS", 60)),
+    store=(
+        RedisRateLimitStore.from_url(rate_limit_redis_url)
+        if rate_limit_redis_url
+        else MemoryRateLimitStore()
+    ),
+)
+
+# Added last so the timings include the other middlewares
+# Set METRICS_ENABLED=0 to turn off the Server-Timing header and /metrics data
+app.add_middleware(ServerTimingMiddleware)
 
 app.include_router(offers.router, prefix="/api", tags=["offers"])
+app.include_router(metrics.router, tags=["metrics"])
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8000)
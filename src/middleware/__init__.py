@@ -0,0 +1 @@
+# Empty file to make middleware a package
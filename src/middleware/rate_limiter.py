@@ -1,37 +1,201 @@
+import asyncio
+import math
 import time
-from collections import defaultdict, deque
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 
-class RateLimiterMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, calls: int = 20, period: int = 60):
-        super().__init__(app)
-        self.calls = calls
-        self.period = period
-        self.clients = defaultdict(deque)
+class RateLimitStore(Protocol):
+    async def hit(self, key: str, calls: int, period: int) -> Tuple[bool, float]:
+        """
+        Record a request for key if it is within the limit
+        Returns whether it is allowed, and otherwise the seconds to wait
+        """
+        ...
+
+
+def sliding_window_estimate(
+    previous_count: int, current_count: int, elapsed: float, period: int
+) -> float:
+    """
+    Approximate the number of requests in the last period from two fixed windows
+    """
+    return previous_count * (1 - elapsed / period) + current_count
+
+
+def retry_after_seconds(
+    previous_count: int, current_count: int, elapsed: float, calls: int, period: int
+) -> float:
+    """
+    Seconds until the sliding window estimate drops below the limit
+    """
+    if current_count < calls and previous_count > 0:
+        # Solve previous_count * (1 - t / period) + current_count < calls for t
+        return max(period * (1 - (calls - current_count) / previous_count) - elapsed, 0)
+    # The current window becomes the previous one and has to decay in turn
+    return period - elapsed + max(period * (1 - calls / max(current_count, 1)), 0)
+
+
+class MemoryRateLimitStore:
+    """
+    Per-process sliding window counters, three integers per client
+    Idle clients are evicted periodically
+    """
+
+    def __init__(
+        self,
+        cleanup_interval: float = 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.cleanup_interval = cleanup_interval
+        self.clock = clock
+        # key -> [window index, current window count, previous window count]
+        self.clients: Dict[str, List[int]] = {}
+        self._next_cleanup = clock() + cleanup_interval
+
+    def _evict_idle(self, window: int) -> None:
+        idle = [key for key, state in self.clients.items() if state[0] < window - 1]
+        for key in idle:
+            del self.clients[key]
+
+    async def hit(self, key: str, calls: int, period: int) -> Tuple[bool, float]:
+        now = self.clock()
+        window = int(now // period)
+        if now >= self._next_cleanup:
+            self._evict_idle(window)
+            self._next_cleanup = now + self.cleanup_interval
+
+        state = self.clients.get(key)
+        if state is None:
+            state = self.clients[key] = [window, 0, 0]
+        elif state[0] != window:
+            state[2] = state[1] if state[0] == window - 1 else 0
+            state[1] = 0
+            state[0] = window
+
+        elapsed = now - window * period
+        if sliding_window_estimate(state[2], state[1], elapsed, period) >= calls:
+            return False, retry_after_seconds(
+                state[2], state[1], elapsed, calls, period
+            )
+        state[1] += 1
+        return True, 0
 
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host
-        now = time.time()
 
-        # Clean old entries
-        while (
-            self.clients[client_ip] and self.clients[client_ip][0] <= now - self.period
+class RedisRateLimitStore:
+    """
+    Sliding window counters shared by every instance through Redis
+    A hit reads both windows with one MGET and counts itself with INCR and
+    EXPIRE in one MULTI, so a timeout never leaves a counter without expiry
+    Any client with the mget and pipeline methods of redis.asyncio can be
+    plugged in
+    While Redis fails or is slower than timeout, requests are counted by the
+    fallback store, per process, instead of failing
+    """
+
+    def __init__(
+        self,
+        client,
+        prefix: str = "ratelimit",
+        clock: Callable[[], float] = time.time,
+        timeout: float = 0.5,
+        fallback: Optional[RateLimitStore] = None,
+    ):
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+        self.timeout = timeout
+        self.fallback = (
+            fallback if fallback is not None else MemoryRateLimitStore(clock=clock)
+        )
+        self.failing = False
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisRateLimitStore":
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImportError(
+                "The redis package is required for a shared rate limit store"
+            )
+        return cls(redis.from_url(url), **kwargs)
+
+    async def hit(self, key: str, calls: int, period: int) -> Tuple[bool, float]:
+        try:
+            result = await asyncio.wait_for(self._hit(key, calls, period), self.timeout)
+        except Exception as e:
+            if not self.failing:
+                print(f"Rate limit store unavailable, counting per process: {e!r}")
+                self.failing = True
+            return await self.fallback.hit(key, calls, period)
+        if self.failing:
+            print("Rate limit store available again")
+            self.failing = False
+        return result
+
+    async def _hit(self, key: str, calls: int, period: int) -> Tuple[bool, float]:
+        now = self.clock()
+        window = int(now // period)
+        current_key = f"{self.prefix}:{key}:{window}"
+        previous_key = f"{self.prefix}:{key}:{window - 1}"
+        previous_count, current_count = (
+            int(count or 0)
+            for count in await self.client.mget(previous_key, current_key)
+        )
+
+        # Concurrent requests on other instances may slip in between the read
+        # and the increment, which can let a few extra requests through
+        elapsed = now - window * period
+        if (
+            sliding_window_estimate(previous_count, current_count, elapsed, period)
+            >= calls
         ):
-            self.clients[client_ip].popleft()
+            return False, retry_after_seconds(
+                previous_count, current_count, elapsed, calls, period
+            )
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, period * 2)
+            await pipe.execute()
+        return True, 0
 
-        # Check rate limit
-        if len(self.clients[client_ip]) >= self.calls:
-            return JSONResponse(
+
+class RateLimiterMiddleware:
+    """
+    Pure ASGI middleware limiting each client IP to calls requests per period
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        calls: int = 20,
+        period: int = 60,
+        store: Optional[RateLimitStore] = None,
+    ):
+        self.app = app
+        self.calls = calls
+        self.period = period
+        self.store = store if store is not None else MemoryRateLimitStore()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        allowed, retry_after = await self.store.hit(client_ip, self.calls, self.period)
+        if not allowed:
+            response = JSONResponse(
                 status_code=429,
-                content={"detail": f"Rate limit exceeded: {self.calls} requests per {self.period} seconds"}
+                content={
+                    "detail": f"Rate limit exceeded: {self.calls} requests per {self.period} seconds"
+                },
+                headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
             )
+            await response(scope, receive, send)
+            return
 
-        # Add current request
-        self.clients[client_ip].append(now)
-
-        # Process request
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
@@ -0,0 +1,41 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.app import metrics
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware collecting the stage timings of each request
+    Sends them back in a Server-Timing header and records the request duration
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not metrics.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = []
+        token = metrics.request_timings.set(timings)
+
+        async def send_with_timings(message: Message) -> None:
+            if message["type"] == "http.response.start" and timings:
+                header = metrics.server_timing_header(timings)
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", header.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        finally:
+            metrics.request_timings.reset(token)
+            # Labelled by endpoint function to keep unmatched paths out of the series
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            metrics.REQUEST_SECONDS.observe(endpoint, time.perf_counter() - start)
@@ -1,10 +1,20 @@
 from typing import Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from src.models.common import Coordinates
 
 
-class DestinationData(BaseModel):
+class DeferredModel(BaseModel):
+    """
+    Base of the full upstream models
+    Their validators are only built on first use, since the lean models
+    serve requests by default and building these slows down cold starts
+    """
+
+    model_config = ConfigDict(defer_build=True)
+
+
+class DestinationData(DeferredModel):
     small_photo: str
     about: str
     advices: list[str]
@@ -23,13 +33,13 @@ class DestinationData(BaseModel):
     market_id: int
 
 
-class Capacity(BaseModel):
+class Capacity(DeferredModel):
     adult: int
     child: int
     infant: int | None
 
 
-class Stickers(BaseModel):
+class Stickers(DeferredModel):
     lastMinute: bool | None = Field(default=None)
     weekend: bool | None = Field(default=None)
     nightFlight: bool | None = Field(default=None)
@@ -56,7 +66,7 @@ class Stickers(BaseModel):
     closeToChabad: bool | None = Field(default=None)
 
 
-class OfferData(BaseModel):
+class OfferData(DeferredModel):
     offerId: str
     hfOfferId: str
     outboundDate: str
@@ -74,13 +84,13 @@ class OfferData(BaseModel):
     created_at: str
 
 
-class Facility(BaseModel):
+class Facility(DeferredModel):
     name: str
     slug: str | None
     name_en: str
 
 
-class HotelData(BaseModel):
+class HotelData(DeferredModel):
     last_updated: str
     name: str
     board: str
@@ -112,7 +122,7 @@ class HotelData(BaseModel):
     location: dict[str, Any] | None = Field(default=None)
 
 
-class FlightData(BaseModel):
+class FlightData(DeferredModel):
     takeoff_hour: str
     landing_hour: str
     travel_duration_format: str
@@ -137,7 +147,7 @@ class FlightData(BaseModel):
     flightsInUse: list[str] | None
 
 
-class Offer(BaseModel):
+class Offer(DeferredModel):
     destinationData: DestinationData
     offer: OfferData
     hotel: HotelData
@@ -149,7 +159,7 @@ class Offer(BaseModel):
     extraTermsInfo: list[Any]
 
 
-class Pagination(BaseModel):
+class Pagination(DeferredModel):
     total_offers_count: int
     total_offers_pages: int
     current_offers_page: int
@@ -160,10 +170,10 @@ class Pagination(BaseModel):
     doWeNeedAggregate: Any | None
 
 
-class ApiData(BaseModel):
+class ApiData(DeferredModel):
     pagination: Pagination
     offers: list[Offer]
 
 
-class ApiResponse(BaseModel):
+class ApiResponse(DeferredModel):
     data: ApiData
@@ -0,0 +1,63 @@
+"""
+Slim projections of the holidayfinder API models
+
+Only the fields used by get_holiday_offers and the offers route are kept.
+Every other field of the upstream response is skipped while validating,
+so no Python objects are built for photos, facilities, debug info etc.
+The full models in holiday_finder_api remain available for debugging.
+"""
+
+from pydantic import BaseModel, Field
+
+from src.models.common import Coordinates
+
+
+class LeanDestinationData(BaseModel):
+    destinationId: int
+    coordinates: Coordinates
+    name: str
+    name_en: str
+
+
+class LeanOfferData(BaseModel):
+    hfOfferId: str
+    outboundDate: str
+    inboundDate: str
+    price: int
+    packageDeeplinkUrl: str
+
+
+class LeanHotelData(BaseModel):
+    name: str
+    rating: int
+    photos: list[str]
+    coordinates: Coordinates
+    provider_hotel_id: str | None = Field(default=None)
+
+
+class LeanFlightData(BaseModel):
+    company_name: str
+
+
+class LeanOffer(BaseModel):
+    destinationData: LeanDestinationData
+    offer: LeanOfferData
+    hotel: LeanHotelData
+    flight: LeanFlightData
+
+
+class LeanPagination(BaseModel):
+    total_offers_count: int
+    total_offers_pages: int
+    current_offers_page: int
+    limit: int
+    offset: int
+
+
+class LeanApiData(BaseModel):
+    pagination: LeanPagination
+    offers: list[LeanOffer]
+
+
+class LeanApiResponse(BaseModel):
+    data: LeanApiData
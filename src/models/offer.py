@@ -1,5 +1,20 @@
+from datetime import datetime, timedelta
+from typing import Dict, Literal, Optional, Union
 from src.models.holiday_finder_api import Offer
-from pydantic import BaseModel, Field
+from src.models.holiday_finder_api_lean import LeanOffer
+from src.models.offer_record import OfferRecord
+from pydantic import BaseModel, ConfigDict, Field
+
+AnyOffer = Union[Offer, LeanOffer, OfferRecord]
+
+MAX_DESTINATIONS = 10
+MAX_COMPARISON_ADDRESSES = 10
+MAX_PARETO_FRONTS = 10
+MAX_BATCH_QUERIES = 20
+# Distinct upstream searches and geocodes one batch may cause, so a single
+# rate limited request cannot fan out to every query's every destination
+MAX_BATCH_FETCHES = 20
+MAX_BATCH_GEOCODES = 20
 
 
 class Budget(BaseModel):
@@ -31,10 +46,109 @@ class OfferOptions(BaseModel):
     engine: OfferEngineOptions
 
 
-class OfferWithCalculatedFields(Offer):
-    nights_amount: int
-    google_maps_url: str
+class OfferQuery(BaseModel):
+    """
+    Parameters of an offers search, named like the query parameters of
+    GET /api/offers
+    """
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    comparison_address: list[str] | None = Field(
+        default=None, max_length=MAX_COMPARISON_ADDRESSES, alias="comparison-address"
+    )
+    locale: str = Field(default="he")
+    currency: str = Field(default="USD")
+    fromwhere: list[str] = Field(default=["TLV"], alias="from-where")
+    market: int = Field(default=4)
+    whereTxt: list[str] = Field(
+        default=["Rome"], max_length=MAX_DESTINATIONS, alias="where-txt"
+    )
+    start_date: str = Field(
+        default_factory=lambda: datetime.now().strftime("%d/%m/%Y"),
+        alias="start-date",
+    )
+    end_date: str = Field(
+        default_factory=lambda: (datetime.now() + timedelta(days=7)).strftime(
+            "%d/%m/%Y"
+        ),
+        alias="end-date",
+    )
+    who: OfferEngineWhoOption = Field(default=OfferEngineWhoOption())
+    budget_min: int = Field(default=0, ge=0, alias="budget-min")
+    budget_max: int = Field(default=1000, ge=1, alias="budget-max")
+    flex: bool = Field(default=False)
+    nights: list[int] = Field(default=[1, 2], min_length=1)
+    limit: int | None = Field(default=None, ge=1)
+    max_distance: float | None = Field(default=None, gt=0, alias="max-distance")
+    nearest: int | None = Field(default=None, ge=1)
+    rank_by: Literal["min", "mean"] = Field(default="min", alias="rank-by")
+    rank: Literal["distance", "pareto"] = Field(default="distance")
+    pareto_rating: bool = Field(default=False, alias="pareto-rating")
+    fronts: int = Field(default=1, ge=1, le=MAX_PARETO_FRONTS)
+    group_by: Literal["hotel"] | None = Field(default=None, alias="group-by")
+
+
+class BatchOffersRequest(BaseModel):
+    # Sub-queries keyed by an id of the client's choosing
+    queries: Dict[str, OfferQuery] = Field(min_length=1, max_length=MAX_BATCH_QUERIES)
+
+
+class EnrichedOffer:
+    """
+    An upstream offer with its calculated fields attached
+    Wraps the validated offer instead of copying it, and exposes its parts
+    under the same names as Offer
+    """
+
+    __slots__ = (
+        "source",
+        "nights_amount",
+        "_google_maps_url",
+        "distance_m",
+        "distances_m",
+        "pareto_front",
+    )
+
+    def __init__(self, source: AnyOffer, nights_amount: int):
+        self.source = source
+        self.nights_amount = nights_amount
+        self._google_maps_url: Optional[str] = None
+        self.distance_m: Optional[float] = None
+        # Distance to each compared point when ranking against several
+        self.distances_m: Optional[list[float]] = None
+        # Index of the Pareto front the offer belongs to when ranked by front
+        self.pareto_front: Optional[int] = None
+
+    @property
+    def destinationData(self):
+        return self.source.destinationData
+
+    @property
+    def offer(self):
+        return self.source.offer
+
+    @property
+    def hotel(self):
+        return self.source.hotel
+
+    @property
+    def flight(self):
+        return self.source.flight
+
+    @property
+    def google_maps_url(self) -> str:
+        # Built on first access, so only rows that are returned pay for it
+        if self._google_maps_url is None:
+            coordinates = self.source.hotel.coordinates
+            self._google_maps_url = generate_google_maps_url(
+                coordinates.latitude, coordinates.longitude
+            )
+        return self._google_maps_url
 
 
-class OfferWithDistance(OfferWithCalculatedFields):
-    distance_m: float
+def generate_google_maps_url(latitude: float, longitude: float) -> str:
+    """
+    Generate Google Maps link for hotel using coordinates
+    """
+    return f"https://www.google.com/maps/place/{latitude},{longitude}"
@@ -0,0 +1,50 @@
+"""
+Plain tuple counterparts of the lean offer models
+
+Offers parsed in a worker process come back as columns, and are rebuilt
+as these tuples, which are much cheaper to create than models. They expose
+the same attribute names as LeanOffer, photos only hold the first photo.
+"""
+
+from typing import NamedTuple, Optional
+
+
+class CoordinatesRecord(NamedTuple):
+    latitude: float
+    longitude: float
+
+
+class DestinationRecord(NamedTuple):
+    destinationId: int
+    coordinates: CoordinatesRecord
+    name: str
+    name_en: str
+
+
+class OfferDataRecord(NamedTuple):
+    hfOfferId: str
+    outboundDate: str
+    inboundDate: str
+    price: int
+    packageDeeplinkUrl: str
+
+
+class HotelRecord(NamedTuple):
+    name: str
+    rating: int
+    photos: list
+    coordinates: CoordinatesRecord
+    provider_hotel_id: Optional[str]
+
+
+class FlightRecord(NamedTuple):
+    company_name: str
+
+
+class OfferRecord(NamedTuple):
+    destinationData: DestinationRecord
+    offer: OfferDataRecord
+    hotel: HotelRecord
+    flight: FlightRecord
+    # Calculated by the worker along with the parse
+    nights_amount: int
@@ -0,0 +1,85 @@
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel
+
+
+class OfferRow(BaseModel):
+    """
+    Row of the offers response
+    Declared for the API schema only, rows are serialized from plain dicts
+    """
+
+    name: str
+    url: str
+    rating: int
+    image_url: Optional[str] = None
+    google_maps_url: str
+    nights_amount: int
+    start_date: str
+    end_date: str
+    distance_meters: int
+    # Only present when several comparison addresses are given
+    distances_meters: Optional[Dict[str, int]] = None
+    # Only present with rank=pareto, 0 for the frontier
+    pareto_front: Optional[int] = None
+    price: int
+    airline: str
+
+
+class HotelOfferRow(BaseModel):
+    """
+    Offer nested under its hotel in a row of the offers response grouped by hotel
+    """
+
+    url: str
+    nights_amount: int
+    start_date: str
+    end_date: str
+    price: int
+    airline: str
+
+
+class DateRange(BaseModel):
+    start_date: str
+    end_date: str
+
+
+class HotelRow(BaseModel):
+    """
+    Row of the offers response grouped by hotel
+    Declared for the API schema only, rows are serialized from plain dicts
+    """
+
+    name: str
+    rating: int
+    image_url: Optional[str] = None
+    google_maps_url: str
+    distance_meters: int
+    # Only present when several comparison addresses are given
+    distances_meters: Optional[Dict[str, int]] = None
+    # Only present with rank=pareto, the front of the hotel's cheapest offer
+    pareto_front: Optional[int] = None
+    min_price: int
+    max_price: int
+    # Merged periods covered by the hotel's offers
+    available_dates: List[DateRange]
+    # Cheapest first
+    offers: List[HotelOfferRow]
+
+
+class QueryError(BaseModel):
+    status_code: int
+    detail: str
+
+
+class BatchQueryResult(BaseModel):
+    """
+    Offers of a batch sub-query, or the error it failed with
+    """
+
+    offers: Optional[List[Union[OfferRow, HotelRow]]] = None
+    error: Optional[QueryError] = None
+
+
+class BatchOffersResponse(BaseModel):
+    results: Dict[str, BatchQueryResult]
@@ -1,29 +1,409 @@
-from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Query
-from typing import List
-from src.app.offers_distance_sorter import add_distance_to_offers
+import asyncio
+import math
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import Dict, List, Literal, Optional, Tuple, Union
+from src.app.offers_distance_sorter import (
+    add_distance_matrix_to_offers,
+    group_offers_by_hotel,
+)
+from src.app.pareto import rank_offers_pareto
+from src.app.prefetch import record_search
+from src.models.common import Coordinates
 from src.models.offer import (
+    MAX_BATCH_FETCHES,
+    MAX_BATCH_GEOCODES,
+    MAX_COMPARISON_ADDRESSES,
+    MAX_DESTINATIONS,
+    MAX_PARETO_FRONTS,
+    BatchOffersRequest,
     Budget,
+    EnrichedOffer,
     OfferEngineOptions,
     OfferEngineWhoOption,
     OfferOptions,
-    OfferWithDistance,
+    OfferQuery,
+)
+from src.models.response import BatchOffersResponse, HotelRow, OfferRow
+from src.app.get_holiday_offers import (
+    fetch_offers_data,
+    get_holiday_offers,
+    holiday_offers_cache_key,
+    process_offers,
 )
-from src.app.get_holiday_offers import get_holiday_offers
-from src.app.distance import geocode_address
+from src.app.admission import OverloadedError, get_admission_controller
+from src.app.metrics import OFFER_COUNTS, observe, timed
+from src.app.resilience import UpstreamUnavailableError, request_deadline
+from src.app.response_encoding import json_response
+from src.app.geocode_cache import geocode_address_cached, normalize_address
 import traceback
 
 router = APIRouter(prefix="/offers")
 
 
-@router.get("")
+def unique_values(values: List[str], key) -> List[str]:
+    """
+    Drop repeated values, keeping the first spelling of each
+    """
+    seen = set()
+    unique = []
+    for value in values:
+        if key(value) not in seen:
+            seen.add(key(value))
+            unique.append(value)
+    return unique
+
+
+def upstream_unavailable(error: UpstreamUnavailableError) -> HTTPException:
+    return HTTPException(
+        status_code=error.status_code,
+        detail=f"Upstream unavailable: {error}",
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+def overloaded(error: OverloadedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+
+def serialize_offer(
+    offer: EnrichedOffer, distance_labels: Optional[List[str]] = None
+) -> dict:
+    """
+    Build the response row for an offer
+    With distance_labels, the distance to each compared address is included
+    """
+    row = {
+        "name": offer.hotel.name,
+        "url": offer.offer.packageDeeplinkUrl,
+        "rating": offer.hotel.rating,
+        "image_url": offer.hotel.photos[0] if len(offer.hotel.photos) > 0 else None,
+        "google_maps_url": offer.google_maps_url,
+        "nights_amount": offer.nights_amount,
+        "start_date": offer.offer.outboundDate,
+        "end_date": offer.offer.inboundDate,
+        "distance_meters": int(offer.distance_m),
+    }
+    if distance_labels is not None:
+        row["distances_meters"] = {
+            label: int(distance)
+            for label, distance in zip(distance_labels, offer.distances_m)
+        }
+    if offer.pareto_front is not None:
+        row["pareto_front"] = offer.pareto_front
+    row["price"] = offer.offer.price
+    row["airline"] = offer.flight.company_name
+    return row
+
+
+# Offers in a response share a small set of dates
+@lru_cache(maxsize=4096)
+def parse_date(text: str) -> Optional[date]:
+    try:
+        return datetime.strptime(text, "%d/%m/%Y").date()
+    except (ValueError, TypeError):
+        return None
+
+
+def available_dates(offers: List[EnrichedOffer]) -> List[dict]:
+    """
+    Merge the stays of offers into the periods they cover, in date order
+    """
+    stays = []
+    for outbound, inbound in {
+        (offer.offer.outboundDate, offer.offer.inboundDate) for offer in offers
+    }:
+        start, end = parse_date(outbound), parse_date(inbound)
+        if start is not None and end is not None:
+            stays.append((start, end))
+    periods: List[List[date]] = []
+    for start, end in sorted(stays):
+        if periods and start <= periods[-1][1]:
+            periods[-1][1] = max(periods[-1][1], end)
+        else:
+            periods.append([start, end])
+    return [
+        {"start_date": start.strftime("%d/%m/%Y"), "end_date": end.strftime("%d/%m/%Y")}
+        for start, end in periods
+    ]
+
+
+def serialize_hotel(
+    offers: List[EnrichedOffer], distance_labels: Optional[List[str]] = None
+) -> dict:
+    """
+    Build the response row for the offers of a hotel, cheapest first
+    The hotel's fields and distances are read once, from its cheapest offer
+    """
+    cheapest = offers[0]
+    hotel = cheapest.hotel
+    row = {
+        "name": hotel.name,
+        "rating": hotel.rating,
+        "image_url": hotel.photos[0] if len(hotel.photos) > 0 else None,
+        "google_maps_url": cheapest.google_maps_url,
+        "distance_meters": int(cheapest.distance_m),
+    }
+    if distance_labels is not None:
+        row["distances_meters"] = {
+            label: int(distance)
+            for label, distance in zip(distance_labels, cheapest.distances_m)
+        }
+    if cheapest.pareto_front is not None:
+        row["pareto_front"] = cheapest.pareto_front
+    row["min_price"] = cheapest.offer.price
+    row["max_price"] = offers[-1].offer.price
+    row["available_dates"] = available_dates(offers)
+    row["offers"] = [
+        {
+            "url": offer.offer.packageDeeplinkUrl,
+            "nights_amount": offer.nights_amount,
+            "start_date": offer.offer.outboundDate,
+            "end_date": offer.offer.inboundDate,
+            "price": offer.offer.price,
+            "airline": offer.flight.company_name,
+        }
+        for offer in offers
+    ]
+    return row
+
+
+class QueryPlan:
+    """
+    Destinations and comparison addresses of a query
+    Without an address, each offer is compared with its own city center
+    """
+
+    def __init__(self, query: OfferQuery):
+        self.query = query
+        self.destinations = unique_values(query.whereTxt, str.lower)
+        self.addresses = unique_values(
+            query.comparison_address or [], normalize_address
+        )
+        self.fallback_to_city_center = len(self.addresses) == 0
+        if self.fallback_to_city_center:
+            if len(self.destinations) == 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Comparison address is required unless where-txt param is provided",
+                )
+            self.addresses = self.destinations
+
+    def geocode_key(self, address: str) -> Tuple[str, bool]:
+        return normalize_address(address), self.fallback_to_city_center
+
+    def geocode_error(self, address: str, error: Exception) -> HTTPException:
+        print("".join(traceback.format_exception(error)))
+        if isinstance(error, UpstreamUnavailableError):
+            return upstream_unavailable(error)
+        return HTTPException(
+            status_code=500,
+            detail=f"Failed to find address: {address}. {'Try explicitly entering an address' if self.fallback_to_city_center else 'Try a different address'}",
+        )
+
+    async def geocode(self) -> List[Coordinates]:
+        """
+        Geocode the comparison addresses, or the destinations' centers
+        Raises HTTPException when one of them cannot be found
+        """
+        with timed("geocode"):
+            geocode_results = await asyncio.gather(
+                *[
+                    geocode_address_cached(
+                        address, is_city=self.fallback_to_city_center
+                    )
+                    for address in self.addresses
+                ],
+                return_exceptions=True,
+            )
+        for address, result in zip(self.addresses, geocode_results):
+            if isinstance(result, Exception):
+                raise self.geocode_error(address, result)
+        return list(geocode_results)
+
+    async def search(self) -> List[dict]:
+        """
+        Geocode, fetch and rank the offers of the query
+        """
+        comparison_coordinates = await self.geocode()
+        try:
+            offer_options = self.offer_options()
+            for destination_options in offer_options:
+                record_search(destination_options)
+
+            offers_per_destination = await asyncio.gather(
+                *[
+                    get_holiday_offers(
+                        destination_options,
+                        near=self.near(comparison_coordinates, i),
+                        max_distance_m=self.query.max_distance,
+                        nearest_hotels=self.query.nearest,
+                    )
+                    for i, destination_options in enumerate(offer_options)
+                ]
+            )
+            return self.rank(comparison_coordinates, offers_per_destination)
+
+        except UpstreamUnavailableError:
+            raise
+        except Exception as e:
+            print(traceback.format_exc())
+            raise HTTPException(
+                status_code=500, detail=f"Failed to fetch offers: {str(e)}"
+            )
+
+    def offer_options(self) -> List[OfferOptions]:
+        query = self.query
+        return [
+            OfferOptions(
+                locale=query.locale,
+                currency=query.currency,
+                fromwhere=query.fromwhere,
+                engine=OfferEngineOptions(
+                    market=query.market,
+                    when={
+                        "flexible": {
+                            "start": query.start_date,
+                            "end": query.end_date,
+                            "min": min(query.nights),
+                            "max": max(query.nights),
+                            "nights": query.nights,
+                        },
+                    },
+                    who=query.who,
+                    whereTxt=[destination],
+                    budget=Budget(min=query.budget_min, max=query.budget_max),
+                    flex=query.flex,
+                ),
+            )
+            for destination in self.destinations
+        ]
+
+    def near(
+        self, comparison_coordinates: List[Coordinates], destination_index: int
+    ) -> List[Coordinates]:
+        if self.fallback_to_city_center:
+            return [comparison_coordinates[destination_index]]
+        return comparison_coordinates
+
+    def distance_labels(self) -> Optional[List[str]]:
+        """
+        Labels of the per address distances, when several addresses are compared
+        """
+        if len(self.addresses) > 1 and not self.fallback_to_city_center:
+            return self.addresses
+        return None
+
+    def rank(
+        self,
+        comparison_coordinates: List[Coordinates],
+        offers_per_destination: List[List[Optional[EnrichedOffer]]],
+    ) -> List[dict]:
+        """
+        Rank the processed offers of every destination and serialize them
+        """
+        query = self.query
+        valid_offers = []
+        destination_index = []
+        for i, offers in enumerate(offers_per_destination):
+            for offer in offers:
+                if offer is not None:
+                    valid_offers.append(offer)
+                    destination_index.append(i)
+
+        if query.group_by == "hotel":
+            return self.rank_hotels(
+                comparison_coordinates, valid_offers, destination_index
+            )
+
+        offers_with_distance = add_distance_matrix_to_offers(
+            valid_offers,
+            comparison_coordinates,
+            aggregate=query.rank_by,
+            limit=query.limit if query.rank == "distance" else None,
+            point_index=destination_index if self.fallback_to_city_center else None,
+        )
+        if query.rank == "pareto":
+            # Fronts trade price against the ranking distance, cheapest first
+            with timed("sort"):
+                offers_with_distance = rank_offers_pareto(
+                    offers_with_distance,
+                    query.pareto_rating,
+                    query.fronts,
+                    query.limit,
+                )
+        if not offers_with_distance:
+            return []
+
+        distance_labels = self.distance_labels()
+        observe(OFFER_COUNTS, "response", len(offers_with_distance))
+        with timed("serialize"):
+            return [
+                serialize_offer(offer, distance_labels)
+                for offer in offers_with_distance
+            ]
+
+    def rank_hotels(
+        self,
+        comparison_coordinates: List[Coordinates],
+        valid_offers: List[EnrichedOffer],
+        destination_index: List[int],
+    ) -> List[dict]:
+        """
+        Rank the hotels of the processed offers and serialize each with its
+        offers nested, limit applying to hotels
+        """
+        query = self.query
+        hotels = group_offers_by_hotel(
+            valid_offers,
+            comparison_coordinates,
+            aggregate=query.rank_by,
+            limit=query.limit if query.rank == "distance" else None,
+            point_index=destination_index if self.fallback_to_city_center else None,
+        )
+        if query.rank == "pareto":
+            # Hotels are ranked by the fronts of their cheapest offers
+            with timed("sort"):
+                hotels_by_cheapest = {id(hotel[0]): hotel for hotel in hotels}
+                hotels = [
+                    hotels_by_cheapest[id(offer)]
+                    for offer in rank_offers_pareto(
+                        [hotel[0] for hotel in hotels],
+                        query.pareto_rating,
+                        query.fronts,
+                        query.limit,
+                    )
+                ]
+        if not hotels:
+            return []
+
+        observe(OFFER_COUNTS, "response", sum(len(hotel) for hotel in hotels))
+        with timed("serialize"):
+            return [serialize_hotel(hotel, self.distance_labels()) for hotel in hotels]
+
+
+@router.get(
+    "",
+    response_model=List[Union[OfferRow, HotelRow]],
+    response_model_exclude_none=True,
+)
 async def get_offers(
-    comparison_address: str | None = Query(default=None, alias="comparison-address"),
+    request: Request,
+    comparison_address: List[str] | None = Query(
+        default=None, max_length=MAX_COMPARISON_ADDRESSES, alias="comparison-address"
+    ),
     locale: str = Query(default="he"),
     currency: str = Query(default="USD"),
     fromwhere: List[str] = Query(default=["TLV"], alias="from-where"),
     market: int = Query(default=4),
-    whereTxt: List[str] = Query(default=["Rome"], max_length=1, alias="where-txt"),
+    whereTxt: List[str] = Query(
+        default=["Rome"], max_length=MAX_DESTINATIONS, alias="where-txt"
+    ),
     start_date: str = Query(
         default=datetime.now().strftime("%d/%m/%Y"), alias="start-date"
     ),
@@ -36,104 +416,217 @@ async def get_offers(
     budget_max: int = Query(default=1000, ge=1, alias="budget-max"),
     flex: bool = Query(default=False),
     nights: list[int] = Query(default=[1, 2]),
+    limit: int | None = Query(default=None, ge=1),
+    max_distance: float | None = Query(default=None, gt=0, alias="max-distance"),
+    nearest: int | None = Query(default=None, ge=1),
+    rank_by: Literal["min", "mean"] = Query(default="min", alias="rank-by"),
+    rank: Literal["distance", "pareto"] = Query(default="distance"),
+    pareto_rating: bool = Query(default=False, alias="pareto-rating"),
+    fronts: int = Query(default=1, ge=1, le=MAX_PARETO_FRONTS),
+    group_by: Literal["hotel"] | None = Query(default=None, alias="group-by"),
 ):
     """
     Get holiday offers based on filters
     """
-    print(
-        "Starting get_offers with params:",
-        {
-            "comparison_address": comparison_address,
-            "locale": locale,
-            "currency": currency,
-            "fromwhere": fromwhere,
-            "market": market,
-            "whereTxt": whereTxt,
-            "start_date": start_date,
-            "end_date": end_date,
-            "who": who,
-            "budget_min": budget_min,
-            "budget_max": budget_max,
-            "flex": flex,
-            "nights": nights,
-        },
-    )
-
-    fallback_to_city_center = False
-    if comparison_address is None:
-        if len(whereTxt) == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="Comparison address is required unless where-txt param is provided",
-            )
-        city = whereTxt[0]
-        comparison_address = city
-        fallback_to_city_center = True
+    params = {
+        "comparison_address": comparison_address,
+        "locale": locale,
+        "currency": currency,
+        "fromwhere": fromwhere,
+        "market": market,
+        "whereTxt": whereTxt,
+        "start_date": start_date,
+        "end_date": end_date,
+        "who": who,
+        "budget_min": budget_min,
+        "budget_max": budget_max,
+        "flex": flex,
+        "nights": nights,
+        "limit": limit,
+        "max_distance": max_distance,
+        "nearest": nearest,
+        "rank_by": rank_by,
+        "rank": rank,
+        "pareto_rating": pareto_rating,
+        "fronts": fronts,
+        "group_by": group_by,
+    }
+    print("Starting get_offers with params:", params)
+    plan = QueryPlan(OfferQuery.model_construct(**params))
 
+    admission = get_admission_controller()
     try:
-        comparison_coordinates = geocode_address(
-            comparison_address, is_city=fallback_to_city_center
-        )
-    except Exception:
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to find address: {comparison_address}. {'Try explicitly entering an address' if fallback_to_city_center else 'Try a different address'}",
-        )
+        async with request_deadline():
+            async with admission.admit(admission.estimate(plan.offer_options())):
+                return json_response(request, await plan.search())
+    except UpstreamUnavailableError as e:
+        raise upstream_unavailable(e)
+    except OverloadedError as e:
+        raise overloaded(e)
+
 
+def query_error(error: HTTPException) -> dict:
+    return {"error": {"status_code": error.status_code, "detail": error.detail}}
+
+
+@router.post(
+    "/batch", response_model=BatchOffersResponse, response_model_exclude_none=True
+)
+async def get_offers_batch(request: Request, batch: BatchOffersRequest):
+    """
+    Run several offer queries at once, sharing their geocoding and upstream
+    fetches, and return the results keyed like the queries
+    """
+    print(f"Starting get_offers_batch with {len(batch.queries)} queries")
+    offer_options = batch_offer_options(batch)
+    admission = get_admission_controller()
     try:
-        offer_options = OfferOptions(
-            locale=locale,
-            currency=currency,
-            fromwhere=fromwhere,
-            engine=OfferEngineOptions(
-                market=market,
-                when={
-                    "flexible": {
-                        "start": start_date,
-                        "end": end_date,
-                        "min": min(nights),
-                        "max": max(nights),
-                        "nights": nights,
-                    },
-                },
-                who=who,
-                whereTxt=whereTxt,
-                budget=Budget(min=budget_min, max=budget_max),
-                flex=flex,
+        async with request_deadline():
+            async with admission.admit(admission.estimate(offer_options)):
+                return await serve_batch(request, batch)
+    except UpstreamUnavailableError as e:
+        raise upstream_unavailable(e)
+    except OverloadedError as e:
+        raise overloaded(e)
+
+
+def batch_offer_options(batch: BatchOffersRequest) -> List[OfferOptions]:
+    """
+    Destinations searched by the valid queries of a batch
+    Raises HTTPException when the batch needs more distinct upstream searches
+    or geocodes than a single request may make
+    """
+    offer_options = []
+    geocode_keys = set()
+    for query in batch.queries.values():
+        try:
+            plan = QueryPlan(query)
+        except HTTPException:
+            # Reported in the query's result
+            continue
+        offer_options.extend(plan.offer_options())
+        geocode_keys.update(plan.geocode_key(address) for address in plan.addresses)
+
+    fetch_keys = {
+        holiday_offers_cache_key(destination_options)
+        for destination_options in offer_options
+    }
+    if len(fetch_keys) > MAX_BATCH_FETCHES or len(geocode_keys) > MAX_BATCH_GEOCODES:
+        raise HTTPException(
+            status_code=422,
+            detail=(
+                f"A batch may search at most {MAX_BATCH_FETCHES} distinct"
+                f" destinations and geocode {MAX_BATCH_GEOCODES} distinct addresses,"
+                f" this one needs {len(fetch_keys)} and {len(geocode_keys)}"
             ),
         )
+    return offer_options
+
+
+async def serve_batch(request: Request, batch: BatchOffersRequest):
+    """
+    Geocode and fetch what the queries of a batch need once, then rank each
+    """
+    results: Dict[str, dict] = {}
+    plans: Dict[str, QueryPlan] = {}
+    for query_id, query in batch.queries.items():
+        try:
+            plans[query_id] = QueryPlan(query)
+        except HTTPException as e:
+            results[query_id] = query_error(e)
 
-        offers = get_holiday_offers(offer_options)
-        valid_offers = [offer for offer in offers if offer is not None]
+    # Each distinct address is geocoded once
+    addresses = {}
+    for plan in plans.values():
+        for address in plan.addresses:
+            addresses.setdefault(plan.geocode_key(address), address)
+    with timed("geocode"):
+        geocoded = dict(
+            zip(
+                addresses,
+                await asyncio.gather(
+                    *[
+                        geocode_address_cached(address, is_city=is_city)
+                        for (_, is_city), address in addresses.items()
+                    ],
+                    return_exceptions=True,
+                ),
+            )
+        )
 
-        offers_with_distance: list[OfferWithDistance] = add_distance_to_offers(
-            valid_offers, comparison_coordinates
+    # Each distinct upstream query is fetched once, queries differing only in
+    # limit, distance or ranking options share the fetched offers
+    coordinates: Dict[str, List[Coordinates]] = {}
+    fetches: Dict[str, OfferOptions] = {}
+    fetch_keys: Dict[str, List[str]] = {}
+    for query_id, plan in list(plans.items()):
+        plan_coordinates = [
+            geocoded[plan.geocode_key(address)] for address in plan.addresses
+        ]
+        failed = next(
+            (
+                (address, result)
+                for address, result in zip(plan.addresses, plan_coordinates)
+                if isinstance(result, Exception)
+            ),
+            None,
         )
-        if not offers_with_distance:
-            return []
+        if failed is not None:
+            results[query_id] = query_error(plan.geocode_error(*failed))
+            del plans[query_id]
+            continue
+        coordinates[query_id] = plan_coordinates
+        # Keys are taken before fetching, which may teach the gazetteer the
+        # destination ids they are built from
+        fetch_keys[query_id] = []
+        for destination_options in plan.offer_options():
+            record_search(destination_options)
+            key = holiday_offers_cache_key(destination_options)
+            fetch_keys[query_id].append(key)
+            fetches.setdefault(key, destination_options)
 
-        offers_with_distance.sort(key=lambda x: x.distance_m)
+    fetched = dict(
+        zip(
+            fetches,
+            await asyncio.gather(
+                *[
+                    fetch_offers_data(destination_options, filter_destination=True)
+                    for destination_options in fetches.values()
+                ],
+                return_exceptions=True,
+            ),
+        )
+    )
 
-        return [
-            {
-                "name": offer.hotel.name,
-                "url": offer.offer.packageDeeplinkUrl,
-                "rating": offer.hotel.rating,
-                "image_url": offer.hotel.photos[0]
-                if len(offer.hotel.photos) > 0
-                else None,
-                "google_maps_url": offer.google_maps_url,
-                "nights_amount": offer.nights_amount,
-                "start_date": offer.offer.outboundDate,
-                "end_date": offer.offer.inboundDate,
-                "distance_meters": int(offer.distance_m),
-                "price": offer.offer.price,
-                "airline": offer.flight.company_name,
+    for query_id, plan in plans.items():
+        try:
+            offers_per_destination = []
+            for i, key in enumerate(fetch_keys[query_id]):
+                city_offers = fetched[key]
+                if isinstance(city_offers, Exception):
+                    raise city_offers
+                offers_per_destination.append(
+                    process_offers(
+                        city_offers,
+                        plan.near(coordinates[query_id], i),
+                        plan.query.max_distance,
+                        plan.query.nearest,
+                    )
+                )
+            results[query_id] = {
+                "offers": plan.rank(coordinates[query_id], offers_per_destination)
             }
-            for offer in offers_with_distance
-        ]
+        except UpstreamUnavailableError as e:
+            results[query_id] = query_error(upstream_unavailable(e))
+        except Exception as e:
+            print(traceback.format_exc())
+            results[query_id] = query_error(
+                HTTPException(
+                    status_code=500, detail=f"Failed to fetch offers: {str(e)}"
+                )
+            )
 
-    except Exception as e:
-        print(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=f"Failed to fetch offers: {str(e)}")
+    return json_response(
+        request,
+        {"results": {query_id: results[query_id] for query_id in batch.queries}},
+    )
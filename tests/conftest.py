@@ -0,0 +1,49 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_upstream import FakeUpstream, FakeUpstreamConfig
+from src.app import geocode_cache, offers_cache, upstream_client
+from src.app.geocode_cache import GeocodeCache
+from src.app.offers_cache import OffersCache
+from src.app.upstream_client import UpstreamClient
+from src.models.common import Coordinates
+from src.routes import offers
+
+
+@pytest.fixture
+def fake_upstream(monkeypatch) -> FakeUpstream:
+    """
+    The offers API served by the fake upstream, in process and without
+    latency, and every address geocoded to the center of Vienna
+    """
+    upstream = FakeUpstream(
+        FakeUpstreamConfig(
+            offers=150, hotels=30, latency_median_ms=0, geocode_latency_ms=0
+        )
+    )
+    monkeypatch.setattr(
+        upstream_client,
+        "_upstream_client",
+        UpstreamClient(transport=httpx.ASGITransport(upstream)),
+    )
+    monkeypatch.setattr(offers_cache, "_offers_cache", OffersCache())
+    monkeypatch.setattr(geocode_cache, "_geocode_cache", GeocodeCache(path=None))
+    monkeypatch.setattr(
+        geocode_cache,
+        "geocode_address",
+        lambda address, is_city=False: Coordinates(latitude=48.2082, longitude=16.3738),
+    )
+    return upstream
+
+
+@pytest.fixture
+def api(fake_upstream) -> TestClient:
+    """
+    The offers routes, without the rate limiter and other middlewares
+    """
+    app = FastAPI()
+    app.include_router(offers.router, prefix="/api")
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,230 @@
+import asyncio
+
+import pytest
+
+from src.app.admission import (
+    EXPECTED_OFFERS_SMOOTHING,
+    AdmissionController,
+    Cost,
+    OverloadedError,
+)
+from src.app.get_holiday_offers import holiday_offers_cache_key
+from src.models.offer import OfferEngineOptions, OfferOptions
+
+
+class FakeCache:
+    def __init__(self):
+        self.values = {}
+
+    def peek(self, key):
+        return self.values.get(key)
+
+
+def options(destination: str) -> OfferOptions:
+    return OfferOptions(
+        engine=OfferEngineOptions(
+            when={"flexible": {"start": "01/11/2026", "end": "30/11/2026"}},
+            whereTxt=[destination],
+        )
+    )
+
+
+def make_controller(**kwargs) -> AdmissionController:
+    options = {
+        "memory_budget": 1_000,
+        "offers_budget": 10,
+        "max_queue": 4,
+        "max_wait": 5,
+        "enabled": True,
+        "cache": FakeCache(),
+        **kwargs,
+    }
+    return AdmissionController(**options)
+
+
+async def hold(controller, cost, released: asyncio.Event, admitted: list, name):
+    async with controller.admit(cost):
+        admitted.append(name)
+        await released.wait()
+
+
+def assert_idle(controller):
+    assert controller.memory_in_flight == 0
+    assert controller.offers_in_flight == 0
+    assert controller.queue_depth == 0
+
+
+def test_waiters_are_admitted_first_in_first_out():
+    controller = make_controller()
+    admitted = []
+
+    async def scenario():
+        release_big, release_rest = asyncio.Event(), asyncio.Event()
+        big = asyncio.ensure_future(
+            hold(controller, Cost(0, 8), release_big, admitted, "big")
+        )
+        await asyncio.sleep(0)
+        rest = [
+            asyncio.ensure_future(
+                hold(controller, Cost(0, offers), release_rest, admitted, name)
+            )
+            for name, offers in [("first", 5), ("second", 1), ("third", 1)]
+        ]
+        await asyncio.sleep(0)
+        # "second" would fit, but may not pass "first"
+        assert admitted == ["big"]
+        assert controller.queue_depth == 3
+
+        release_big.set()
+        await asyncio.sleep(0.01)
+        assert admitted == ["big", "first", "second", "third"]
+        assert controller.offers_in_flight == 7
+        release_rest.set()
+        await asyncio.gather(big, *rest)
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_full_queue_rejects_at_once():
+    controller = make_controller(max_queue=1)
+
+    async def scenario():
+        released = asyncio.Event()
+        holders = [
+            asyncio.ensure_future(hold(controller, Cost(0, 10), released, [], i))
+            for i in range(2)
+        ]
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError, match="queue full"):
+            async with controller.admit(Cost(0, 1)):
+                pass
+        released.set()
+        await asyncio.gather(*holders)
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_wait_is_bounded():
+    controller = make_controller(max_wait=0.05)
+
+    async def scenario():
+        released = asyncio.Event()
+        holder = asyncio.ensure_future(hold(controller, Cost(0, 10), released, [], 0))
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError, match="timeout") as error:
+            async with controller.admit(Cost(0, 1)):
+                pass
+        assert error.value.retry_after >= 1
+        assert controller.queue_depth == 0
+        released.set()
+        await holder
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_cancelled_waiter_lets_the_next_one_through():
+    controller = make_controller()
+    admitted = []
+
+    async def scenario():
+        release_holder, release_small = asyncio.Event(), asyncio.Event()
+        holder = asyncio.ensure_future(
+            hold(controller, Cost(0, 5), release_holder, admitted, "holder")
+        )
+        await asyncio.sleep(0)
+        large = asyncio.ensure_future(
+            hold(controller, Cost(0, 10), asyncio.Event(), admitted, "large")
+        )
+        small = asyncio.ensure_future(
+            hold(controller, Cost(0, 5), release_small, admitted, "small")
+        )
+        await asyncio.sleep(0)
+        assert controller.queue_depth == 2
+
+        large.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await large
+        await asyncio.sleep(0)
+        assert admitted == ["holder", "small"]
+        assert controller.offers_in_flight == 10
+        release_holder.set()
+        release_small.set()
+        await asyncio.gather(holder, small)
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_waiter_cancelled_as_it_is_admitted_gives_its_cost_back():
+    controller = make_controller()
+    admitted = []
+
+    async def scenario():
+        released = asyncio.Event()
+        released.set()
+        async with controller.admit(Cost(0, 10)):
+            waiter = asyncio.ensure_future(
+                hold(controller, Cost(0, 10), released, admitted, "waiter")
+            )
+            await asyncio.sleep(0)
+        # Leaving the block has admitted the waiter, which has not run yet
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admitted == []
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_costs_are_clamped_to_the_budgets():
+    controller = make_controller()
+
+    async def scenario():
+        async with controller.admit(Cost(5_000, 50)):
+            assert controller.memory_in_flight == 1_000
+            assert controller.offers_in_flight == 10
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_disabled_controller_admits_everything():
+    controller = make_controller(enabled=False)
+
+    async def scenario():
+        async with controller.admit(Cost(5_000, 50)):
+            async with controller.admit(Cost(5_000, 50)):
+                assert controller.offers_in_flight == 0
+
+    asyncio.run(scenario())
+    assert_idle(controller)
+
+
+def test_expected_offers_learn_from_completed_fetches_only():
+    controller = make_controller(offers_budget=100_000, memory_budget=10**10)
+    cache = controller.cache
+    rome, vienna = holiday_offers_cache_key(options("Rome")), holiday_offers_cache_key(
+        options("Vienna")
+    )
+    cache.values[rome] = [None] * 30
+    expected = controller.expected_offers
+
+    cost = controller.estimate([options("Rome"), options("Vienna"), options("Rome")])
+    assert cost.offers == 30 + round(expected) + 30
+    assert cost.fetches == (vienna,)
+    # Looking the cache up while estimating teaches nothing
+    controller.estimate([options("Rome")])
+    assert controller.expected_offers == expected
+
+    async def scenario():
+        async with controller.admit(cost):
+            cache.values[vienna] = [None] * 50
+
+    asyncio.run(scenario())
+    assert controller.expected_offers == pytest.approx(
+        expected + EXPECTED_OFFERS_SMOOTHING * (50 - expected)
+    )
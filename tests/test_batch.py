@@ -0,0 +1,56 @@
+import pytest
+from fastapi import HTTPException
+
+from src.models.offer import MAX_BATCH_FETCHES, BatchOffersRequest
+from src.routes.offers import batch_offer_options
+
+
+def query(destinations, **params):
+    return {
+        "where-txt": destinations,
+        "start-date": "01/11/2026",
+        "end-date": "30/11/2026",
+        **params,
+    }
+
+
+def test_shared_destinations_count_once_against_the_fetch_cap():
+    batch = BatchOffersRequest.model_validate(
+        {"queries": {str(i): query(["Vienna", "Rome"], limit=i + 1) for i in range(20)}}
+    )
+    assert len(batch_offer_options(batch)) == 40
+
+
+@pytest.mark.parametrize(
+    "queries",
+    [
+        {str(i): query([f"Town {i}", f"Village {i}"]) for i in range(11)},
+        {
+            str(i): query(["Vienna"], **{"comparison-address": [f"{i} a", f"{i} b"]})
+            for i in range(11)
+        },
+    ],
+)
+def test_batches_fanning_out_too_far_are_rejected(queries):
+    batch = BatchOffersRequest.model_validate({"queries": queries})
+    with pytest.raises(HTTPException) as error:
+        batch_offer_options(batch)
+    assert error.value.status_code == 422
+    assert str(MAX_BATCH_FETCHES) in error.value.detail
+
+
+def test_batch_of_destinations_unknown_to_the_gazetteer(api, fake_upstream):
+    # Fetching teaches the gazetteer their ids, which changes their cache keys
+    response = api.post(
+        "/api/offers/batch",
+        json={
+            "queries": {
+                "a": query(["Atlantis"], limit=3),
+                "b": query(["Atlantis", "El Dorado"], limit=2),
+            }
+        },
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [len(results[key]["offers"]) for key in "ab"] == [3, 2]
+    assert fake_upstream.requests > 0
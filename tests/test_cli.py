@@ -0,0 +1,64 @@
+import asyncio
+import io
+
+import orjson
+
+from src import cli
+
+
+def run_sweep(sweep: dict, output, skip=None) -> dict:
+    return asyncio.run(
+        cli.run_sweep(cli.expand_sweep(sweep), output, workers=2, skip=skip)
+    )
+
+
+def test_ids_hash_the_parameters_as_written():
+    sweep = {
+        "defaults": {"limit": 5},
+        "queries": [{"where-txt": "Rome"}, {"where-txt": ["Rome"]}],
+        "matrix": {"where-txt": ["Rome", "Vienna"]},
+    }
+    ids = [cli.query_id(params) for params, _ in cli.expand_sweep(sweep)]
+    assert ids[0] == ids[1] == ids[2] != ids[3]
+    assert ids[0] == cli.query_id({"limit": 5, "where-txt": ["Rome"]})
+
+
+def test_resume_drops_failed_and_cut_short_lines(tmp_path, monkeypatch):
+    failing = {"Prague"}
+
+    async def search(query, deadline):
+        if query.whereTxt[0] in failing:
+            raise ValueError("upstream failed")
+        return [{"name": query.whereTxt[0]}]
+
+    monkeypatch.setattr(cli, "search", search)
+    sweep = {"matrix": {"where-txt": ["Rome", "Prague", "Vienna"]}}
+    path = tmp_path / "results.jsonl"
+    with open(path, "wb") as output:
+        assert run_sweep(sweep, output)["failed"] == 1
+    with open(path, "ab") as output:
+        output.write(b'{"id": "cut')
+
+    failing.clear()
+    skip = cli.answered_ids(str(path))
+    assert len(skip) == 2
+    with open(path, "ab") as output:
+        counts = run_sweep(sweep, output, skip)
+    assert counts == {"answered": 1, "failed": 0, "skipped": 2}
+
+    records = [orjson.loads(line) for line in path.read_bytes().splitlines()]
+    assert sorted(record["offers"][0]["name"] for record in records) == [
+        "Prague",
+        "Rome",
+        "Vienna",
+    ]
+
+
+def test_repeated_searches_run_once(monkeypatch):
+    async def search(query, deadline):
+        return []
+
+    monkeypatch.setattr(cli, "search", search)
+    sweep = {"queries": [{"where-txt": "Rome"}] * 3}
+    counts = run_sweep(sweep, io.BytesIO())
+    assert counts == {"answered": 1, "failed": 0, "skipped": 2}
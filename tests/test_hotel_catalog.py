@@ -0,0 +1,70 @@
+from src.app import get_holiday_offers
+from src.app.get_holiday_offers import select_offers_near
+from src.app.hotel_catalog import CatalogHotel, HotelCatalog
+from src.models.common import Coordinates
+from src.models.offer_record import (
+    CoordinatesRecord,
+    DestinationRecord,
+    FlightRecord,
+    HotelRecord,
+    OfferDataRecord,
+    OfferRecord,
+)
+
+VIENNA = Coordinates(latitude=48.2082, longitude=16.3738)
+
+
+def make_offer(hotel_id: str, latitude: float, longitude: float) -> OfferRecord:
+    coordinates = CoordinatesRecord(latitude, longitude)
+    return OfferRecord(
+        DestinationRecord(21, CoordinatesRecord(48.2, 16.37), "Vienna", "Vienna"),
+        OfferDataRecord(f"offer-{hotel_id}", "01/11/2026", "04/11/2026", 500, ""),
+        HotelRecord(f"Hotel {hotel_id}", 4, [], coordinates, hotel_id),
+        FlightRecord("Airline"),
+        3,
+    )
+
+
+def hotel(key: str, latitude: float = 48.2, longitude: float = 16.37):
+    return CatalogHotel(key, key, latitude, longitude)
+
+
+def test_least_recently_seen_hotels_are_evicted():
+    catalog = HotelCatalog(max_size=2)
+    catalog.add(hotel("a"))
+    catalog.add(hotel("b"))
+    catalog.add(hotel("a"))
+    catalog.add(hotel("c"))
+    assert list(catalog.hotels) == ["a", "c"]
+    assert set().union(*catalog.cells.values()) == {"a", "c"}
+
+
+def test_moved_hotel_is_reindexed_and_empty_cells_dropped():
+    catalog = HotelCatalog()
+    catalog.add(hotel("a", 48.2, 16.37))
+    catalog.add(hotel("a", 41.9, 12.5))
+    assert len(catalog.cells) == 1
+    assert catalog.within(VIENNA, 10_000) == {}
+    assert "a" in catalog.within(Coordinates(latitude=41.9, longitude=12.5), 10)
+
+
+def test_offers_of_evicted_hotels_are_still_selected(monkeypatch):
+    catalog = HotelCatalog(max_size=3)
+    monkeypatch.setattr(get_holiday_offers, "get_hotel_catalog", lambda: catalog)
+    near = [make_offer(str(i), 48.2082 + i * 1e-4, 16.3738) for i in range(3)]
+    far = make_offer("far", 48.5, 16.3738)
+    catalog.add_offers([*near, far])
+    # Other searches fill the catalog, evicting the hotels of near
+    catalog.add_offers(make_offer(f"x{i}", 41.9, 12.5) for i in range(3))
+
+    selected = select_offers_near([*near, far], [VIENNA], max_distance_m=1_000)
+    assert selected == near
+    selected = select_offers_near([*near, far], [VIENNA], nearest_hotels=2)
+    assert selected == near[:2]
+
+
+def test_more_hotels_than_the_catalog_holds_are_all_considered(monkeypatch):
+    catalog = HotelCatalog(max_size=2)
+    monkeypatch.setattr(get_holiday_offers, "get_hotel_catalog", lambda: catalog)
+    offers = [make_offer(str(i), 48.2082 + i * 1e-4, 16.3738) for i in range(5)]
+    assert select_offers_near(offers, [VIENNA], max_distance_m=1_000) == offers
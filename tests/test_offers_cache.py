@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from src.app.offers_cache import OffersCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Fetcher:
+    """
+    Fetch returning "value-<n>" for the n-th call, held until released
+    """
+
+    def __init__(self, error: Exception = None):
+        self.calls = 0
+        self.error = error
+        self.released = asyncio.Event()
+        self.released.set()
+
+    async def __call__(self):
+        self.calls += 1
+        calls = self.calls
+        await self.released.wait()
+        if self.error is not None:
+            raise self.error
+        return f"value-{calls}"
+
+
+def make_cache(clock, **kwargs) -> OffersCache:
+    options = {"ttl": 10, "stale_ttl": 20, "error_ttl": 30, "clock": clock, **kwargs}
+    return OffersCache(**options)
+
+
+def test_fresh_entries_are_served_without_fetching():
+    cache = make_cache(FakeClock())
+    fetch = Fetcher()
+
+    async def scenario():
+        assert await cache.get_or_fetch("a", fetch) == "value-1"
+        assert await cache.get_or_fetch("a", fetch) == "value-1"
+
+    asyncio.run(scenario())
+    assert fetch.calls == 1
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = make_cache(FakeClock())
+    fetch = Fetcher()
+
+    async def scenario():
+        fetch.released.clear()
+        waiting = [
+            asyncio.ensure_future(cache.get_or_fetch("a", fetch)) for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        fetch.released.set()
+        return await asyncio.gather(*waiting)
+
+    assert asyncio.run(scenario()) == ["value-1"] * 5
+    assert fetch.calls == 1
+
+
+def test_stale_entry_is_served_while_one_refresh_runs():
+    clock = FakeClock()
+    cache = make_cache(clock)
+    fetch = Fetcher()
+
+    async def scenario():
+        await cache.get_or_fetch("a", fetch)
+        clock.now = 15
+        fetch.released.clear()
+        assert await cache.get_or_fetch("a", fetch) == "value-1"
+        assert await cache.get_or_fetch("a", fetch) == "value-1"
+        await asyncio.sleep(0)
+        assert fetch.calls == 2
+
+        fetch.released.set()
+        await asyncio.sleep(0)
+        assert await cache.get_or_fetch("a", fetch) == "value-2"
+
+    asyncio.run(scenario())
+    assert fetch.calls == 2
+    assert cache.entry_age("a") == 0
+
+
+def test_failed_refresh_keeps_serving_the_stale_entry(capsys):
+    clock = FakeClock()
+    cache = make_cache(clock)
+
+    async def scenario():
+        await cache.get_or_fetch("a", Fetcher())
+        clock.now = 15
+        failing = Fetcher(RuntimeError("upstream down"))
+        assert await cache.get_or_fetch("a", failing) == "value-1"
+        await asyncio.sleep(0)
+        assert failing.calls == 1
+        assert await cache.get_or_fetch("a", failing) == "value-1"
+
+    asyncio.run(scenario())
+    assert cache.entry_age("a") == 15
+    assert "refresh failed" in capsys.readouterr().out
+
+
+def test_expired_entry_is_served_only_when_fetching_fails():
+    clock = FakeClock()
+    cache = make_cache(clock)
+    failing = Fetcher(RuntimeError("upstream down"))
+
+    async def scenario():
+        await cache.get_or_fetch("a", Fetcher())
+        clock.now = 35
+        assert await cache.get_or_fetch("a", failing) == "value-1"
+        assert failing.calls == 1
+        # Past the error period the entry is dropped
+        clock.now = 60
+        with pytest.raises(RuntimeError):
+            await cache.get_or_fetch("a", failing)
+
+    asyncio.run(scenario())
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes():
+    cache = make_cache(FakeClock(), max_bytes=100)
+
+    async def get(key, size=40):
+        return await cache.get_or_fetch(key, Fetcher(), lambda value: size)
+
+    async def scenario():
+        await get("a")
+        await get("b")
+        await get("a")
+        # Peeking leaves the LRU order alone
+        cache.peek("b")
+        await get("c")
+        assert list(cache._entries) == ["a", "c"]
+        assert cache.current_bytes == 80
+
+        # Larger than the whole cache, served but not stored
+        assert await get("d", 200) == "value-1"
+        assert cache.peek("d") is None
+        assert cache.current_bytes == 80
+
+    asyncio.run(scenario())
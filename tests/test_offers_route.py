@@ -0,0 +1,169 @@
+from src.app.get_holiday_offers import destination_filter, process_offers
+from src.models.common import Coordinates
+from src.models.offer import OfferEngineOptions, OfferOptions, OfferQuery
+from src.models.offer_record import (
+    CoordinatesRecord,
+    DestinationRecord,
+    FlightRecord,
+    HotelRecord,
+    OfferDataRecord,
+    OfferRecord,
+)
+from src.routes.offers import QueryPlan
+
+VIENNA = Coordinates(latitude=48.2, longitude=16.37)
+
+
+def search_params(**params) -> dict:
+    return {
+        "where-txt": "Vienna",
+        "start-date": "01/11/2026",
+        "end-date": "30/11/2026",
+        **params,
+    }
+
+
+def make_offer(
+    destination_id: int,
+    name_en: str,
+    hotel_id: str = "h",
+    price: int = 500,
+    latitude: float = 48.2,
+    longitude: float = 16.37,
+    outbound: str = "01/11/2026",
+    inbound: str = "04/11/2026",
+) -> OfferRecord:
+    return OfferRecord(
+        DestinationRecord(destination_id, CoordinatesRecord(48.2, 16.37), "", name_en),
+        OfferDataRecord(f"offer-{hotel_id}-{price}", outbound, inbound, price, ""),
+        HotelRecord(
+            f"Hotel {hotel_id}", 4, [], CoordinatesRecord(latitude, longitude), hotel_id
+        ),
+        FlightRecord("Airline"),
+        3,
+    )
+
+
+def rank_hotels(offers_per_destination, **params) -> list:
+    """
+    Rank offers grouped by hotel, each destination compared with its center
+    """
+    plan = QueryPlan(
+        OfferQuery.model_validate(
+            search_params(
+                **{
+                    "where-txt": ["Vienna", "Wien Umgebung"][
+                        : len(offers_per_destination)
+                    ],
+                    "group-by": "hotel",
+                    **params,
+                }
+            )
+        )
+    )
+    return plan.rank(
+        [VIENNA] * len(offers_per_destination),
+        [process_offers(offers) for offers in offers_per_destination],
+    )
+
+
+def test_destination_filter_matches_aliases_by_id():
+    keep = destination_filter(
+        OfferOptions(
+            engine=OfferEngineOptions(
+                when={"flexible": {"start": "01/11/2026", "end": "30/11/2026"}},
+                whereTxt=["Wien"],
+            )
+        )
+    )
+    assert keep(make_offer(21, "Vienna"))
+    assert not keep(make_offer(19, "Rome"))
+
+
+def test_alias_search_returns_offers(api):
+    for alias in ["Wien", "וינה"]:
+        response = api.get("/api/offers", params=search_params(**{"where-txt": alias}))
+        assert response.status_code == 200
+        assert len(response.json()) > 0
+
+
+def test_offers_are_grouped_per_hotel_and_destination():
+    rows = rank_hotels(
+        [
+            [make_offer(21, "Vienna", "a", 300), make_offer(21, "Vienna", "a", 200)],
+            [make_offer(22, "Wien Umgebung", "a", 250)],
+        ]
+    )
+    assert [(row["min_price"], row["max_price"]) for row in rows] == [
+        (200, 300),
+        (250, 250),
+    ]
+    assert [offer["price"] for offer in rows[0]["offers"]] == [200, 300]
+
+
+def test_hotels_at_the_same_distance_are_ordered_by_cheapest_price():
+    rows = rank_hotels(
+        [
+            [
+                make_offer(21, "Vienna", "a", 400),
+                make_offer(21, "Vienna", "b", 100),
+                make_offer(21, "Vienna", "c", 900, latitude=48.25),
+                make_offer(21, "Vienna", "b", 700),
+            ]
+        ]
+    )
+    assert [row["name"] for row in rows] == ["Hotel b", "Hotel a", "Hotel c"]
+
+
+def test_available_dates_merge_overlapping_stays():
+    rows = rank_hotels(
+        [
+            [
+                make_offer(
+                    21, "Vienna", "a", 100, outbound="05/11/2026", inbound="08/11/2026"
+                ),
+                make_offer(
+                    21, "Vienna", "a", 200, outbound="01/11/2026", inbound="05/11/2026"
+                ),
+                make_offer(
+                    21, "Vienna", "a", 300, outbound="01/11/2026", inbound="05/11/2026"
+                ),
+                make_offer(
+                    21, "Vienna", "a", 400, outbound="20/11/2026", inbound="23/11/2026"
+                ),
+            ]
+        ]
+    )
+    assert rows[0]["available_dates"] == [
+        {"start_date": "01/11/2026", "end_date": "08/11/2026"},
+        {"start_date": "20/11/2026", "end_date": "23/11/2026"},
+    ]
+
+
+def test_limit_applies_to_hotels_after_grouping():
+    rows = rank_hotels(
+        [
+            [
+                make_offer(21, "Vienna", hotel, price, latitude=48.2 + distance)
+                for distance, hotel in [(0.0, "a"), (0.01, "b"), (0.02, "c")]
+                for price in (100, 200)
+            ]
+        ],
+        limit=2,
+    )
+    assert [row["name"] for row in rows] == ["Hotel a", "Hotel b"]
+    assert [len(row["offers"]) for row in rows] == [2, 2]
+
+
+def test_grouped_search_returns_a_row_per_hotel(api):
+    response = api.get(
+        "/api/offers", params=search_params(**{"group-by": "hotel", "limit": 5})
+    )
+    assert response.status_code == 200
+    rows = response.json()
+    assert len(rows) == 5
+    assert len({row["name"] for row in rows}) == 5
+    assert sum(len(row["offers"]) for row in rows) > 5
+    assert [row["distance_meters"] for row in rows] == sorted(
+        row["distance_meters"] for row in rows
+    )
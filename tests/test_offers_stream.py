@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.sample_payload import load_sample_bytes
+from src.app.offers_stream import OffersStreamError, parse_offers_stream
+
+
+async def chunked(body: bytes, size: int):
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+def parse(body: bytes, size: int, **kwargs):
+    return asyncio.run(parse_offers_stream(chunked(body, size), **kwargs))
+
+
+def small_body() -> bytes:
+    """
+    A response with two offers, a non-ASCII hotel name and numbers that can
+    end exactly on a chunk boundary
+    """
+    sample = json.loads(load_sample_bytes())["data"]
+    offer = sample["offers"][0]
+    offers = []
+    for i, price in enumerate([1234, 56789]):
+        copy = json.loads(json.dumps(offer))
+        copy["offer"]["hfOfferId"] = f"offer-{i}"
+        copy["offer"]["price"] = price
+        copy["hotel"]["name"] = "מלון ויה"
+        offers.append(copy)
+    data = {
+        "pagination": dict(sample["pagination"], total_offers_count=2),
+        "offers": offers,
+        "bestOutOf": 12.5,
+    }
+    return json.dumps({"data": data, "success": True}, ensure_ascii=False).encode()
+
+
+@pytest.mark.parametrize("size", [7, 61, 4096, 10**7])
+def test_sample_parses_the_same_at_any_chunk_size(size):
+    body = load_sample_bytes()
+    expected = json.loads(body)["data"]
+    parsed = parse(body, size)
+    assert [offer.offer.hfOfferId for offer in parsed.offers] == [
+        offer["offer"]["hfOfferId"] for offer in expected["offers"]
+    ]
+    assert parsed.pagination.total_offers_count == (
+        expected["pagination"]["total_offers_count"]
+    )
+
+
+@pytest.mark.parametrize("lean", [True, False])
+def test_single_byte_chunks_split_numbers_and_utf8(lean):
+    parsed = parse(small_body(), 1, lean=lean)
+    assert [offer.offer.price for offer in parsed.offers] == [1234, 56789]
+    assert all(offer.hotel.name == "מלון ויה" for offer in parsed.offers)
+
+
+@pytest.mark.parametrize("number, cut", [(b"1234", 2), (b"12.5", 2), (b"12.5", 3)])
+def test_number_cut_by_a_chunk_boundary_is_read_whole(number, cut):
+    # 1234 is a price, 12.5 the bestOutOf value following the offers
+    body = small_body()
+    boundary = body.index(number) + cut
+    parsed = asyncio.run(parse_offers_stream(chunked_at(body, [boundary]), lean=True))
+    assert [offer.offer.price for offer in parsed.offers] == [1234, 56789]
+
+
+async def chunked_at(body: bytes, boundaries):
+    start = 0
+    for end in [*boundaries, len(body)]:
+        yield body[start:end]
+        start = end
+
+
+def test_keep_filters_offers_as_they_are_read():
+    parsed = parse(small_body(), 13, keep=lambda offer: offer.offer.price > 2000)
+    assert [offer.offer.hfOfferId for offer in parsed.offers] == ["offer-1"]
+
+
+def test_truncated_body_raises():
+    body = small_body()
+    with pytest.raises((OffersStreamError, json.JSONDecodeError)):
+        parse(body[: len(body) // 2], 64)
+
+
+def test_missing_pagination_raises():
+    body = json.dumps({"data": {"offers": []}, "success": True}).encode()
+    with pytest.raises(OffersStreamError):
+        parse(body, 5)
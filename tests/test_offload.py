@@ -0,0 +1,109 @@
+import asyncio
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from benchmarks.sample_payload import load_sample_bytes
+from src.app import get_holiday_offers, upstream_client
+from src.app.offload import OffloadedPage, OffloadPool
+from src.models.offer import OfferEngineOptions, OfferOptions
+
+SHM_PATH = "/dev/shm"
+
+pytestmark = pytest.mark.skipif(
+    not os.path.isdir(SHM_PATH), reason="shared memory blocks are not listed"
+)
+
+
+def slow_keep(offer) -> bool:
+    time.sleep(0.02)
+    return True
+
+
+def shared_blocks() -> set:
+    return {name for name in os.listdir(SHM_PATH) if name.startswith("psm_")}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = OffloadPool(workers=1)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_parsed_page_is_read_and_released(pool):
+    before = shared_blocks()
+    page = asyncio.run(pool.parse_page(load_sample_bytes()))
+    assert len(page.offers) == 27
+    assert page.offers[0].offer.hfOfferId.startswith("m4d21")
+    assert shared_blocks() == before
+
+
+def test_block_of_a_cancelled_parse_is_released(pool):
+    before = shared_blocks()
+
+    async def cancel_while_parsing():
+        task = asyncio.ensure_future(
+            pool.parse_page(load_sample_bytes(), keep=slow_keep)
+        )
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_while_parsing())
+    # The single worker takes jobs in order, so once this one is back the
+    # cancelled page has been written and handed to its done-callback
+    pool.executor.submit(os.getpid).result()
+    assert shared_blocks() == before
+
+
+def kill_worker(pool: OffloadPool) -> None:
+    pid = pool.executor.submit(os.getpid).result()
+    os.kill(pid, signal.SIGKILL)
+
+
+def test_pool_is_replaced_after_a_worker_dies():
+    pool = OffloadPool(workers=1)
+    pool.start()
+    try:
+        broken = pool.executor
+        kill_worker(pool)
+        with pytest.raises(BrokenProcessPool):
+            asyncio.run(pool.parse_page(load_sample_bytes()))
+        assert pool.executor is not broken
+        page = asyncio.run(pool.parse_page(load_sample_bytes()))
+        assert len(page.offers) == 27
+    finally:
+        pool.shutdown()
+
+
+def test_page_of_a_dead_worker_is_parsed_in_process(fake_upstream, monkeypatch):
+    pool = OffloadPool(workers=1)
+    pool.start()
+    monkeypatch.setattr(get_holiday_offers, "get_offload_pool", lambda: pool)
+    monkeypatch.setattr(get_holiday_offers, "OFFLOAD_MIN_BYTES", 0)
+    client = upstream_client.get_upstream_client()
+    offer_options = OfferOptions(
+        engine=OfferEngineOptions(
+            when={"flexible": {"start": "01/11/2026", "end": "30/11/2026"}},
+            whereTxt=["Vienna"],
+        )
+    )
+
+    async def fetch_page():
+        return await get_holiday_offers.fetch_offers_page(
+            offer_options, 50, 0, client, lean=True, stream=False
+        )
+
+    try:
+        kill_worker(pool)
+        assert len(asyncio.run(fetch_page()).offers) == 50
+        # The next page goes to the new pool
+        assert isinstance(asyncio.run(fetch_page()), OffloadedPage)
+    finally:
+        pool.shutdown()
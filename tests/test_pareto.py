@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from src.app.pareto import pareto_layers
+
+
+def dominates(a, b) -> bool:
+    return all(x <= y for x, y in zip(a, b)) and a != b
+
+
+def brute_force_layers(points, max_layers):
+    remaining = list(range(len(points)))
+    layers = []
+    while remaining and len(layers) < max_layers:
+        front = [
+            i
+            for i in remaining
+            if not any(dominates(points[j], points[i]) for j in remaining)
+        ]
+        layers.append(front)
+        remaining = [i for i in remaining if i not in front]
+    return layers
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("use_rating", [False, True])
+def test_layers_match_a_brute_force_dominance_check(seed, use_rating):
+    rng = np.random.default_rng(seed)
+    count = int(rng.integers(1, 120))
+    # Few distinct values, so ties and equal points are common
+    price = rng.integers(0, 20, count).astype(np.float64)
+    distance = rng.integers(0, 20, count).astype(np.float64)
+    rating = rng.integers(1, 6, count).astype(np.float64) if use_rating else None
+    third = -rating if use_rating else np.zeros(count)
+    points = list(zip(price.tolist(), distance.tolist(), third.tolist()))
+
+    layers = pareto_layers(price, distance, rating, max_layers=4)
+
+    expected = brute_force_layers(points, 4)
+    assert [sorted(layer) for layer in layers] == [sorted(e) for e in expected]
+    for layer in layers:
+        prices = [price[i] for i in layer]
+        assert prices == sorted(prices)
+
+
+def test_arbitrary_third_values():
+    rng = np.random.default_rng(0)
+    price, distance, rating = rng.random((3, 200))
+    points = list(zip(price.tolist(), distance.tolist(), (-rating).tolist()))
+    layers = pareto_layers(price, distance, rating, max_layers=10)
+    assert [sorted(layer) for layer in layers] == [
+        sorted(layer) for layer in brute_force_layers(points, 10)
+    ]
+
+
+def test_empty_input():
+    assert pareto_layers(np.array([]), np.array([])) == []
@@ -0,0 +1,217 @@
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.fake_upstream import OFFERS_PATH, FakeUpstream, FakeUpstreamConfig
+from src.app.get_holiday_offers import holiday_offers_cache_key
+from src.app.prefetch import BudgetedClient, PrefetchScheduler, RequestBudget
+from src.app.resilience import Resilience, UpstreamUnavailableError
+from src.app.upstream_client import UpstreamClient
+from src.models.offer import OfferEngineOptions, OfferOptions
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCache:
+    def __init__(self):
+        self.ages = {}
+
+    def entry_age(self, key):
+        return self.ages.get(key)
+
+
+class FakeUpstreamClient:
+    def __init__(self, attempts: int = 1):
+        # Requests sent per call, as with retries or hedging
+        self.attempts = attempts
+
+    async def get_bytes(self, url, params=None, on_attempt=None):
+        for _ in range(self.attempts):
+            on_attempt()
+        return b""
+
+
+def options(destination: str) -> OfferOptions:
+    return OfferOptions(
+        engine=OfferEngineOptions(
+            when={"flexible": {"start": "01/11/2026", "end": "30/11/2026"}},
+            whereTxt=[destination],
+        )
+    )
+
+
+def make_scheduler(clock, requests_per_fetch=1, attempts=1, **kwargs):
+    fetched = []
+
+    async def fetch(offer_options, client, filter_destination, refresh):
+        assert filter_destination and refresh
+        fetched.append(offer_options.engine.whereTxt[0])
+        for _ in range(requests_per_fetch):
+            await client.get_bytes("http://upstream")
+
+    scheduler = PrefetchScheduler(
+        cache=FakeCache(),
+        client=FakeUpstreamClient(attempts),
+        fetch=fetch,
+        clock=clock,
+        **{"min_hits": 2, "top_n": 10, "budget_per_minute": 60, **kwargs},
+    )
+    return scheduler, fetched
+
+
+def search(scheduler, destination: str, times: int) -> str:
+    for _ in range(times):
+        scheduler.record(options(destination))
+    return holiday_offers_cache_key(options(destination))
+
+
+def test_budget_refills_over_time_up_to_its_size():
+    clock = FakeClock()
+    budget = RequestBudget(60, clock)
+    budget.spend(60)
+    assert budget.available() == 0
+    clock.now += 10
+    assert budget.available() == pytest.approx(10)
+    clock.now += 600
+    assert budget.available() == 60
+
+
+def test_popular_searches_are_ranked_and_filtered_by_hits():
+    scheduler, _ = make_scheduler(FakeClock(), top_n=2)
+    search(scheduler, "Rome", 3)
+    search(scheduler, "Vienna", 5)
+    search(scheduler, "Paris", 1)
+    search(scheduler, "Prague", 2)
+    assert [o.engine.whereTxt[0] for _, o in scheduler.popular()] == [
+        "Vienna",
+        "Rome",
+    ]
+
+
+def test_only_stale_or_missing_entries_are_refreshed():
+    scheduler, fetched = make_scheduler(FakeClock(), refresh_after=180)
+    fresh = search(scheduler, "Rome", 4)
+    stale = search(scheduler, "Vienna", 3)
+    search(scheduler, "Paris", 2)
+    scheduler.cache.ages.update({fresh: 10, stale: 500})
+    assert asyncio.run(scheduler.run_once()) == 2
+    assert fetched == ["Vienna", "Paris"]
+
+
+def test_runs_stop_at_the_budget_and_learn_request_costs():
+    clock = FakeClock()
+    scheduler, fetched = make_scheduler(
+        clock, requests_per_fetch=4, budget_per_minute=10
+    )
+    search(scheduler, "Rome", 8)
+    search(scheduler, "Vienna", 6)
+    search(scheduler, "Paris", 4)
+
+    # Costs are unknown, so a first refresh is assumed to take a full budget
+    asyncio.run(scheduler.run_once())
+    assert fetched == ["Rome"]
+    assert scheduler.budget.available() == 6
+
+    # The 6 requests left cover Rome's learned cost, not Vienna's unknown one
+    fetched.clear()
+    asyncio.run(scheduler.run_once())
+    assert fetched == ["Rome"]
+    assert scheduler.budget.available() == 2
+
+
+def test_retries_and_hedges_are_charged():
+    scheduler, _ = make_scheduler(FakeClock(), requests_per_fetch=2, attempts=3)
+    rome = search(scheduler, "Rome", 2)
+    asyncio.run(scheduler.run_once())
+    assert scheduler.request_costs[rome] == 6
+    assert scheduler.budget.available() == 54
+
+
+def test_failed_fetches_are_not_counted_and_do_not_stop_the_run():
+    scheduler, _ = make_scheduler(FakeClock())
+    search(scheduler, "Rome", 2)
+    search(scheduler, "Vienna", 2)
+
+    async def fail(offer_options, client, **kwargs):
+        await client.get_bytes("http://upstream")
+        if offer_options.engine.whereTxt[0] == "Rome":
+            raise RuntimeError("upstream down")
+
+    scheduler.fetch = fail
+    assert asyncio.run(scheduler.run_once()) == 1
+
+
+def test_popularity_decays_and_forgotten_searches_are_dropped():
+    scheduler, _ = make_scheduler(FakeClock())
+    rome = search(scheduler, "Rome", 2)
+    asyncio.run(scheduler.run_once())
+    assert scheduler.searches[rome][0] == 1
+    for _ in range(4):
+        asyncio.run(scheduler.run_once())
+    assert rome not in scheduler.searches
+    assert rome not in scheduler.request_costs
+
+
+def test_least_popular_searches_are_forgotten_past_max_tracked():
+    scheduler, _ = make_scheduler(FakeClock(), max_tracked=3)
+    search(scheduler, "Rome", 3)
+    search(scheduler, "Vienna", 2)
+    paris = search(scheduler, "Paris", 1)
+    search(scheduler, "Prague", 1)
+    assert paris not in scheduler.searches
+    assert len(scheduler.searches) == 3
+
+
+def test_loop_sleeps_a_jittered_interval_and_survives_errors():
+    delays = []
+    runs = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+        if len(delays) > 3:
+            raise asyncio.CancelledError
+
+    scheduler, _ = make_scheduler(
+        FakeClock(), interval=100, jitter=0.2, sleep=sleep, rand=lambda: 1.0
+    )
+
+    async def run_once():
+        runs.append(len(runs))
+        raise RuntimeError("boom")
+
+    scheduler.run_once = run_once
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(scheduler.run())
+    assert delays == [120, 120, 120, 120]
+    assert len(runs) == 3
+    scheduler.rand = lambda: 0.0
+    assert scheduler.next_delay() == 80
+
+
+def test_budgeted_client_charges_every_attempt_of_the_upstream_client():
+    async def sleep(seconds):
+        pass
+
+    upstream = FakeUpstream(FakeUpstreamConfig(latency_median_ms=0, error_rate=1))
+    upstream_client = UpstreamClient(
+        resilience=Resilience("offers", retries=2, hedge=False, sleep=sleep),
+        transport=httpx.ASGITransport(upstream),
+    )
+    budget = RequestBudget(60, FakeClock())
+    client = BudgetedClient(upstream_client, budget)
+
+    async def fetch():
+        with pytest.raises(UpstreamUnavailableError):
+            await client.get_bytes(f"http://upstream{OFFERS_PATH}")
+        await upstream_client.aclose()
+
+    asyncio.run(fetch())
+    assert client.requests == upstream.requests == 3
+    assert budget.available() == 57
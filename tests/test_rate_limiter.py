@@ -0,0 +1,164 @@
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.middleware.rate_limiter import (
+    MemoryRateLimitStore,
+    RateLimiterMiddleware,
+    RedisRateLimitStore,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+        self.error = None
+        self.delay = 0.0
+
+    async def _check(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+    async def mget(self, *keys):
+        await self._check()
+        return [self.values.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """
+    Applies its queued commands together, like a MULTI, once execute is done
+    """
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.commands = []
+
+    def incr(self, key):
+        self.commands.append(("incr", key))
+        return self
+
+    def expire(self, key, seconds):
+        self.commands.append(("expire", key, seconds))
+        return self
+
+    async def execute(self):
+        await self.redis._check()
+        results = []
+        for command, key, *args in self.commands:
+            if command == "incr":
+                self.redis.values[key] = self.redis.values.get(key, 0) + 1
+                results.append(self.redis.values[key])
+            else:
+                self.redis.expiries[key] = args[0]
+                results.append(True)
+        return results
+
+
+def hits(store, count: int, key: str = "1.2.3.4", calls: int = 3, period: int = 60):
+    async def run():
+        return [await store.hit(key, calls, period) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_limit_is_enforced_within_a_window():
+    clock = FakeClock()
+    results = hits(MemoryRateLimitStore(clock=clock), 4)
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[-1][1] > 0
+
+
+def test_previous_window_decays_and_retry_after_is_honoured():
+    clock = FakeClock(60 * 1000)
+    store = MemoryRateLimitStore(clock=clock)
+    hits(store, 3)
+    # Half way through the next window, 3 * 0.5 = 1.5 requests are still counted
+    clock.now += 90
+    assert [allowed for allowed, _ in hits(store, 3)] == [True, True, False]
+    _, retry_after = hits(store, 1)[0]
+    clock.now += retry_after + 1e-6
+    assert hits(store, 1)[0][0]
+
+
+def test_clients_are_counted_separately_and_idle_ones_evicted():
+    clock = FakeClock(60 * 1000)
+    store = MemoryRateLimitStore(cleanup_interval=60, clock=clock)
+    hits(store, 3, key="a")
+    assert hits(store, 1, key="b")[0][0]
+    clock.now += 180
+    hits(store, 1, key="b")
+    assert set(store.clients) == {"b"}
+
+
+def test_redis_store_matches_the_memory_store():
+    clock = FakeClock(60 * 1000 + 30)
+    memory = MemoryRateLimitStore(clock=clock)
+    redis = RedisRateLimitStore(FakeRedis(), clock=clock)
+    for step in [0, 10, 25, 40, 61, 5]:
+        clock.now += step
+        assert hits(redis, 2) == hits(memory, 2)
+
+
+def test_redis_errors_fall_back_to_counting_per_process(capsys):
+    client = FakeRedis()
+    store = RedisRateLimitStore(client, clock=FakeClock())
+    client.error = ConnectionError("connection refused")
+    assert [allowed for allowed, _ in hits(store, 4)] == [True, True, True, False]
+    assert store.failing
+    assert capsys.readouterr().out.count("unavailable") == 1
+
+    client.error = None
+    assert hits(store, 1)[0][0]
+    assert not store.failing
+
+
+def test_slow_redis_times_out_to_the_fallback():
+    client = FakeRedis()
+    client.delay = 1.0
+    store = RedisRateLimitStore(client, clock=FakeClock(), timeout=0.01)
+    assert hits(store, 1)[0][0]
+    assert store.failing
+
+
+def test_redis_counters_always_expire():
+    client = FakeRedis()
+    store = RedisRateLimitStore(client, clock=FakeClock(60 * 1000), timeout=0.05)
+    hits(store, 2)
+    # Slow enough for the read, too slow for the read and the count together
+    client.delay = 0.03
+    hits(store, 1)
+    assert store.failing
+    assert client.values and set(client.values) == set(client.expiries)
+    assert set(client.expiries.values()) == {120}
+
+
+def test_middleware_answers_429_with_retry_after():
+    app = Starlette(routes=[Route("/", lambda request: PlainTextResponse("ok"))])
+    app.add_middleware(RateLimiterMiddleware, calls=2, period=60)
+    client = TestClient(app)
+    statuses = [client.get("/").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+    assert int(client.get("/").headers["Retry-After"]) >= 1
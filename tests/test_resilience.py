@@ -0,0 +1,205 @@
+import asyncio
+
+import pytest
+
+from src.app.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Resilience,
+    UpstreamUnavailableError,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TransientError(Exception):
+    pass
+
+
+class NotFoundError(Exception):
+    pass
+
+
+def make_resilience(clock, sleeps=None, **kwargs) -> Resilience:
+    async def sleep(seconds):
+        if sleeps is not None:
+            sleeps.append(seconds)
+
+    options = {
+        "retries": 2,
+        "hedge": False,
+        "failure_threshold": 3,
+        "reset_timeout": 10,
+        "is_retryable": lambda error: isinstance(error, TransientError),
+        "clock": clock,
+        "sleep": sleep,
+        "rand": lambda: 1.0,
+        **kwargs,
+    }
+    return Resilience("test", **options)
+
+
+def failing(calls: list, error: Exception):
+    async def attempt():
+        calls.append(error)
+        raise error
+
+    return attempt
+
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    clock.now = 4
+    assert breaker.retry_after() == 6
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed probe opens the breaker for another reset_timeout
+    breaker.record_failure()
+    clock.now = 15
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_probe_that_never_reports_back_expires():
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+
+    clock.now = 19
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_exhausted_retries_raise_upstream_unavailable():
+    sleeps = []
+    resilience = make_resilience(FakeClock(), sleeps)
+    calls = []
+    error = TransientError("GET https://upstream.example/offers failed")
+
+    with pytest.raises(UpstreamUnavailableError) as raised:
+        asyncio.run(resilience.call(failing(calls, error)))
+
+    assert len(calls) == 3
+    assert sleeps == [0.1, 0.2]
+    assert raised.value.__cause__ is error
+    assert "upstream.example" not in str(raised.value)
+    assert raised.value.retry_after >= 1
+
+
+def test_errors_that_are_not_retryable_are_raised_at_once():
+    resilience = make_resilience(FakeClock())
+    calls = []
+
+    with pytest.raises(NotFoundError):
+        asyncio.run(resilience.call(failing(calls, NotFoundError())))
+
+    assert len(calls) == 1
+    assert resilience.breaker.failures == 0
+
+
+def test_open_breaker_fails_fast_without_calling():
+    clock = FakeClock()
+    resilience = make_resilience(clock, retries=0)
+    calls = []
+    for _ in range(3):
+        with pytest.raises(UpstreamUnavailableError):
+            asyncio.run(resilience.call(failing(calls, TransientError())))
+
+    with pytest.raises(CircuitOpenError) as raised:
+        asyncio.run(resilience.call(failing(calls, TransientError())))
+    assert len(calls) == 3
+    assert raised.value.retry_after == 10
+
+    async def succeed():
+        return "ok"
+
+    clock.now = 10
+    assert asyncio.run(resilience.call(succeed)) == "ok"
+    assert resilience.breaker.state == "closed"
+
+
+def test_hedging_waits_for_enough_latencies():
+    # The fake clock measures every latency as 0, so any attempt is slow
+    resilience = make_resilience(FakeClock(), hedge=True)
+    attempts = []
+
+    async def attempt():
+        attempts.append(None)
+        await asyncio.sleep(0.01)
+        return len(attempts)
+
+    for _ in range(resilience.latencies.min_samples):
+        asyncio.run(resilience.call(attempt))
+    assert len(attempts) == resilience.latencies.min_samples
+    assert resilience.hedges == 0
+
+    asyncio.run(resilience.call(attempt))
+    assert resilience.hedges == 1
+    assert len(attempts) == resilience.latencies.min_samples + 2
+
+
+def test_hedges_are_capped_to_a_fraction_of_calls():
+    resilience = make_resilience(FakeClock(), hedge=True, hedge_max_ratio=0.1)
+    for _ in range(resilience.latencies.min_samples):
+        resilience.latencies.add(0.0)
+
+    async def attempt():
+        await asyncio.sleep(0.01)
+
+    for _ in range(20):
+        asyncio.run(resilience.call(attempt))
+    assert resilience.calls == 20
+    assert resilience.hedges == 2
+
+    # Calls that are not idempotent are never hedged
+    resilience.hedges = 0
+    asyncio.run(resilience.call(attempt, idempotent=False))
+    assert resilience.hedges == 0
+
+
+def test_unavailable_upstream_answers_503_without_its_url(api, fake_upstream):
+    fake_upstream.config.error_rate = 1
+    response = api.get(
+        "/api/offers",
+        params={
+            "where-txt": "Vienna",
+            "start-date": "01/11/2026",
+            "end-date": "30/11/2026",
+        },
+    )
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "http" not in response.json()["detail"]
@@ -0,0 +1,102 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.app import response_encoding
+from src.app.response_encoding import (
+    MIN_COMPRESS_SIZE,
+    encode_json,
+    json_response,
+    negotiate_encoding,
+)
+
+LARGE = [{"name": f"Hotel {i}", "price": i} for i in range(200)]
+SMALL = [{"name": "Hotel", "price": 1}]
+
+
+def make_client() -> TestClient:
+    async def large(request):
+        return json_response(request, LARGE)
+
+    async def small(request):
+        return json_response(request, SMALL)
+
+    return TestClient(
+        Starlette(routes=[Route("/large", large), Route("/small", small)])
+    )
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, with_brotli, expected",
+    [
+        (None, True, None),
+        ("gzip, deflate", True, "gzip"),
+        ("gzip, br", True, "br"),
+        ("gzip, br", False, "gzip"),
+        ("br;q=0.5, gzip;q=0.8", True, "gzip"),
+        ("gzip;q=0", True, None),
+        ("*", True, "br"),
+        ("identity", True, None),
+    ],
+)
+def test_encoding_is_negotiated(monkeypatch, accept_encoding, with_brotli, expected):
+    monkeypatch.setattr(response_encoding, "brotli", object() if with_brotli else None)
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_large_body_is_gzipped_and_varies_by_encoding():
+    assert len(encode_json(LARGE)) >= MIN_COMPRESS_SIZE
+    with make_client() as client:
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    # httpx decodes the body, which is only smaller on the wire
+    assert response.json() == LARGE
+    assert int(response.headers["Content-Length"]) < len(encode_json(LARGE))
+
+
+def test_large_body_is_brotli_compressed_when_available():
+    pytest.importorskip("brotli")
+    with make_client() as client:
+        response = client.get("/large", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.json() == LARGE
+
+
+def test_small_body_is_not_compressed():
+    with make_client() as client:
+        response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.json() == SMALL
+
+
+def test_matching_etag_answers_304():
+    with make_client() as client:
+        first = client.get("/large", headers={"Accept-Encoding": "gzip"})
+        etag = first.headers["ETag"]
+        assert etag.endswith('-gzip"')
+
+        again = client.get(
+            "/large", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}
+        )
+        assert again.status_code == 304
+        assert again.content == b""
+        assert again.headers["ETag"] == etag
+
+        # The uncompressed representation's ETag matches too, weak or not
+        plain = client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "Content-Encoding" not in plain.headers
+        weak = client.get(
+            "/large",
+            headers={
+                "Accept-Encoding": "gzip",
+                "If-None-Match": f"W/{plain.headers['ETag']}",
+            },
+        )
+        assert weak.status_code == 304
+
+        changed = client.get("/large", headers={"If-None-Match": '"other"'})
+        assert changed.status_code == 200